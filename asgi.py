@@ -0,0 +1,20 @@
+# asgi.py
+# Async serving mode: uvicorn asgi:application --host 0.0.0.0 --port 5000
+from manage import app
+from models.db import init_db
+from routers.async_routes import create_asgi_app
+from services.sensor_worker import start_sensor_worker
+from services.binary_ingest import start_binary_listener
+from services.mqtt_bridge import start_mqtt_bridge
+
+init_db()
+
+# Start the worker HERE, because uvicorn does not execute the main in manage.py
+# (with --workers N, the Redis leader election picks one process to run it)
+print("🚀 Starting Sensor Worker for ASGI mode...")
+start_sensor_worker()
+start_binary_listener() # Every worker binds the UDP port (SO_REUSEPORT) if BINARY_INGEST_PORT is set
+start_mqtt_bridge() # Every worker joins one shared subscription if MQTT_HOST is set
+
+# SSE + ingest on the event loop, every other Flask route unchanged
+application = create_asgi_app(app)
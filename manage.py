@@ -12,9 +12,12 @@ from models.db import init_db
 from routers.stream import stream_routes
 from routers.api import api_routes
 from routers.index import home_page
+from routers.metrics import metrics_routes
 
 # Import Sensor Worker
 from services.sensor_worker import start_sensor_worker
+from services.binary_ingest import start_binary_listener
+from services.mqtt_bridge import start_mqtt_bridge
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = getenv('SECRET_KEY', 'dev_key')
@@ -22,6 +25,21 @@ app.config['SECRET_KEY'] = getenv('SECRET_KEY', 'dev_key')
 app.register_blueprint(home_page)
 app.register_blueprint(api_routes)
 app.register_blueprint(stream_routes)
+app.register_blueprint(metrics_routes)
+
+@app.cli.command("backfill-rollups")
+def backfill_rollups():
+    """Rebuild the hourly/daily rollup tables from sensor_readings."""
+    from models.db import SessionLocal
+    from services.rollups import backfill
+
+    init_db()
+    session = SessionLocal()
+    try:
+        totals = backfill(session)
+        print(f"✅ Rollups rebuilt: {totals['hour']} hourly, {totals['day']} daily buckets.")
+    finally:
+        session.close()
 
 if __name__ == '__main__':
     # Initialize SQLite DB
@@ -42,6 +60,8 @@ if __name__ == '__main__':
 
     # START THE WORKER IN THE BACKGROUND
     start_sensor_worker()
+    start_binary_listener() # UDP binary frames, if BINARY_INGEST_PORT is set
+    start_mqtt_bridge() # sensors/<token> on the broker, if MQTT_HOST is set
     
     print("🚀 Web Server starting at http://127.0.0.1:5000")
     
@@ -0,0 +1,35 @@
+import redis.asyncio as aioredis
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy import event
+from models.db import DATABASE_URL, REDIS_HOST, REDIS_PORT, REDIS_DB, engine_options, is_sqlite, apply_sqlite_pragmas
+
+# Async clients for the ASGI serving mode (asgi.py).
+# Imported only there, so the Flask/Gunicorn path doesn't need the async drivers.
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+def to_async_url(url):
+    """sqlite:///x.db -> sqlite+aiosqlite:///x.db, postgresql://... -> postgresql+asyncpg://..."""
+    scheme, sep, rest = url.partition("://")
+    dialect = scheme.split("+")[0]
+    return f"{ASYNC_DRIVERS.get(dialect, scheme)}{sep}{rest}"
+
+ASYNC_DATABASE_URL = to_async_url(DATABASE_URL)
+
+def _async_engine_options(url):
+    options = engine_options(url)
+    if is_sqlite(url):
+        options["connect_args"].pop("check_same_thread", None) # aiosqlite runs each connection on its own thread
+    return options
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_async_engine_options(DATABASE_URL))
+if is_sqlite(DATABASE_URL):
+    event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+# Connects lazily on first command, inside the server's event loop
+async_redis_client = aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=True)
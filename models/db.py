@@ -1,8 +1,9 @@
 import os
 import redis
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker
 from models.sql_models import Base
+from models.partitions import READINGS_TABLE, create_partitioned_readings
 
 # Redis Configuration
 REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
@@ -17,17 +18,95 @@ except Exception as e:
     redis_client = None
     print(f"❌ Error connecting to Redis: {e}")
 
-# SQLite Configuration
-DB_PATH = "sensors.db"
-DATABASE_URL = f"sqlite:///{DB_PATH}"
+# Database Configuration
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///sensors.db')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5)) # Persistent connections per process
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10)) # Extra connections allowed under bursts
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800)) # Seconds before a connection is replaced
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30)) # Seconds to wait for a free connection
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# SQLite tuning (applied on every new connection)
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000)) # Wait for locks instead of "database is locked"
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)) # Bytes of the DB file read through mmap
+
+def is_sqlite(url):
+    return url.startswith("sqlite")
+
+def _is_memory_sqlite(url):
+    return url in ("sqlite://", "sqlite:///:memory:") or ":memory:" in url
+
+def engine_options(url):
+    """create_engine() keyword arguments for the configured pool and dialect."""
+    if is_sqlite(url):
+        options = {"connect_args": {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}}
+        if _is_memory_sqlite(url):
+            return options # Single shared connection; pool settings don't apply
+    else:
+        options = {"pool_pre_ping": True} # Drop connections the server closed (idle timeouts, restarts)
+    options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_timeout=DB_POOL_TIMEOUT
+    )
+    return options
+
+def apply_sqlite_pragmas(dbapi_conn, connection_record=None):
+    """
+    WAL lets history reads run while the worker writes; NORMAL sync is safe
+    with WAL (only the last transactions can be lost on power failure).
+    """
+    cursor = dbapi_conn.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    finally:
+        cursor.close()
+
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+if is_sqlite(DATABASE_URL):
+    event.listen(engine, "connect", apply_sqlite_pragmas)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def migrate_indexes():
+    """
+    create_all() skips tables that already exist, so indexes added to the models
+    later never reach older sensors.db files. Create the missing ones here.
+    """
+    created = []
+    for table in Base.metadata.sorted_tables:
+        existing = {ix["name"] for ix in inspect(engine).get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine)
+                created.append(index.name)
+    if created:
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE")) # Refresh planner statistics for the new indexes
+        print(f"🗂️ Created indexes: {', '.join(created)}")
+    return created
+
+def create_tables():
+    """
+    create_all(), except that on a new PostgreSQL database sensor_readings is
+    created natively partitioned by month (see models/partitions.py).
+    """
+    readings = Base.metadata.tables[READINGS_TABLE]
+    if engine.dialect.name != "postgresql" or inspect(engine).has_table(READINGS_TABLE):
+        Base.metadata.create_all(bind=engine)
+        return
+    Base.metadata.create_all(bind=engine, tables=[t for t in Base.metadata.sorted_tables if t is not readings])
+    with engine.begin() as conn:
+        create_partitioned_readings(conn)
+    print("🗂️ sensor_readings created with monthly partitions.")
+
 def init_db():
     """Create tables if they don't exist"""
     try:
-        Base.metadata.create_all(bind=engine)
-        print("✅ SQLite tables created/verified.")
+        create_tables()
+        migrate_indexes()
+        print(f"✅ {engine.dialect.name} tables created/verified.")
     except Exception as e:
-        print(f"❌ Error initializing SQLite: {e}")
+        print(f"❌ Error initializing database: {e}")
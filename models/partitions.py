@@ -0,0 +1,139 @@
+import threading
+from datetime import datetime
+from sqlalchemy import text
+
+# Native monthly partitions for sensor_readings (PostgreSQL only).
+# New PostgreSQL databases get a RANGE-partitioned table; existing plain
+# tables are left alone and retention falls back to batched deletes.
+
+READINGS_TABLE = "sensor_readings"
+
+CREATE_PARTITIONED_READINGS = f"""
+CREATE TABLE IF NOT EXISTS {READINGS_TABLE} (
+    id BIGSERIAL,
+    sensor_id INTEGER NOT NULL REFERENCES sensors (id),
+    timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    temperature DOUBLE PRECISION,
+    humidity DOUBLE PRECISION,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp)
+"""
+
+_known = set() # Partition names known to exist (per process; current and future months only)
+_known_lock = threading.Lock()
+_partitioned = None # Cached is_partitioned() result
+
+def month_start(ts):
+    return datetime(ts.year, ts.month, 1)
+
+def next_month(ts):
+    return datetime(ts.year + ts.month // 12, ts.month % 12 + 1, 1)
+
+def partition_name(month):
+    return f"{READINGS_TABLE}_{month.year}{month.month:02d}"
+
+def partition_month(name):
+    """'sensor_readings_202501' -> datetime(2025, 1, 1), None for anything else."""
+    suffix = name[len(READINGS_TABLE) + 1:]
+    if not name.startswith(READINGS_TABLE + "_") or len(suffix) != 6 or not suffix.isdigit():
+        return None
+    return datetime(int(suffix[:4]), int(suffix[4:]), 1)
+
+def is_partitioned(conn):
+    if conn.dialect.name != "postgresql":
+        return False
+    return conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :name"
+    ), {"name": READINGS_TABLE}).first() is not None
+
+def readings_partitioned(conn):
+    """is_partitioned(), checked once per process."""
+    global _partitioned
+    if _partitioned is None:
+        _partitioned = is_partitioned(conn)
+    return _partitioned
+
+def forget_partitions():
+    """Drop the known-partitions cache (a transaction that created one rolled back)."""
+    with _known_lock:
+        _known.clear()
+
+def list_partitions(conn):
+    rows = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :name"
+    ), {"name": READINGS_TABLE})
+    return [name for (name,) in rows]
+
+def create_partitioned_readings(conn):
+    """Create sensor_readings as a partitioned table (PostgreSQL, table must not exist yet)."""
+    conn.execute(text(CREATE_PARTITIONED_READINGS))
+    now = datetime.now()
+    ensure_partitions(conn, [now, next_month(now)])
+
+def ensure_partitions(conn, timestamps, now=None):
+    """
+    Create the monthly partitions covering `timestamps` if they don't exist yet.
+    Past months are checked every time: retention in another process may have
+    dropped them since (late uploads land there), so they are never cached.
+    """
+    current = month_start(now or datetime.now())
+    months = {month_start(ts) for ts in timestamps}
+    with _known_lock:
+        missing = [m for m in months if m < current or partition_name(m) not in _known]
+    for month in sorted(missing):
+        name = partition_name(month)
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {READINGS_TABLE} "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{next_month(month):%Y-%m-%d}')"
+        ))
+        if month >= current: # Retention never drops the current month
+            with _known_lock:
+                _known.add(name)
+
+def _count(conn, name):
+    return conn.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+
+def drop_partitions_before(engine, cutoff, can_drop=None):
+    """
+    Drop every monthly partition that ends on or before `cutoff` (and that
+    `can_drop(month)` allows, if given). Returns the dropped names.
+
+    DROP TABLE on a partition locks the whole sensor_readings table (ACCESS
+    EXCLUSIVE) and stalls ingest, so each partition is first detached with
+    DETACH PARTITION ... CONCURRENTLY (PostgreSQL 14+), which needs its own
+    autocommit connection and no other open transaction of ours on the table.
+    Only the detached table is then dropped. If rows arrived while detaching,
+    the partition is attached again and waits for the next run.
+    """
+    dropped = []
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # A detach interrupted by a crash leaves the partition "detach pending"
+        for (name,) in conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :name AND i.inhdetachpending"
+        ), {"name": READINGS_TABLE}):
+            conn.execute(text(f"ALTER TABLE {READINGS_TABLE} DETACH PARTITION {name} FINALIZE"))
+
+        for name in list_partitions(conn):
+            month = partition_month(name)
+            if not month or next_month(month) > cutoff:
+                continue
+            rows = _count(conn, name)
+            if can_drop is not None and not can_drop(month):
+                continue
+            conn.execute(text(f"ALTER TABLE {READINGS_TABLE} DETACH PARTITION {name} CONCURRENTLY"))
+            if _count(conn, name) != rows:
+                # A late upload landed after the check: keep it (ATTACH doesn't block writers either)
+                conn.execute(text(
+                    f"ALTER TABLE {READINGS_TABLE} ATTACH PARTITION {name} "
+                    f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{next_month(month):%Y-%m-%d}')"
+                ))
+                continue
+            conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            dropped.append(name)
+    with _known_lock:
+        _known.difference_update(dropped)
+    return dropped
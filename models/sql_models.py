@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Float, String, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, Float, String, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime
 
@@ -17,6 +17,8 @@ class Sensor(Base):
     created_at = Column(DateTime, default=datetime.now)
 
     readings = relationship("SensorReading", back_populates="sensor", cascade="all, delete-orphan")
+    hourly_rollups = relationship("SensorReadingHourly", cascade="all, delete-orphan")
+    daily_rollups = relationship("SensorReadingDaily", cascade="all, delete-orphan")
 
     def to_dict(self):
         return {
@@ -41,15 +43,87 @@ class SensorReading(Base):
 
     sensor = relationship("Sensor", back_populates="readings")
 
-    def to_dict(self):
+    __table_args__ = (
+        # Every history query filters on sensor_id + a time range and orders by timestamp
+        Index('ix_sensor_readings_sensor_id_timestamp', 'sensor_id', 'timestamp'),
+        # All-sensor ranges (no sensor_id filter)
+        Index('ix_sensor_readings_timestamp', 'timestamp'),
+    )
+
+    def to_dict(self, sensor_name=None):
+        """Pass `sensor_name` when it was fetched with the row, to avoid lazy-loading `sensor`."""
+        if sensor_name is None:
+            sensor_name = self.sensor.name if self.sensor else "Unknown"
         return {
             "timestamp": self.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
             "temperature": self.temperature,
             "humidity": self.humidity,
             "sensor_id": self.sensor_id,
-            "sensor_name": self.sensor.name if self.sensor else "Unknown"
+            "sensor_name": sensor_name
+        }
+
+class RollupMixin:
+    """
+    Incremental aggregate of sensor_readings per sensor per time bucket.
+    Sums (not averages) are stored so new readings can be folded in without rescanning.
+    """
+    sensor_id = Column(Integer, ForeignKey('sensors.id'), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    temp_count = Column(Integer, nullable=False, default=0)
+    temp_sum = Column(Float, nullable=False, default=0.0)
+    temp_sumsq = Column(Float, nullable=False, default=0.0)
+    temp_min = Column(Float, nullable=True)
+    temp_max = Column(Float, nullable=True)
+    hum_count = Column(Integer, nullable=False, default=0)
+    hum_sum = Column(Float, nullable=False, default=0.0)
+    hum_sumsq = Column(Float, nullable=False, default=0.0)
+    hum_min = Column(Float, nullable=True)
+    hum_max = Column(Float, nullable=True)
+
+    @staticmethod
+    def _avg_std(n, total, sumsq):
+        if not n:
+            return None, None
+        mean = total / n
+        variance = max(0.0, sumsq / n - mean * mean) # Population SD, same as the dashboard
+        return round(mean, 2), round(variance ** 0.5, 3)
+
+    def to_dict(self, sensor_name=None):
+        temp_avg, temp_std = self._avg_std(self.temp_count, self.temp_sum, self.temp_sumsq)
+        hum_avg, hum_std = self._avg_std(self.hum_count, self.hum_sum, self.hum_sumsq)
+        return {
+            "timestamp": self.bucket_start.strftime("%Y-%m-%d %H:%M:%S"),
+            "sensor_id": self.sensor_id,
+            "sensor_name": sensor_name or "Unknown",
+            "temperature": temp_avg,
+            "temp_min": self.temp_min,
+            "temp_max": self.temp_max,
+            "temp_std": temp_std,
+            "humidity": hum_avg,
+            "hum_min": self.hum_min,
+            "hum_max": self.hum_max,
+            "hum_std": hum_std,
+            "count": self.count
         }
 
+class SensorReadingHourly(RollupMixin, Base):
+    __tablename__ = 'sensor_readings_hourly'
+
+class SensorReadingDaily(RollupMixin, Base):
+    __tablename__ = 'sensor_readings_daily'
+
+class PersistedEntry(Base):
+    """
+    Raw stream entries already written to sensor_readings (same transaction).
+    A replay after a crash between the commit and XACK finds them here and is skipped.
+    """
+    __tablename__ = 'persisted_entries'
+
+    stream = Column(String, primary_key=True) # sensors:raw:<sensor_id>
+    entry_id = Column(String, primary_key=True) # Redis stream id "<ms>-<seq>"
+    persisted_at = Column(DateTime, nullable=False, default=datetime.now, index=True)
+
 class SystemConfig(Base):
     __tablename__ = 'system_config'
 
@@ -1,11 +1,26 @@
-from flask import Blueprint, request, jsonify
-from datetime import datetime, timedelta
-from models.db import redis_client, SessionLocal
+from flask import Blueprint, Response, request, jsonify
+from datetime import datetime, timedelta, timezone
+from models.db import SessionLocal, redis_client
 from models.sql_models import SensorReading, Sensor, SystemConfig
+from services.token_cache import resolve_token, cache_sensor, invalidate_token, get_stats as get_token_cache_stats
+from services.ingest import parse_batch, collect_tokens, build_sensor_data
+from services.publisher import publish_updates, publish_config, raw_stream_key, RAW_STREAM_INDEX
+from services.history import BUCKETS, MAX_POINTS_LIMIT, aggregate_history, downsample_history, downsample_rows
+from services.rollups import rollups_ready, choose_period, rollup_history
+from services.export import history_page, iter_readings, csv_chunks, ndjson_chunks, encode_cursor, decode_cursor
+from services.retention import rollup_cutoff
+from services.archive import hot_cutoff, archive_rows, archive_buckets
+from services.analytics import get_analytics
+from services.forecast import get_forecast, FORECAST_METHOD, FORECAST_METHODS, FORECAST_MAX_POINTS
+from services.weather import fetch_weather, mark_published
+from services.read_cache import (
+    SENSORS, CONFIG, READ_CACHE_TTL, bump, sensors_entry, config_entry, weather_sensors,
+    is_closed, history_key, get_history, put_history
+)
+from services.metrics import IngestTrace, HISTORY_SECONDS, HISTORY_ROWS
 from sqlalchemy import desc
 from os import getenv
-import json
-import requests
+import time
 import uuid
 
 api_routes = Blueprint('api', __name__, url_prefix='/api')
@@ -17,6 +32,21 @@ ADMIN_PASSWORD = getenv('ADMIN_PASSWORD', 'admin123') # Default fallback
 def get_db():
     return SessionLocal()
 
+def _cached_json(entry, max_age=None):
+    """
+    JSON response for a read-cache entry with ETag/Last-Modified (304 when the
+    client's copy is current). Without max_age the client must revalidate every time.
+    """
+    response = Response(entry["body"], mimetype="application/json")
+    response.set_etag(entry["etag"])
+    response.last_modified = datetime.fromtimestamp(entry["modified"], timezone.utc)
+    if max_age:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
 # --- AUTH ---
 @api_routes.route('/config/auth', methods=['POST'])
 def check_auth():
@@ -30,10 +60,8 @@ def check_auth():
 def get_system_config():
     session = get_db()
     try:
-        configs = session.query(SystemConfig).all()
-        # Convert to key-value dict for easier frontend consumption
-        result = {c.key: c.value for c in configs}
-        return jsonify(result), 200
+        # Key-value dict for easier frontend consumption, from the read cache
+        return _cached_json(config_entry(session))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     finally:
@@ -57,6 +85,11 @@ def update_system_config():
                 session.add(config)
         
         session.commit()
+        bump(CONFIG)
+        try:
+            publish_config({key: str(value) for key, value in data.items()}) # The worker reschedules from this
+        except Exception as e:
+            print(f"⚠️ Config saved but not announced: {e}")
         return jsonify({"success": True}), 200
     except Exception as e:
         session.rollback()
@@ -69,8 +102,7 @@ def update_system_config():
 def get_sensors():
     session = get_db()
     try:
-        sensors = session.query(Sensor).filter_by(active=True).all()
-        return jsonify([s.to_dict() for s in sensors]), 200
+        return _cached_json(sensors_entry(session))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     finally:
@@ -101,6 +133,9 @@ def create_sensor():
 
         session.add(new_sensor)
         session.commit()
+        bump(SENSORS)
+        if new_sensor.type == 'esp32':
+            cache_sensor(new_sensor)
         return jsonify(new_sensor.to_dict()), 201
     except Exception as e:
         session.rollback()
@@ -116,10 +151,18 @@ def delete_sensor(sensor_id):
         if not sensor:
             return jsonify({"error": "Sensor not found"}), 404
         
+        token = sensor.token
         sensor.active = False # Soft delete
         # Or session.delete(sensor) for hard delete
         session.delete(sensor) # Let's do hard delete for now to keep it clean
         session.commit()
+        bump(SENSORS)
+        invalidate_token(token)
+        if redis_client:
+            # Unpersisted raw readings of a deleted sensor have nowhere to go
+            key = raw_stream_key(sensor_id)
+            redis_client.delete(key)
+            redis_client.srem(RAW_STREAM_INDEX, key)
         return jsonify({"success": True}), 200
     except Exception as e:
         session.rollback()
@@ -138,42 +181,63 @@ def ingest_data(token):
     if not payload:
         return jsonify({"error": "Invalid payload"}), 400
     
-    # 1. Validate Token via Redis (Cache) or DB
-    # We can cache active tokens in Redis to avoid DB hits on every request
-    
-    session = get_db()
+    trace = IngestTrace()
+    # 1. Validate Token (LRU -> Redis -> DB, see services/token_cache.py)
     try:
-        # Check if sensor exists
-        # Optimization: storing token->id mapping in Redis would be better
-        sensor = session.query(Sensor).filter_by(token=token, type='esp32').first()
+        sensor = resolve_token(token)
+        trace.token = trace.lap()
         if not sensor:
             return jsonify({"error": "Invalid Token"}), 403
             
         sensor_data = {
             "temperature": payload.get("temperature"),
             "humidity": payload.get("humidity"),
-            "sensor_id": sensor.id,
-            "sensor_name": sensor.name
+            "sensor_id": sensor["id"],
+            "sensor_name": sensor["name"]
         }
 
-        # 2. Save to Redis Current State (for Live View)
-        if redis_client:
-            redis_client.hset("sensors:current", str(sensor.id), json.dumps(sensor_data))
-            
-            # 3. Publish to Stream
-            update_msg = {
-                "sensor_id": sensor.id,
-                "data": sensor_data,
-                "server_time": datetime.now().strftime("%H:%M:%S")
-            }
-            redis_client.publish("sensors:stream", json.dumps(update_msg))
+        # 2. Save Current State + Publish to Stream (one round trip)
+        publish_updates([sensor_data], trace=trace)
+        trace.record(1)
             
         return jsonify({"success": True}), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        session.close()
+
+@api_routes.route('/ingest/batch', methods=['POST'])
+def ingest_batch():
+    """
+    Bulk ingest for buffered uploads (one device or many).
+    Payload: {"token": "key_...", "readings": [{"timestamp": 1700000000, "temperature": 22.5, "humidity": 60.0}, ...]}
+    Each reading may carry its own "token" to mix devices in one request.
+    """
+    trace = IngestTrace()
+    payload = request.get_json(silent=True)
+    try:
+        sensors = {token: resolve_token(token) for token in collect_tokens(payload)}
+        trace.token = trace.lap()
+        accepted, rejected = parse_batch(payload, sensors.get)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e: # DB/Redis down during token lookup: still answer the device in JSON
+        return jsonify({"error": str(e)}), 500
+
+    if not accepted:
+        return jsonify({"success": False, "accepted": 0, "rejected": rejected}), 400
+
+    try:
+        publish_updates([build_sensor_data(sensor, reading) for sensor, reading in accepted], trace=trace)
+        trace.record(len(accepted))
+        return jsonify({"success": True, "accepted": len(accepted), "rejected": rejected}), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@api_routes.route('/cache/tokens', methods=['GET'])
+def token_cache_stats():
+    """Hit/miss counters of the ingest token cache (per process)."""
+    return jsonify(get_token_cache_stats()), 200
 
 @api_routes.route('/weather/scan', methods=['POST'])
 def scan_weather_sensors():
@@ -184,81 +248,271 @@ def scan_weather_sensors():
         return jsonify({"error": "No API Key configured"}), 500
 
     session = get_db()
-    sensors = session.query(Sensor).filter_by(type='openweather', active=True).all()
-    results = []
-    
-    for s in sensors:
-        try:
-            url = f"https://api.openweathermap.org/data/2.5/weather?lat={s.lat}&lon={s.lon}&APPID={OPENWEATHER_API_KEY}"
-            resp = requests.get(url, timeout=5)
-            if resp.status_code == 200:
-                data = resp.json()
-                weather_data = {
-                    "temperature": data['main']['temp'] - 273.15,
-                    "humidity": data['main']['humidity'],
-                    "sensor_id": s.id,
-                    "sensor_name": s.name
-                }
-                
-                # Update Redis
-                if redis_client:
-                    redis_client.hset("sensors:current", str(s.id), json.dumps(weather_data))
-                    update_msg = {
-                        "sensor_id": s.id,
-                        "data": weather_data,
-                        "server_time": datetime.now().strftime("%H:%M:%S")
-                    }
-                    redis_client.publish("sensors:stream", json.dumps(update_msg))
-                
-                results.append({"id": s.id, "status": "ok"})
-        except Exception as e:
-            results.append({"id": s.id, "error": str(e)})
-            
-    session.close()
+    try:
+        sensors = weather_sensors(session)
+    finally:
+        session.close()
+
+    # Same fetcher as the worker: concurrent, one request per location, cached
+    updates, results = fetch_weather(sensors, OPENWEATHER_API_KEY)
+
+    # Update Redis (all sensors in one round trip)
+    try:
+        publish_updates(updates)
+        mark_published(updates)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
     return jsonify(results), 200
 
 
+def _parse_history_range():
+    """start/end ("%Y-%m-%d %H:%M:%S") or the last `hours` (default 1). Raises ValueError."""
+    start_param = request.args.get('start')
+    end_param = request.args.get('end')
+    hours_param = request.args.get('hours', default=1, type=int)
+
+    if start_param and end_param:
+        start_dt = datetime.strptime(start_param, "%Y-%m-%d %H:%M:%S")
+        end_dt = datetime.strptime(end_param, "%Y-%m-%d %H:%M:%S")
+        return start_dt, end_dt
+
+    now = datetime.now()
+    return now - timedelta(hours=hours_param), now
+
+def _history_response(payload, started):
+    """jsonify() a history payload and record its duration and row count by source."""
+    HISTORY_SECONDS.labels(payload["source"]).observe(time.perf_counter() - started)
+    HISTORY_ROWS.labels(payload["source"]).observe(payload["count"])
+    return jsonify(payload)
+
+def _closed_history_key():
+    """Read-cache key when the request is an explicit start/end window that has closed."""
+    if not (request.args.get('start') and request.args.get('end')):
+        return None
+    try:
+        _, end_dt = _parse_history_range()
+        if not is_closed(end_dt):
+            return None
+        return history_key(request.args.to_dict())
+    except Exception:
+        return None
+
 @api_routes.route('/history')
 def get_sensor_history():
-    """Get history for a specific sensor or all"""
+    """
+    Get history for a specific sensor or all.
+    ?bucket=1m|5m|15m|1h|6h|1d -> min/max/avg/count per sensor per bucket (SQL GROUP BY)
+    ?max_points=N -> at most N representative points per sensor (LTTB)
+    Otherwise raw readings, 2000 rows per page; pass "next_cursor" back as ?cursor= for the next one.
+    Large ranges (and 1h/1d buckets) are served from the hourly/daily rollup tables,
+    and data older than the raw retention window from the Parquet archive;
+    "source" in the response says which store answered.
+    Explicit start/end windows that have closed are cached under immutable
+    keys (services/read_cache.py), with ETag/Last-Modified for 304s.
+    """
+    started = time.perf_counter()
+    key = _closed_history_key()
+    if key:
+        entry = get_history(key)
+        if entry:
+            HISTORY_SECONDS.labels("cache").observe(time.perf_counter() - started)
+            return _cached_json(entry, max_age=READ_CACHE_TTL)
+
+    response = _read_history(started)
+    if key and isinstance(response, Response) and response.status_code == 200:
+        return _cached_json(put_history(key, response.get_json()), max_age=READ_CACHE_TTL)
+    return response
+
+def _read_history(started):
+    """Build the /api/history response from the DB, rollups or archive."""
+    session = SessionLocal()
     try:
-        session = SessionLocal()
-        
-        sensor_id = request.args.get('sensor_id')
-        start_param = request.args.get('start')
-        end_param = request.args.get('end')
-        hours_param = request.args.get('hours', default=1, type=int)
-
-        query = session.query(SensorReading).join(Sensor)
-
-        if sensor_id:
-            query = query.filter(SensorReading.sensor_id == sensor_id)
-
-        if start_param and end_param:
-            try:
-                start_dt = datetime.strptime(start_param, "%Y-%m-%d %H:%M:%S")
-                end_dt = datetime.strptime(end_param, "%Y-%m-%d %H:%M:%S")
-                query = query.filter(SensorReading.timestamp >= start_dt, SensorReading.timestamp <= end_dt)
-            except ValueError:
-                return jsonify({"error": "Invalid date format"}), 400
-        else:
-            now = datetime.now()
-            time_threshold = now - timedelta(hours=hours_param)
-            query = query.filter(SensorReading.timestamp >= time_threshold)
-        
-        # Limit to prevent massive loads
-        readings = query.order_by(SensorReading.timestamp.asc()).limit(2000).all()
-        
-        history_data = [r.to_dict() for r in readings]
-        
-        session.close()
+        sensor_id = request.args.get('sensor_id', type=int)
+        bucket_param = request.args.get('bucket')
+        max_points = request.args.get('max_points', type=int)
+        cursor = request.args.get('cursor')
+
+        try:
+            start_dt, end_dt = _parse_history_range()
+        except ValueError:
+            return jsonify({"error": "Invalid date format"}), 400
+        try:
+            after = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Rollups only if they still cover the start of the range (rollup retention)
+        floor = rollup_cutoff(session)
+        use_rollups = rollups_ready(session) and (floor is None or start_dt >= floor)
+        # Older than the raw retention window -> archive for [start, cutoff), DB for the rest.
+        # A cursor from before the cutoff continues in the archive.
+        cutoff = hot_cutoff(session)
+        cold = cutoff is not None and start_dt < cutoff and (after is None or after[0] < cutoff)
+        cold_end = min(end_dt, cutoff - timedelta(seconds=1)) if cold else None
+        hot = not cold or end_dt >= cutoff
+
+        if bucket_param:
+            if bucket_param not in BUCKETS:
+                return jsonify({"error": f"Invalid bucket. Use one of: {', '.join(BUCKETS)}"}), 400
+            period = {"1h": "hour", "1d": "day"}.get(bucket_param) if use_rollups else None
+            if period:
+                history_data = rollup_history(session, start_dt, end_dt, period, sensor_id)
+            elif cold:
+                history_data = archive_buckets(session, start_dt, cold_end, BUCKETS[bucket_param], sensor_id)
+                if hot:
+                    history_data += aggregate_history(session, cutoff, end_dt, BUCKETS[bucket_param], sensor_id)
+            else:
+                history_data = aggregate_history(session, start_dt, end_dt, BUCKETS[bucket_param], sensor_id)
+            return _history_response({
+                "success": True,
+                "bucket": bucket_param,
+                "source": f"rollup_{period}" if period else ("archive" if cold else "raw"),
+                "count": len(history_data),
+                "data": history_data
+            }, started)
 
-        return jsonify({
+        if max_points:
+            max_points = max(3, min(max_points, MAX_POINTS_LIMIT))
+            period = choose_period(start_dt, end_dt, min_points=max_points) if use_rollups else None
+            if period:
+                history_data = downsample_rows(rollup_history(session, start_dt, end_dt, period, sensor_id), max_points)
+            elif cold:
+                rows = archive_rows(session, start_dt, cold_end, sensor_id)
+                if hot:
+                    rows += downsample_history(session, cutoff, end_dt, max_points, sensor_id)
+                history_data = downsample_rows(rows, max_points)
+            else:
+                history_data = downsample_history(session, start_dt, end_dt, max_points, sensor_id)
+            return _history_response({
+                "success": True,
+                "max_points": max_points,
+                "source": f"rollup_{period}" if period else ("archive" if cold else "raw"),
+                "count": len(history_data),
+                "data": history_data
+            }, started)
+
+        # A cursor means the client is paging through raw readings
+        period = choose_period(start_dt, end_dt) if use_rollups and not cursor else None
+        if period:
+            history_data = rollup_history(session, start_dt, end_dt, period, sensor_id)
+            return _history_response({
+                "success": True,
+                "source": f"rollup_{period}",
+                "count": len(history_data),
+                "data": history_data
+            }, started)
+
+        # Keyset page on (timestamp, id); sensor name is selected with each row (no lazy load).
+        # Archived part first, then the DB from the cutoff; the cursor resumes in whichever store the page ended
+        limit = 2000 # Limit to prevent massive loads
+        history_data, last = history_page(session, start_dt, end_dt, sensor_id, after, limit, cutoff)
+        next_cursor = encode_cursor(*last) if last else None
+        return _history_response({
             "success": True,
+            "source": "archive" if cold else "raw",
             "count": len(history_data),
+            "truncated": next_cursor is not None,
+            "next_cursor": next_cursor,
             "data": history_data
-        })
+        }, started)
 
     except Exception as e:
         print(f"❌ Error with history: {e}")
-        return jsonify({"success": False, "error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"success": False, "error": str(e)}), 500
+    finally:
+        session.close()
+
+@api_routes.route('/history/export')
+def export_history():
+    """
+    Stream every raw reading in the range as CSV (default) or NDJSON (?format=ndjson).
+    Same range/sensor params as /api/history, no row cap. Rows are read in keyset
+    pages and written as they arrive, so memory stays flat for year-long exports.
+    Archived readings come first, through the same pages as /api/history.
+    """
+    sensor_id = request.args.get('sensor_id', type=int)
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({"error": "Invalid format. Use csv or ndjson"}), 400
+
+    try:
+        start_dt, end_dt = _parse_history_range()
+    except ValueError:
+        return jsonify({"error": "Invalid date format"}), 400
+
+    session = SessionLocal()
+    try:
+        cutoff = hot_cutoff(session)
+    finally:
+        session.close()
+    rows = iter_readings(SessionLocal, start_dt, end_dt, sensor_id, cutoff=cutoff)
+    if fmt == 'ndjson':
+        body, mimetype = ndjson_chunks(rows), 'application/x-ndjson'
+    else:
+        body, mimetype = csv_chunks(rows), 'text/csv'
+
+    filename = f"sensor_data_{start_dt.strftime('%Y%m%d%H%M')}_{end_dt.strftime('%Y%m%d%H%M')}.{fmt}"
+    return Response(body, mimetype=mimetype, headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+@api_routes.route('/analytics')
+def get_analytics_report():
+    """
+    Analytics over the whole range, computed server-side with NumPy:
+    per-sensor min/max/avg/SD, outage gaps (> 20 min without data), uptime %
+    and SD per day. Same range/sensor params as /api/history.
+    Results are cached per (sensor, range); "cached" says whether this one was.
+    """
+    session = SessionLocal()
+    try:
+        sensor_id = request.args.get('sensor_id', type=int)
+        try:
+            start_dt, end_dt = _parse_history_range()
+        except ValueError:
+            return jsonify({"error": "Invalid date format"}), 400
+        if end_dt <= start_dt:
+            return jsonify({"error": "end must be after start"}), 400
+
+        result, cached = get_analytics(session, start_dt, end_dt, sensor_id)
+        return jsonify({"success": True, "cached": cached, **result})
+    except Exception as e:
+        print(f"❌ Error with analytics: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+    finally:
+        session.close()
+
+@api_routes.route('/forecast')
+def get_forecast_report():
+    """
+    Predicted temperature/humidity from the incremental per-sensor models
+    (services/forecast.py), no history download needed.
+    ?at=YYYY-MM-DD HH:MM:SS (repeatable) -> those instants
+    otherwise ?horizon=N -> every hour of the next N hours (default 24)
+    ?method=linear|holt_winters (Holt-Winters falls back to linear until it has a full day)
+    """
+    session = SessionLocal()
+    try:
+        sensor_id = request.args.get('sensor_id', type=int)
+        method = request.args.get('method', FORECAST_METHOD)
+        if method not in FORECAST_METHODS:
+            return jsonify({"error": f"Invalid method. Use one of: {', '.join(FORECAST_METHODS)}"}), 400
+
+        at_params = request.args.getlist('at')
+        try:
+            times = [datetime.strptime(a, "%Y-%m-%d %H:%M:%S") for a in at_params]
+        except ValueError:
+            return jsonify({"error": "Invalid date format"}), 400
+        if not times:
+            horizon = min(max(request.args.get('horizon', default=24, type=int), 1), FORECAST_MAX_POINTS)
+            next_hour = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+            times = [next_hour + timedelta(hours=h) for h in range(horizon)]
+        if len(times) > FORECAST_MAX_POINTS:
+            return jsonify({"error": f"At most {FORECAST_MAX_POINTS} instants per request"}), 400
+
+        result, cached = get_forecast(session, times, sensor_id, method)
+        return jsonify({"success": True, "cached": cached, **result})
+    except Exception as e:
+        print(f"❌ Error with forecast: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+    finally:
+        session.close()
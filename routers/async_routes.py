@@ -0,0 +1,198 @@
+import json
+import asyncio
+from urllib.parse import parse_qs
+from asgiref.wsgi import WsgiToAsgi
+from models.async_db import async_redis_client, AsyncSessionLocal, async_engine
+from services.token_cache import resolve_token_async
+from services.ingest import parse_batch, collect_tokens, build_sensor_data
+from services.publisher import publish_updates_async, CURRENT_KEY
+from services.async_stream_hub import register_client, unregister_client
+from services.stream_hub import snapshot_messages, parse_sensor_filter
+from services.metrics import IngestTrace, instrument_pool
+
+# ASGI serving mode: /stream-data and /api/ingest/* run on the event loop,
+# every other route is forwarded to the Flask app (thread pool via asgiref).
+
+MAX_BODY_BYTES = 1024 * 1024
+
+# --- HELPERS ---
+async def _read_body(receive):
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body += message.get("body", b"")
+        if len(body) > MAX_BODY_BYTES:
+            raise ValueError("Payload too large")
+        more_body = message.get("more_body", False)
+    return body
+
+async def _read_json(receive):
+    body = await _read_body(receive)
+    if not body:
+        return None
+    try:
+        return json.loads(body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+
+async def _send_json(send, status, obj):
+    body = json.dumps(obj).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+# --- DATA INGESTION ---
+async def ingest_data(token, receive, send):
+    """Async twin of routers/api.py:ingest_data."""
+    try:
+        payload = await _read_json(receive)
+    except ValueError as e:
+        return await _send_json(send, 413, {"error": str(e)})
+    if not payload or not isinstance(payload, dict):
+        return await _send_json(send, 400, {"error": "Invalid payload"})
+
+    trace = IngestTrace()
+    try:
+        sensor = await resolve_token_async(token, async_redis_client, AsyncSessionLocal)
+        trace.token = trace.lap()
+        if not sensor:
+            return await _send_json(send, 403, {"error": "Invalid Token"})
+
+        sensor_data = {
+            "temperature": payload.get("temperature"),
+            "humidity": payload.get("humidity"),
+            "sensor_id": sensor["id"],
+            "sensor_name": sensor["name"]
+        }
+        await publish_updates_async([sensor_data], async_redis_client, trace)
+        trace.record(1)
+        return await _send_json(send, 200, {"success": True})
+    except Exception as e:
+        return await _send_json(send, 500, {"error": str(e)})
+
+async def ingest_batch(receive, send):
+    """Async twin of routers/api.py:ingest_batch."""
+    try:
+        payload = await _read_json(receive)
+    except ValueError as e:
+        return await _send_json(send, 413, {"error": str(e)})
+
+    trace = IngestTrace()
+    try:
+        sensors = {}
+        for token in collect_tokens(payload):
+            sensors[token] = await resolve_token_async(token, async_redis_client, AsyncSessionLocal)
+        trace.token = trace.lap()
+        accepted, rejected = parse_batch(payload, sensors.get)
+    except ValueError as e:
+        return await _send_json(send, 400, {"error": str(e)})
+    except Exception as e: # DB/Redis down during token lookup: still answer the device
+        return await _send_json(send, 500, {"error": str(e)})
+
+    if not accepted:
+        return await _send_json(send, 400, {"success": False, "accepted": 0, "rejected": rejected})
+
+    try:
+        await publish_updates_async([build_sensor_data(s, r) for s, r in accepted], async_redis_client, trace)
+        trace.record(len(accepted))
+        return await _send_json(send, 200, {"success": True, "accepted": len(accepted), "rejected": rejected})
+    except Exception as e:
+        return await _send_json(send, 500, {"error": str(e)})
+
+# --- SSE ---
+async def stream_data(scope, receive, send):
+    """
+    SSE endpoint on the event loop. An idle client costs a small buffer
+    and a couple of tasks, not an OS thread.
+    Optional ?sensors=1,2 limits the stream to those sensor IDs.
+    """
+    query = parse_qs(scope.get("query_string", b"").decode())
+    sensor_ids = parse_sensor_filter(query.get("sensors", [None])[0])
+    client = register_client(async_redis_client, sensor_ids)
+
+    async def wait_disconnect():
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+
+    watcher = asyncio.ensure_future(wait_disconnect())
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no")
+            ]
+        })
+
+        # 1. Send Initial State (Current Cache)
+        try:
+            current_data = await async_redis_client.hgetall(CURRENT_KEY)
+            chunk = "".join(f"data: {envelope}\n\n" for envelope in snapshot_messages(current_data, sensor_ids))
+            if chunk:
+                await send({"type": "http.response.body", "body": chunk.encode(), "more_body": True})
+        except Exception as e:
+            print(f"⚠️ Error sending initial state: {e}")
+
+        # 2. Forward updates from the shared subscriber
+        while True:
+            drain = asyncio.ensure_future(client.drain_async())
+            done, _ = await asyncio.wait({drain, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if watcher in done:
+                drain.cancel()
+                break
+            messages = drain.result()
+            chunk = "".join(f"data: {payload}\n\n" for payload in messages) if messages else ": keepalive\n\n"
+            await send({"type": "http.response.body", "body": chunk.encode(), "more_body": True})
+    except (asyncio.CancelledError, OSError):
+        pass
+    except Exception as e:
+        print(f"❌ Error in stream: {e}")
+    finally:
+        unregister_client(client)
+        watcher.cancel()
+
+# --- APP ---
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await async_redis_client.aclose()
+            await async_engine.dispose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+def create_asgi_app(flask_app):
+    """Wrap the Flask app: async routes first, everything else goes to Flask."""
+    wsgi_app = WsgiToAsgi(flask_app)
+    instrument_pool(async_engine.sync_engine.pool)
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await _lifespan(receive, send)
+
+        if scope["type"] == "http":
+            path, method = scope["path"], scope["method"]
+            if path == "/stream-data" and method == "GET":
+                return await stream_data(scope, receive, send)
+            if path == "/api/ingest/batch" and method == "POST":
+                return await ingest_batch(receive, send)
+            if path.startswith("/api/ingest/") and method == "POST":
+                token = path[len("/api/ingest/"):]
+                if token and "/" not in token:
+                    return await ingest_data(token, receive, send)
+
+        return await wsgi_app(scope, receive, send)
+
+    return app
@@ -0,0 +1,36 @@
+import sys
+from flask import Blueprint, Response
+from models.db import engine
+from services import stream_hub
+from services.metrics import Gauge, collect, merge, render, start_metrics, instrument_pool
+
+metrics_routes = Blueprint('metrics', __name__, url_prefix='')
+
+def _sse_stats():
+    """get_stats() of each SSE hub loaded in this process (the async one only exists under ASGI)."""
+    hubs = {"wsgi": stream_hub}
+    async_hub = sys.modules.get("services.async_stream_hub")
+    if async_hub:
+        hubs["asgi"] = async_hub
+    return {server: hub.get_stats() for server, hub in hubs.items()}
+
+def _sse_gauge(field):
+    return lambda: {(server,): stats[field] for server, stats in _sse_stats().items()}
+
+def _is_leader():
+    worker = sys.modules.get("services.sensor_worker")
+    return 1 if worker and worker.is_leader() else 0
+
+Gauge("sse_clients", "Open SSE connections.", _sse_gauge("clients"), ("server",))
+Gauge("sse_queued_messages", "Messages waiting in SSE client queues.", _sse_gauge("queued"), ("server",))
+Gauge("sse_client_queue_depth_max", "Deepest SSE client queue.", _sse_gauge("max_depth"), ("server",), merge="max")
+Gauge("sse_dropped_messages", "Messages dropped by slow SSE clients still connected.", _sse_gauge("dropped"), ("server",))
+Gauge("worker_leader", "Processes running the sensor worker (should be 1).", _is_leader)
+
+instrument_pool(engine.pool)
+start_metrics()
+
+@metrics_routes.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint, merged across every process sharing this Redis."""
+    return Response(render(merge(collect())), mimetype='text/plain; version=0.0.4')
@@ -1,6 +1,6 @@
-from flask import Blueprint, Response, stream_with_context
+from flask import Blueprint, Response, request, stream_with_context
 from models.db import redis_client
-import json
+from services.stream_hub import register_client, unregister_client, snapshot_messages, parse_sensor_filter
 
 stream_routes = Blueprint('stream', __name__, url_prefix='')
 
@@ -8,51 +8,40 @@ stream_routes = Blueprint('stream', __name__, url_prefix='')
 def stream_data():
     """
     SSE endpoint using Redis Pub/Sub.
+    All clients of this process share one subscription (services/stream_hub.py).
+    Optional ?sensors=1,2 limits the stream to those sensor IDs.
     """
+    sensor_ids = parse_sensor_filter(request.args.get('sensors'))
+
     def generate():
         if not redis_client:
             return 
-            
-        # 1. Send Initial State (Current Cache)
-        try:
-            current_data = redis_client.hgetall("sensors:current")
-            if current_data:
-                for sensor_id, json_val in current_data.items():
-                    # Check for legacy garbage strictly
-                    try:
-                        int(sensor_id) # Verify ID is int
-                        # Re-wrap to ensure client parses same format
-                        # json_val is likely already in correct format {"sensor_id":...}
-                        # We send a "fake" message structure matching the stream
-                        data_obj = json.loads(json_val)
-                        
-                        # Fix: Ensure we match the stream structure expected by app.js (msg.sensor_id && msg.data)
-                        envelope = {
-                            "sensor_id": int(sensor_id),
-                            "data": data_obj,
-                            "server_time": data_obj.get("server_time") or "Init"
-                        }
-                        
-                        yield f"data: {json.dumps(envelope)}\n\n"
-                    except (ValueError, json.JSONDecodeError):
-                        continue
-        except Exception as e:
-            print(f"⚠️ Error sending initial state: {e}")
 
-        # 2. Subscribe to enhancements
-        pubsub = redis_client.pubsub()
-        pubsub.subscribe('sensors:stream')
-        
+        # Attach before reading the snapshot so no update falls in between
+        client = register_client(sensor_ids)
         try:
-            for message in pubsub.listen():
-                if message['type'] == 'message':
-                    # message['data'] is the JSON string payload
-                    yield f"data: {message['data']}\n\n"
+            # 1. Send Initial State (Current Cache)
+            try:
+                current_data = redis_client.hgetall("sensors:current")
+                for envelope in snapshot_messages(current_data, sensor_ids):
+                    yield f"data: {envelope}\n\n"
+            except Exception as e:
+                print(f"⚠️ Error sending initial state: {e}")
+
+            # 2. Forward updates from the shared subscriber
+            while True:
+                messages = client.drain()
+                if not messages:
+                    yield ": keepalive\n\n" # Detects closed sockets on idle streams
+                    continue
+                for payload in messages:
+                    # payload is the JSON string published on sensors:stream
+                    yield f"data: {payload}\n\n"
         except GeneratorExit:
             print("🔌 Web client disconnected.")
-            pubsub.unsubscribe()
         except Exception as e:
             print(f"❌ Error in stream: {e}")
-            pubsub.unsubscribe()
+        finally:
+            unregister_client(client)
 
     return Response(stream_with_context(generate()), mimetype='text/event-stream')
\ No newline at end of file
@@ -0,0 +1,196 @@
+import os
+import json
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import select
+from models.db import redis_client
+from models.sql_models import SensorReading, Sensor
+from services.history import EPOCH, epoch_expression, _dialect
+from services.archive import hot_cutoff, read_archive
+from services.read_cache import versions, SENSORS, HISTORY
+
+# --- CONFIG ---
+GAP_THRESHOLD_MINUTES = 20 # Silence longer than this counts as an outage (same rule the dashboard used)
+ANALYTICS_CACHE_TTL = int(os.getenv('ANALYTICS_CACHE_TTL', 60)) # Seconds, for ranges that are still open
+ANALYTICS_CLOSED_TTL = 60 * 60 # Ranges that ended in the past change rarely (late uploads only)
+CACHE_PREFIX = "sensors:analytics:"
+ANALYTICS_YIELD_PER = 20000 # Rows per chunk streamed from the DB into NumPy
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def _epoch(ts):
+    """Naive wall-clock datetime -> seconds (same convention as the history buckets)."""
+    return (ts - EPOCH).total_seconds()
+
+def _format(seconds):
+    return (EPOCH + timedelta(seconds=float(seconds))).strftime(TIMESTAMP_FORMAT)
+
+def load_series(session, start, end, sensor_id=None):
+    """
+    {sensor_id: (ts, temperature, humidity)} as NumPy arrays sorted by time
+    (epoch seconds, NaN for missing values). Archived data is included.
+    """
+    parts = {}
+    cutoff = hot_cutoff(session)
+    db_start = start
+    if cutoff is not None and start < cutoff:
+        cold = read_archive(session, start, min(end, cutoff - timedelta(seconds=1)), sensor_id)
+        if cold.num_rows:
+            sids = cold["sensor_id"].to_numpy()
+            ts = cold["timestamp"].cast("int64").to_numpy().astype(np.float64)
+            temp = cold["temperature"].to_numpy(zero_copy_only=False).astype(np.float64)
+            hum = cold["humidity"].to_numpy(zero_copy_only=False).astype(np.float64)
+            for sid in np.unique(sids):
+                mask = sids == sid
+                parts.setdefault(int(sid), []).append((ts[mask], temp[mask], hum[mask]))
+        db_start = cutoff
+
+    # Only the four columns, epoch seconds computed in SQL, streamed in chunks:
+    # no per-row objects beyond the driver tuples of the current chunk.
+    stmt = select(
+        SensorReading.sensor_id, epoch_expression(_dialect(session)),
+        SensorReading.temperature, SensorReading.humidity
+    ).where(SensorReading.timestamp >= db_start, SensorReading.timestamp <= end)
+    if sensor_id:
+        stmt = stmt.where(SensorReading.sensor_id == sensor_id)
+    stmt = stmt.order_by(SensorReading.sensor_id, SensorReading.timestamp).execution_options(yield_per=ANALYTICS_YIELD_PER)
+
+    for rows in session.execute(stmt).partitions():
+        sids, ts, temp, hum = (np.array(column, dtype=np.float64) for column in zip(*rows)) # None -> NaN
+        sids = sids.astype(np.int64)
+        bounds = np.flatnonzero(np.diff(sids)) + 1
+        for chunk in np.split(np.arange(sids.size), bounds):
+            parts.setdefault(int(sids[chunk[0]]), []).append((ts[chunk], temp[chunk], hum[chunk]))
+
+    series = {}
+    for sid, chunks in parts.items():
+        ts, temp, hum = (np.concatenate(c) for c in zip(*chunks))
+        order = np.argsort(ts, kind="stable")
+        series[sid] = (ts[order], temp[order], hum[order])
+    return series
+
+def _stats(values):
+    valid = values[~np.isnan(values)]
+    if not valid.size:
+        return {"min": None, "max": None, "avg": None, "std": None, "count": 0}
+    return {
+        "min": round(float(valid.min()), 2),
+        "max": round(float(valid.max()), 2),
+        "avg": round(float(valid.mean()), 2),
+        "std": round(float(valid.std()), 3), # Population SD, as the dashboard computed it
+        "count": int(valid.size)
+    }
+
+def find_gaps(ts, start, end, threshold):
+    """Silences longer than `threshold` seconds, including before the first and after the last reading."""
+    edges = np.concatenate(([start], ts, [end]))
+    diffs = np.diff(edges)
+    idx = np.flatnonzero(diffs > threshold)
+    return [(edges[i], edges[i + 1]) for i in idx]
+
+def daily_std(ts, temp, hum):
+    """SD per calendar day, with reduceat over the (sorted) day segments."""
+    if not ts.size:
+        return []
+    days = (ts // 86400).astype(np.int64)
+    starts = np.flatnonzero(np.concatenate(([True], days[1:] != days[:-1])))
+
+    def segment_std(values):
+        valid = ~np.isnan(values)
+        x = np.where(valid, values, 0.0)
+        n = np.add.reduceat(valid.astype(np.int64), starts)
+        total = np.add.reduceat(x, starts)
+        total_sq = np.add.reduceat(x * x, starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = total / n
+            std = np.sqrt(np.maximum(total_sq / n - mean * mean, 0.0))
+        return n, std
+
+    t_n, t_std = segment_std(temp)
+    h_n, h_std = segment_std(hum)
+    counts = np.diff(np.concatenate((starts, [ts.size])))
+    return [{
+        "date": (EPOCH + timedelta(days=int(days[s]))).strftime("%Y-%m-%d"),
+        "temp_std": round(float(t_std[i]), 3) if t_n[i] else None,
+        "hum_std": round(float(h_std[i]), 3) if h_n[i] else None,
+        "count": int(counts[i])
+    } for i, s in enumerate(starts)]
+
+def compute_analytics(session, start, end, sensor_id=None):
+    """Per-sensor stats, outage gaps, uptime % and daily SD over the whole range."""
+    sensors = session.query(Sensor)
+    if sensor_id:
+        sensors = sensors.filter(Sensor.id == sensor_id)
+    sensors = sensors.order_by(Sensor.id).all()
+
+    series = load_series(session, start, end, sensor_id)
+    threshold = GAP_THRESHOLD_MINUTES * 60
+    range_start, range_end = _epoch(start), _epoch(end)
+    span = max(range_end - range_start, 1.0)
+    empty = np.array([], dtype=np.float64)
+
+    results = []
+    for sensor in sensors:
+        ts, temp, hum = series.get(sensor.id, (empty, empty, empty))
+        gaps = find_gaps(ts, range_start, range_end, threshold)
+        downtime = sum(b - a for a, b in gaps)
+        results.append({
+            "sensor_id": sensor.id,
+            "sensor_name": sensor.name,
+            "type": sensor.type,
+            "count": int(ts.size),
+            "temperature": _stats(temp),
+            "humidity": _stats(hum),
+            "uptime_pct": round(max(0.0, 100 * (1 - downtime / span)), 2),
+            "gaps": [{"from": _format(a), "to": _format(b), "minutes": int((b - a) // 60)} for a, b in gaps],
+            "daily": daily_std(ts, temp, hum)
+        })
+
+    return {
+        "start": start.strftime(TIMESTAMP_FORMAT),
+        "end": end.strftime(TIMESTAMP_FORMAT),
+        "gap_threshold_minutes": GAP_THRESHOLD_MINUTES,
+        "total_samples": sum(r["count"] for r in results),
+        "outages_count": sum(len(r["gaps"]) for r in results),
+        "sensors": results
+    }
+
+def cache_key(sensor_id, start, end):
+    """
+    Key for a (sensor, range) result, including the SENSORS and HISTORY versions
+    like read_cache.history_key(): a late upload or an archive/retention run
+    produces a new key instead of serving the old result until the TTL expires.
+    """
+    current = versions(SENSORS, HISTORY)
+    return (f"{CACHE_PREFIX}{current[SENSORS][0]}.{current[HISTORY][0]}:"
+            f"{sensor_id or 'all'}:{start:%Y%m%d%H%M}:{end:%Y%m%d%H%M}")
+
+def get_analytics(session, start, end, sensor_id=None, now=None):
+    """
+    compute_analytics() behind a Redis cache keyed by (sensor, range).
+    Ranges are aligned to whole minutes so relative ranges (?hours=N) share entries:
+    `start` is floored and `end` rounded up, so readings from the current minute count.
+    Returns (result, cached).
+    """
+    start = start.replace(second=0, microsecond=0)
+    if end.second or end.microsecond:
+        end = end.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    key = cache_key(sensor_id, start, end)
+
+    if redis_client:
+        try:
+            cached = redis_client.get(key)
+            if cached:
+                return json.loads(cached), True
+        except Exception as e:
+            print(f"⚠️ Analytics cache read failed: {e}")
+
+    result = compute_analytics(session, start, end, sensor_id)
+
+    if redis_client:
+        now = now or datetime.now()
+        ttl = ANALYTICS_CLOSED_TTL if end < now - timedelta(minutes=GAP_THRESHOLD_MINUTES) else ANALYTICS_CACHE_TTL
+        try:
+            redis_client.set(key, json.dumps(result), ex=ttl)
+        except Exception as e:
+            print(f"⚠️ Analytics cache write failed: {e}")
+    return result, False
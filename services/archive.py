@@ -0,0 +1,366 @@
+import os
+import json
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, delete
+from models.sql_models import SensorReading, Sensor
+from models.partitions import month_start, next_month
+from services.retention import get_policy, RETENTION_BATCH_SIZE, RETENTION_MAX_BATCHES, RETENTION_PAUSE_SECONDS
+from services.history import EPOCH
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError: # Optional (extra "archive"): without pyarrow nothing is archived and retention deletes as before
+    pa = None
+
+# --- CONFIG ---
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive') # One Parquet file per sensor per month
+ARCHIVE_REQUESTED = os.getenv('ARCHIVE_ENABLED', '1') == '1'
+ARCHIVE_ENABLED = pa is not None and ARCHIVE_REQUESTED
+ARCHIVE_GRACE = timedelta(days=1) # A month is archived this long after it ends (late batch uploads)
+ARCHIVE_COMPRESSION = "zstd"
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+if ARCHIVE_REQUESTED and pa is None:
+    print("⚠️⚠️⚠️ ARCHIVE_ENABLED=1 but pyarrow is not installed: retention DELETES old raw readings "
+          "without archiving them. Install it (uv sync --extra archive) or set ARCHIVE_ENABLED=0.")
+
+def archive_path(sensor_id, month):
+    return os.path.join(ARCHIVE_DIR, f"sensor_{sensor_id}", f"{month:%Y-%m}.parquet")
+
+def manifest_path(sensor_id):
+    return os.path.join(ARCHIVE_DIR, f"sensor_{sensor_id}", "manifest.json")
+
+def load_manifest(sensor_id):
+    """
+    {"YYYY-MM": {"rows", "max_id", "checked"}} for a sensor's month files, so the
+    hourly archive run doesn't re-read every file. "checked" is the DB
+    fingerprint (count, max id, id sum) last verified as fully archived.
+    """
+    try:
+        with open(manifest_path(sensor_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(sensor_id, manifest):
+    path = manifest_path(sensor_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(path + ".tmp", path)
+
+def archived_before(now=None):
+    """Months that end before this instant are archived (or being archived) by the worker."""
+    return month_start((now or datetime.now()) - ARCHIVE_GRACE)
+
+def _schema():
+    return pa.schema([
+        ("timestamp", pa.timestamp("s")),
+        ("temperature", pa.float64()),
+        ("humidity", pa.float64()),
+        ("id", pa.int64()), # sensor_readings.id: with the timestamp, which DB rows the file holds
+    ])
+
+def _read_month(path):
+    """A month file as an Arrow table in _schema(), or None if there is none."""
+    if not os.path.exists(path):
+        return None
+    table = pq.read_table(path, memory_map=True)
+    # Parquet has no second unit; files come back as timestamp[ms]
+    return table.set_column(0, "timestamp", pc.cast(table["timestamp"], pa.timestamp("s"))).cast(_schema())
+
+def _key(reading_id, ts):
+    # SQLite hands out a deleted row's id again, so the id alone doesn't identify a reading
+    return reading_id, ts.replace(microsecond=0)
+
+def archived_keys(sensor_id, month, before=None):
+    """(id, timestamp) of the readings in a sensor-month file (only rows older than `before` if given)."""
+    table = _read_month(archive_path(sensor_id, month))
+    if table is None:
+        return set()
+    if before is not None:
+        table = table.filter(pc.less(table["timestamp"], pa.scalar(before, pa.timestamp("s"))))
+    return set(zip(table["id"].to_pylist(), table["timestamp"].to_pylist()))
+
+def _month_filter(sensor_id, month, before=None):
+    end = next_month(month) if before is None else min(next_month(month), before)
+    return (SensorReading.sensor_id == sensor_id, SensorReading.timestamp >= month, SensorReading.timestamp < end)
+
+def _db_keys(session, sensor_id, month):
+    query = session.query(SensorReading.id, SensorReading.timestamp).filter(
+        *_month_filter(sensor_id, month)
+    ).execution_options(yield_per=10000)
+    return (_key(reading_id, ts) for reading_id, ts in query)
+
+def write_month(session, sensor_id, month, manifest=None):
+    """
+    Merge one sensor-month into its Parquet file (atomically via a temp file):
+    the rows already archived plus every DB row the file doesn't hold yet
+    (late uploads land in months that were archived long ago).
+    The file's entry in `manifest` (load_manifest()) is updated; saving it is up to the caller.
+    Returns the number of rows added.
+    """
+    path = archive_path(sensor_id, month)
+    existing = _read_month(path)
+    known = set(zip(existing["id"].to_pylist(), existing["timestamp"].to_pylist())) if existing is not None else set()
+    query = session.query(
+        SensorReading.id, SensorReading.timestamp, SensorReading.temperature, SensorReading.humidity
+    ).filter(*_month_filter(sensor_id, month)).order_by(SensorReading.timestamp.asc()).execution_options(yield_per=10000)
+
+    ids, timestamps, temperatures, humidities = [], [], [], []
+    for reading_id, ts, temperature, humidity in query:
+        if _key(reading_id, ts) in known:
+            continue
+        ids.append(reading_id)
+        timestamps.append(ts.replace(microsecond=0))
+        temperatures.append(temperature)
+        humidities.append(humidity)
+    if not ids:
+        return 0
+
+    table = pa.table([timestamps, temperatures, humidities, ids], schema=_schema())
+    if existing is not None:
+        table = pa.concat_tables([existing, table]).sort_by("timestamp")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    pq.write_table(table, tmp_path, compression=ARCHIVE_COMPRESSION)
+    os.replace(tmp_path, path)
+    if manifest is not None:
+        manifest[f"{month:%Y-%m}"] = {"rows": table.num_rows, "max_id": pc.max(table["id"]).as_py()}
+    return len(ids)
+
+def month_archived(session, sensor_id, month):
+    """Whether every DB row of the sensor-month is in its file (exact, reads all ids)."""
+    known = archived_keys(sensor_id, month)
+    return all(key in known for key in _db_keys(session, sensor_id, month))
+
+def _file_entry(sensor_id, month, manifest):
+    """Manifest entry of a sensor-month file, built from the file once if missing (None without a file)."""
+    key = f"{month:%Y-%m}"
+    if key not in manifest:
+        table = _read_month(archive_path(sensor_id, month))
+        if table is None:
+            return None
+        manifest[key] = {"rows": table.num_rows, "max_id": pc.max(table["id"]).as_py() or 0}
+    return manifest[key]
+
+def _needs_merge(session, sensor_id, month, manifest, expired_before=None):
+    count, max_id, id_sum = session.query(
+        func.count(SensorReading.id), func.max(SensorReading.id), func.sum(SensorReading.id)
+    ).filter(*_month_filter(sensor_id, month)).one()
+    if not count:
+        return False
+    entry = _file_entry(sensor_id, month, manifest)
+    if entry is None or count > entry["rows"] or max_id > entry["max_id"]:
+        return True # New rows (ids grow while the month still has rows), or no file yet
+    if expired_before is not None and month < expired_before:
+        # Retention only deletes archived rows here; anything left over is a late
+        # row with a reused id or one that committed after the file was written.
+        # The exact check reads the file, so it only runs when the DB rows changed.
+        fingerprint = [count, max_id, int(id_sum)]
+        if entry.get("checked") == fingerprint:
+            return False
+        if not month_archived(session, sensor_id, month):
+            return True
+        entry["checked"] = fingerprint
+    return False
+
+def archive_closed_months(session, now=None, expired_before=None):
+    """
+    Archive every closed sensor-month whose DB rows aren't all in its file yet,
+    merging them into the existing file. Months starting before `expired_before`
+    (the raw retention cutoff) get an exact id check when their rows changed.
+    Returns {"files": n, "rows": n} (files written, rows added).
+    """
+    summary = {"files": 0, "rows": 0}
+    if not ARCHIVE_ENABLED:
+        return summary
+
+    limit = archived_before(now)
+    firsts = session.query(SensorReading.sensor_id, func.min(SensorReading.timestamp)).filter(
+        SensorReading.timestamp < limit
+    ).group_by(SensorReading.sensor_id).all()
+
+    for sensor_id, first in firsts:
+        manifest = load_manifest(sensor_id)
+        before = json.dumps(manifest, sort_keys=True)
+        month = month_start(first)
+        while month < limit:
+            if _needs_merge(session, sensor_id, month, manifest, expired_before):
+                rows = write_month(session, sensor_id, month, manifest)
+                if rows:
+                    summary["files"] += 1
+                    summary["rows"] += rows
+            month = next_month(month)
+        if json.dumps(manifest, sort_keys=True) != before:
+            save_manifest(sensor_id, manifest)
+    return summary
+
+def delete_archived(session, cutoff, batch_size=RETENTION_BATCH_SIZE, max_batches=RETENTION_MAX_BATCHES):
+    """
+    Retention for raw readings when archiving is on: DELETE rows older than
+    `cutoff` whose (id, timestamp) is in the archive files, in bounded batches
+    like retention.delete_in_batches. A row that isn't in a file (a late
+    upload since the last merge) stays until the next archive run picks it up.
+    Returns rows deleted.
+    """
+    firsts = session.query(SensorReading.sensor_id, func.min(SensorReading.timestamp)).filter(
+        SensorReading.timestamp < cutoff
+    ).group_by(SensorReading.sensor_id).all()
+
+    total, batches = 0, 0
+    for sensor_id, first in firsts:
+        month = month_start(first)
+        while month < cutoff:
+            if not session.query(SensorReading.id).filter(*_month_filter(sensor_id, month, cutoff)).first():
+                month = next_month(month) # Already emptied: don't read its file
+                continue
+            known = archived_keys(sensor_id, month, before=cutoff)
+            ids = sorted(reading_id for reading_id, _ in known)
+            for i in range(0, len(ids), batch_size):
+                if batches >= max_batches:
+                    return total # The rest waits for the next run
+                rows = session.query(SensorReading.id, SensorReading.timestamp).filter(
+                    SensorReading.id.in_(ids[i:i + batch_size]), *_month_filter(sensor_id, month, cutoff)
+                ).all()
+                confirmed = [reading_id for reading_id, ts in rows if _key(reading_id, ts) in known]
+                if not confirmed:
+                    continue
+                result = session.execute(delete(SensorReading).where(
+                    SensorReading.id.in_(confirmed), *_month_filter(sensor_id, month, cutoff)
+                ))
+                session.commit()
+                total += result.rowcount
+                batches += 1
+                time.sleep(RETENTION_PAUSE_SECONDS)
+            month = next_month(month)
+    return total
+
+def partition_archived(session, month):
+    """Whether every row of one month (all sensors) is in the archive, so its partition can go."""
+    sensor_ids = [sid for (sid,) in session.query(SensorReading.sensor_id).filter(
+        SensorReading.timestamp >= month, SensorReading.timestamp < next_month(month)
+    ).distinct()]
+    return all(month_archived(session, sid, month) for sid in sensor_ids)
+
+def hot_cutoff(session, now=None):
+    """
+    Start of the window still guaranteed to be in the DB, or None when the
+    archive isn't needed (archiving off, or raw data is never deleted).
+    Older data is read from the archive.
+    """
+    if not ARCHIVE_ENABLED:
+        return None
+    raw_days = get_policy(session)["retention_raw_days"]
+    if not raw_days:
+        return None
+    now = now or datetime.now()
+    return min(now - timedelta(days=raw_days), archived_before(now))
+
+def _sensor_names(session, sensor_id=None):
+    query = session.query(Sensor.id, Sensor.name)
+    if sensor_id:
+        query = query.filter(Sensor.id == sensor_id)
+    return dict(query.all())
+
+def _month_tables(names, start, end):
+    """Archived readings in [start, end] for the sensors in `names`, one table per month (in order), each sorted by (timestamp, id)."""
+    month = month_start(start)
+    while month <= end:
+        tables = []
+        for sid in names:
+            table = _read_month(archive_path(sid, month))
+            if table is not None:
+                mask = pc.and_(
+                    pc.greater_equal(table["timestamp"], pa.scalar(start, pa.timestamp("s"))),
+                    pc.less_equal(table["timestamp"], pa.scalar(end, pa.timestamp("s")))
+                )
+                table = table.filter(mask)
+                tables.append(table.append_column("sensor_id", pa.array([sid] * table.num_rows, pa.int64())))
+        if tables:
+            yield pa.concat_tables(tables).sort_by([("timestamp", "ascending"), ("id", "ascending")])
+        month = next_month(month)
+
+def _concat(tables):
+    if not tables:
+        return _schema().empty_table().append_column("sensor_id", pa.array([], pa.int64()))
+    return pa.concat_tables(tables)
+
+def read_archive(session, start, end, sensor_id=None):
+    """
+    Archived readings in [start, end] as one Arrow table
+    (timestamp, temperature, humidity, id, sensor_id), sorted by (timestamp, id)
+    like the DB keyset pages. Files are memory-mapped; only the months in range are opened.
+    """
+    return _concat(list(_month_tables(_sensor_names(session, sensor_id), start, end)))
+
+def archive_rows(session, start, end, sensor_id=None):
+    """Archived readings as history rows (same shape as raw /api/history rows)."""
+    return _history_rows(read_archive(session, start, end, sensor_id), _sensor_names(session, sensor_id))
+
+def archive_page(session, start, end, sensor_id=None, after=None, limit=2000):
+    """
+    One keyset page of archived readings strictly after `after` = (timestamp, id),
+    in the same order and cursor terms as services/export.page_readings.
+    Reading starts at the cursor's month and stops once the page is full.
+    Returns (rows, (timestamp, id) of the last row, or None once the range is exhausted).
+    """
+    names = _sensor_names(session, sensor_id)
+    if after:
+        after_ts = after[0].replace(microsecond=0)
+        start = max(start, after_ts)
+    tables, count = [], 0
+    for table in _month_tables(names, start, end):
+        if after:
+            scalar = pa.scalar(after_ts, pa.timestamp("s"))
+            table = table.filter(pc.or_(
+                pc.greater(table["timestamp"], scalar),
+                pc.and_(pc.equal(table["timestamp"], scalar), pc.greater(table["id"], after[1]))
+            ))
+        tables.append(table)
+        count += table.num_rows
+        if count > limit:
+            break # Later months only hold later rows
+    table = _concat(tables)
+    last = None
+    if table.num_rows > limit:
+        table = table.slice(0, limit)
+        last = (table["timestamp"][-1].as_py(), table["id"][-1].as_py())
+    return _history_rows(table, names), last
+
+def _history_rows(table, names):
+    return [{
+        "timestamp": r["timestamp"].strftime(TIMESTAMP_FORMAT),
+        "sensor_id": r["sensor_id"],
+        "sensor_name": names.get(r["sensor_id"], "Unknown"),
+        "temperature": r["temperature"],
+        "humidity": r["humidity"]
+    } for r in table.to_pylist()]
+
+def archive_buckets(session, start, end, bucket_seconds, sensor_id=None):
+    """Bucketed min/max/avg/count over archived readings (same shape as aggregate_history rows)."""
+    names = _sensor_names(session, sensor_id)
+    table = read_archive(session, start, end, sensor_id)
+    epoch = pc.cast(table["timestamp"], pa.int64())
+    bucket = pc.multiply(pc.divide(epoch, bucket_seconds), bucket_seconds) # Integer division floors (epoch > 0)
+    grouped = table.append_column("bucket", bucket).group_by(["bucket", "sensor_id"]).aggregate([
+        ("temperature", "mean"), ("temperature", "min"), ("temperature", "max"),
+        ("humidity", "mean"), ("humidity", "min"), ("humidity", "max"),
+        ([], "count_all")
+    ]).sort_by([("bucket", "ascending"), ("sensor_id", "ascending")])
+
+    return [{
+        "timestamp": (EPOCH + timedelta(seconds=r["bucket"])).strftime(TIMESTAMP_FORMAT),
+        "sensor_id": r["sensor_id"],
+        "sensor_name": names.get(r["sensor_id"], "Unknown"),
+        "temperature": round(r["temperature_mean"], 2) if r["temperature_mean"] is not None else None,
+        "temp_min": r["temperature_min"],
+        "temp_max": r["temperature_max"],
+        "humidity": round(r["humidity_mean"], 2) if r["humidity_mean"] is not None else None,
+        "hum_min": r["humidity_min"],
+        "hum_max": r["humidity_max"],
+        "count": r["count_all"]
+    } for r in grouped.to_pylist()]
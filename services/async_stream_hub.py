@@ -0,0 +1,88 @@
+import time
+import asyncio
+from services.publisher import STREAM_CHANNEL
+from services.stream_hub import StreamClient, Coalescer, KEEPALIVE_SECONDS, parse_sensor_id
+
+class AsyncStreamClient(StreamClient):
+    """
+    StreamClient for the ASGI mode. Same bounded/coalescing buffer,
+    but consumers await an asyncio.Event instead of blocking a thread.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._event = asyncio.Event()
+
+    def push(self, sensor_id, raw):
+        super().push(sensor_id, raw)
+        self._event.set()
+
+    async def drain_async(self, timeout=KEEPALIVE_SECONDS):
+        if not self.depth():
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._event.clear()
+        return self.drain(timeout=0)
+
+_clients = set()
+_listener = None
+
+def _fan_out(sensor_id, raw):
+    for client in list(_clients):
+        client.push(sensor_id, raw)
+
+async def _listener_loop(aredis):
+    """Single redis.asyncio subscription per process (event loop), coalesced like the sync hub."""
+    print("📡 Async stream hub subscriber started.")
+    coalescer = Coalescer()
+    while True:
+        pubsub = aredis.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(STREAM_CHANNEL)
+            while True:
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True,
+                    timeout=coalescer.next_timeout(time.monotonic())
+                )
+                now = time.monotonic()
+                if message and message['type'] == 'message':
+                    sensor_id = parse_sensor_id(message['data'])
+                    raw = coalescer.offer(sensor_id, message['data'], now)
+                    if raw is not None:
+                        _fan_out(sensor_id, raw)
+                for sensor_id, raw in coalescer.due(now):
+                    _fan_out(sensor_id, raw)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Async stream hub subscriber error: {e}. Reconnecting...")
+            await asyncio.sleep(1)
+        finally:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+
+def register_client(aredis, sensor_ids=None):
+    """Attach a new SSE client. Must be called from the event loop."""
+    global _listener
+    client = AsyncStreamClient(sensor_ids=sensor_ids)
+    _clients.add(client)
+    if _listener is None or _listener.done():
+        _listener = asyncio.get_running_loop().create_task(_listener_loop(aredis))
+    return client
+
+def unregister_client(client):
+    _clients.discard(client)
+
+def get_stats():
+    clients = list(_clients)
+    return {
+        "clients": len(clients),
+        "listener_alive": bool(_listener and not _listener.done()),
+        "queued": sum(c.depth() for c in clients),
+        "max_depth": max((c.depth() for c in clients), default=0),
+        "dropped": sum(c.dropped for c in clients)
+    }
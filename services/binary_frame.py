@@ -0,0 +1,58 @@
+import struct
+
+# Binary ingest frame (network byte order, 15 bytes):
+#
+#   offset  size  field
+#   0       1     version (FRAME_VERSION)
+#   1       6     token id: the 12 hex digits of "key_xxxxxxxxxxxx" as raw bytes
+#   7       4     timestamp: uint32 epoch seconds, 0 = "now" (device without a clock)
+#   11      2     temperature: int16, °C x 100 (MISSING = not measured)
+#   13      2     humidity: int16, % x 100 (MISSING = not measured)
+#
+# A datagram carries one or more frames back to back. No imports beyond the
+# standard library, so devices' test tools can use this module directly.
+
+FRAME = struct.Struct("!B6sIhh")
+FRAME_SIZE = FRAME.size
+FRAME_VERSION = 1
+TOKEN_PREFIX = "key_"
+TOKEN_BYTES = 6
+SCALE = 100
+MISSING = -32768 # int16 minimum: no value
+
+def token_id(token):
+    """"key_0123456789ab" -> b"\\x01\\x23\\x45\\x67\\x89\\xab". Raises ValueError for other token shapes."""
+    if not token.startswith(TOKEN_PREFIX):
+        raise ValueError("Not an ESP32 token")
+    raw = bytes.fromhex(token[len(TOKEN_PREFIX):])
+    if len(raw) != TOKEN_BYTES:
+        raise ValueError("Not an ESP32 token")
+    return raw
+
+def token_from_id(raw):
+    return TOKEN_PREFIX + raw.hex()
+
+def _scale(value):
+    if value is None:
+        return MISSING
+    scaled = int(round(value * SCALE))
+    if not MISSING < scaled <= 32767:
+        raise ValueError(f"Value out of range: {value}")
+    return scaled
+
+def _unscale(value):
+    return None if value == MISSING else value / SCALE
+
+def encode_frame(token, temperature=None, humidity=None, timestamp=0):
+    return FRAME.pack(FRAME_VERSION, token_id(token), int(timestamp), _scale(temperature), _scale(humidity))
+
+def decode_frames(buffer):
+    """
+    Decode back-to-back frames from a bytes-like buffer in one pass.
+    Yields (version, token, timestamp or None, temperature, humidity).
+    Raises ValueError if the buffer isn't a whole number of frames.
+    """
+    if len(buffer) % FRAME_SIZE:
+        raise ValueError(f"Buffer of {len(buffer)} bytes is not a multiple of {FRAME_SIZE}")
+    for version, raw, timestamp, temperature, humidity in FRAME.iter_unpack(buffer):
+        yield version, token_from_id(raw), timestamp or None, _unscale(temperature), _unscale(humidity)
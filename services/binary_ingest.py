@@ -0,0 +1,125 @@
+import os
+import time
+import socket
+import threading
+from datetime import datetime
+from models.db import redis_client
+from services.binary_frame import FRAME_VERSION, FRAME_SIZE, decode_frames
+from services.ingest import parse_timestamp, build_sensor_data
+from services.token_cache import resolve_token
+from services.publisher import publish_updates
+from services.metrics import Counter, Timer, INGEST_TOKEN, INGEST_TOTAL, INGEST_READINGS
+
+# UDP listener for the binary frame protocol (services/binary_frame.py).
+# Datagrams are buffered for up to BINARY_BATCH_MS (or BINARY_BATCH_FRAMES),
+# decoded in one struct pass and published through the same pipeline as
+# /api/ingest: token cache -> publish_updates() -> sensors:current, the live
+# stream and the raw streams. UDP has no delivery guarantee; devices that
+# need one keep using /api/ingest/batch.
+
+# --- CONFIG ---
+BINARY_INGEST_PORT = int(os.getenv('BINARY_INGEST_PORT', 0)) # UDP port, 0 = disabled
+BINARY_INGEST_HOST = os.getenv('BINARY_INGEST_HOST', '0.0.0.0')
+BINARY_BATCH_MS = int(os.getenv('BINARY_BATCH_MS', 50)) # Max time a frame waits to be published
+BINARY_BATCH_FRAMES = 1000 # Publish early once this many frames are waiting
+MAX_DATAGRAM = 65535
+
+FRAMES = Counter("binary_frames_total", "Binary ingest frames by outcome.", ("result",))
+_accepted = FRAMES.labels("accepted")
+_rejected = FRAMES.labels("rejected") # Unknown token, bad version/timestamp, no values
+_malformed = FRAMES.labels("malformed") # Datagrams that are not whole frames (counted per datagram)
+
+def process_frames(buffer, now=None, publish=publish_updates):
+    """
+    Decode a buffer of frames and publish the valid readings in one call.
+    Returns (accepted, rejected).
+    """
+    now = now or datetime.now()
+    sensors = {}
+    accepted = []
+    rejected = 0
+    for version, token, timestamp, temperature, humidity in decode_frames(buffer):
+        try:
+            if version != FRAME_VERSION:
+                raise ValueError("Unsupported frame version")
+            if temperature is None and humidity is None:
+                raise ValueError("Missing temperature and humidity")
+            if token not in sensors:
+                with Timer(INGEST_TOKEN):
+                    sensors[token] = resolve_token(token)
+            sensor = sensors[token]
+            if not sensor:
+                raise ValueError("Invalid Token")
+            reading = {"temperature": temperature, "humidity": humidity, "timestamp": parse_timestamp(timestamp, now)}
+            accepted.append((sensor, reading))
+        except ValueError:
+            rejected += 1
+
+    if accepted:
+        accepted.sort(key=lambda pair: pair[1]["timestamp"]) # Chronological order on the live and raw streams
+        publish([build_sensor_data(sensor, reading) for sensor, reading in accepted])
+    _accepted.inc(len(accepted))
+    _rejected.inc(rejected)
+    INGEST_READINGS.inc(len(accepted))
+    return len(accepted), rejected
+
+def open_socket(host=BINARY_INGEST_HOST, port=BINARY_INGEST_PORT):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if hasattr(socket, "SO_REUSEPORT"):
+        # Every Gunicorn/uvicorn worker binds the port; the kernel spreads datagrams between them
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024) # Absorb bursts while a batch publishes
+    sock.bind((host, port))
+    return sock
+
+def _listener_loop(sock, stop=None):
+    print(f"📶 Binary ingest listening on udp://{sock.getsockname()[0]}:{sock.getsockname()[1]}")
+    window = BINARY_BATCH_MS / 1000
+    buffer = bytearray()
+    flush_at = None
+    while not (stop and stop.is_set()):
+        sock.settimeout(max(flush_at - time.monotonic(), 0.001) if flush_at else 1.0)
+        try:
+            data = sock.recv(MAX_DATAGRAM)
+            if not data or len(data) % FRAME_SIZE:
+                _malformed.inc()
+            else:
+                if not buffer:
+                    flush_at = time.monotonic() + window
+                buffer += data
+        except socket.timeout:
+            pass
+        except OSError as e:
+            print(f"❌ Binary ingest socket error: {e}")
+            time.sleep(1)
+            continue
+
+        if buffer and (len(buffer) >= BINARY_BATCH_FRAMES * FRAME_SIZE or time.monotonic() >= flush_at):
+            started = time.perf_counter()
+            try:
+                process_frames(bytes(buffer))
+                INGEST_TOTAL.observe(time.perf_counter() - started)
+            except Exception as e:
+                print(f"❌ Binary ingest error: {e}")
+            buffer.clear()
+            flush_at = None
+
+def start_binary_listener(stop=None, port=BINARY_INGEST_PORT):
+    """Start the UDP listener in a background thread (no-op if disabled or without Redis)."""
+    if not port or not redis_client:
+        return None
+    try:
+        sock = open_socket(port=port)
+    except OSError as e:
+        print(f"⚠️ Binary ingest disabled, cannot bind UDP port {port}: {e}")
+        return None
+    t = threading.Thread(target=_listener_loop, args=(sock, stop), daemon=True)
+    t.start()
+    return t
+
+if __name__ == "__main__":
+    # Standalone listener: BINARY_INGEST_PORT=5683 python -m services.binary_ingest
+    if not BINARY_INGEST_PORT:
+        print("❌ Set BINARY_INGEST_PORT.")
+    else:
+        _listener_loop(open_socket())
@@ -0,0 +1,72 @@
+import io
+import os
+from sqlalchemy import insert
+from models.sql_models import SensorReading
+from models.partitions import readings_partitioned, ensure_partitions, forget_partitions
+
+# --- CONFIG ---
+BULK_INSERT_BATCH_SIZE = int(os.getenv('BULK_INSERT_BATCH_SIZE', 5000)) # Rows per executemany/COPY statement
+
+COPY_COLUMNS = ("sensor_id", "timestamp", "temperature", "humidity")
+
+def _batches(rows, size):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+def _copy_value(value):
+    if value is None:
+        return "\\N"
+    if hasattr(value, "isoformat"):
+        return value.isoformat(sep=" ")
+    return str(value)
+
+def _copy_batch(dbapi_conn, batch):
+    """COPY ... FROM STDIN (text format) with psycopg 3 or psycopg2."""
+    buffer = io.StringIO()
+    for row in batch:
+        buffer.write("\t".join(_copy_value(v) for v in row))
+        buffer.write("\n")
+    sql = f"COPY {SensorReading.__tablename__} ({', '.join(COPY_COLUMNS)}) FROM STDIN"
+
+    cursor = dbapi_conn.cursor()
+    try:
+        if hasattr(cursor, "copy"): # psycopg 3
+            with cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+        elif hasattr(cursor, "copy_expert"): # psycopg2
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+        else:
+            return False
+    finally:
+        cursor.close()
+    return True
+
+def bulk_insert_readings(session, rows, batch_size=BULK_INSERT_BATCH_SIZE):
+    """
+    Insert many readings without building ORM objects.
+
+    `rows` is a list of (sensor_id, timestamp, temperature, humidity).
+    PostgreSQL gets COPY FROM STDIN; everything else (and PostgreSQL drivers
+    without COPY support) gets a Core insert executed with executemany, in
+    batches of `batch_size`. Runs on the session's connection; the caller commits.
+    Returns the number of rows written.
+    """
+    if not rows:
+        return 0
+
+    conn = session.connection()
+    table = SensorReading.__table__
+    use_copy = conn.dialect.name == "postgresql"
+    try:
+        if use_copy and readings_partitioned(conn):
+            ensure_partitions(conn, {row[1] for row in rows}) # Monthly partitions for late/backfilled data too
+        for batch in _batches(rows, batch_size):
+            if use_copy and _copy_batch(conn.connection.dbapi_connection, batch):
+                continue
+            use_copy = False
+            conn.execute(insert(table), [dict(zip(COPY_COLUMNS, row)) for row in batch])
+    except Exception:
+        forget_partitions() # Partitions created in this transaction are gone after the rollback
+        raise
+    return len(rows)
@@ -0,0 +1,128 @@
+import os
+import csv
+import io
+import json
+import base64
+from datetime import datetime, timedelta
+from sqlalchemy import or_, and_
+from models.sql_models import SensorReading, Sensor
+from services.archive import archive_page
+
+# --- CONFIG ---
+EXPORT_PAGE_SIZE = int(os.getenv('EXPORT_PAGE_SIZE', 5000)) # Rows per keyset page (one short query each)
+EXPORT_YIELD_PER = 1000 # Rows fetched from the DB cursor at a time within a page
+EXPORT_CHUNK_BYTES = 64 * 1024 # Response body is written in pieces of about this size
+EXPORT_COLUMNS = ["timestamp", "sensor_id", "sensor_name", "temperature", "humidity"]
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def encode_cursor(timestamp, reading_id):
+    """Opaque keyset cursor for the last row of a page: (timestamp, id)."""
+    raw = f"{timestamp.isoformat()}|{reading_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor(). Raises ValueError on anything malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        ts, reading_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return datetime.fromisoformat(ts), int(reading_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+def _page_query(session, start, end, sensor_id, after, limit):
+    query = session.query(
+        SensorReading.id,
+        SensorReading.timestamp,
+        SensorReading.sensor_id,
+        Sensor.name,
+        SensorReading.temperature,
+        SensorReading.humidity
+    ).join(Sensor, Sensor.id == SensorReading.sensor_id)
+    query = query.filter(SensorReading.timestamp >= start, SensorReading.timestamp <= end)
+    if sensor_id:
+        query = query.filter(SensorReading.sensor_id == sensor_id)
+    if after:
+        after_ts, after_id = after
+        # Keyset: strictly after (timestamp, id), so pages never skip or repeat rows
+        query = query.filter(or_(
+            SensorReading.timestamp > after_ts,
+            and_(SensorReading.timestamp == after_ts, SensorReading.id > after_id)
+        ))
+    query = query.order_by(SensorReading.timestamp.asc(), SensorReading.id.asc()).limit(limit)
+    return query.execution_options(yield_per=EXPORT_YIELD_PER)
+
+def _row_dict(ts, sensor_id, name, temperature, humidity):
+    return {
+        "timestamp": ts.strftime(TIMESTAMP_FORMAT),
+        "sensor_id": sensor_id,
+        "sensor_name": name,
+        "temperature": temperature,
+        "humidity": humidity
+    }
+
+def history_page(session, start, end, sensor_id=None, after=None, limit=2000, cutoff=None):
+    """
+    One keyset page of raw readings strictly after `after` = (timestamp, id).
+    With `cutoff` (services/archive.hot_cutoff), [start, cutoff) comes from the
+    Parquet archive and the rest from the DB, under the same cursor.
+    Returns (rows, (timestamp, id) to continue after, or None on the last page).
+    """
+    rows = []
+    if cutoff is not None and start < cutoff and (after is None or after[0] < cutoff):
+        rows, last = archive_page(session, start, min(end, cutoff - timedelta(seconds=1)), sensor_id, after, limit)
+        if last or end < cutoff:
+            return rows, last
+        if len(rows) == limit:
+            return rows, (cutoff, 0) # Archive ended on the page boundary: the next page is the DB part
+        start, after, limit = cutoff, None, limit - len(rows)
+    page = _page_query(session, start, end, sensor_id, after, limit + 1).all()
+    last = None
+    if len(page) > limit:
+        page = page[:limit]
+        last = (page[-1][1], page[-1][0])
+    return rows + [_row_dict(*r[1:]) for r in page], last
+
+def iter_readings(session_factory, start, end, sensor_id=None, page_size=EXPORT_PAGE_SIZE, cutoff=None):
+    """
+    Every reading in the range, in (timestamp, id) order, one history_page() at a time
+    (archive first when `cutoff` is given). Each page uses its own short session, so a
+    long export never pins a transaction (or the SQLite write lock) and memory stays at one page.
+    """
+    after = None
+    while True:
+        session = session_factory()
+        try:
+            rows, after = history_page(session, start, end, sensor_id, after, page_size, cutoff)
+        finally:
+            session.close()
+        yield from rows
+        if after is None:
+            return
+
+def csv_chunks(rows):
+    """CSV text, header first, in ~EXPORT_CHUNK_BYTES pieces."""
+    buffer = io.StringIO()
+    buffer.write("\ufeff") # BOM so Excel picks UTF-8, like the old client-side export
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow([row[c] for c in EXPORT_COLUMNS])
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
+
+def ndjson_chunks(rows):
+    """One JSON object per line, in ~EXPORT_CHUNK_BYTES pieces."""
+    lines = []
+    size = 0
+    for row in rows:
+        line = json.dumps(row) + "\n"
+        lines.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            yield "".join(lines)
+            lines, size = [], 0
+    if lines:
+        yield "".join(lines)
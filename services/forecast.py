@@ -0,0 +1,325 @@
+import os
+import json
+from datetime import datetime, timedelta
+from redis.exceptions import WatchError
+from models.db import redis_client
+from models.sql_models import SensorReading, Sensor
+from services.history import EPOCH
+
+# --- CONFIG ---
+FORECAST_METHOD = os.getenv('FORECAST_METHOD', 'linear') # Default for /api/forecast: linear | holt_winters
+FORECAST_HALF_LIFE_HOURS = float(os.getenv('FORECAST_HALF_LIFE_HOURS', 6)) # Weight of a reading halves every N hours (trend model)
+FORECAST_WARMUP_HOURS = 48 # History replayed once for sensors without a model yet
+FORECAST_CACHE_TTL = int(os.getenv('FORECAST_CACHE_TTL', 60)) # Seconds an /api/forecast response is reused
+FORECAST_METHODS = ("linear", "holt_winters")
+FORECAST_MAX_POINTS = 168 # Instants per /api/forecast request (a week of hourly points)
+FORECAST_WATCH_RETRIES = 5 # Concurrent model updates tolerated before a batch is skipped
+METRICS = ("temperature", "humidity")
+MODEL_PREFIX = "sensors:forecast:model:"
+CACHE_PREFIX = "sensors:forecast:cache:"
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Holt-Winters (additive, daily season of 24 hourly slots)
+SEASON_LENGTH = 24
+HW_ALPHA = 0.3 # Level
+HW_BETA = 0.05 # Trend
+HW_GAMMA = 0.2 # Season
+HW_MIN_INIT_POINTS = 12 # Hourly means needed (spanning a full day) before the seasonal model is used
+
+def _hours(ts):
+    """Naive wall-clock datetime -> hours since EPOCH (same convention as the history buckets)."""
+    return (ts - EPOCH).total_seconds() / 3600
+
+class TrendModel:
+    """
+    Exponentially weighted least squares line, kept as five running sums.
+    x is measured in hours relative to the newest reading, so the sums stay
+    small; moving the anchor forward shifts and decays them in O(1).
+    """
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.t = state.get("t") # Anchor (hours), newest reading seen
+        self.s0 = state.get("s0", 0.0)
+        self.sx = state.get("sx", 0.0)
+        self.sy = state.get("sy", 0.0)
+        self.sxx = state.get("sxx", 0.0)
+        self.sxy = state.get("sxy", 0.0)
+
+    def to_dict(self):
+        return {"t": self.t, "s0": self.s0, "sx": self.sx, "sy": self.sy, "sxx": self.sxx, "sxy": self.sxy}
+
+    def update(self, t, y, half_life=FORECAST_HALF_LIFE_HOURS):
+        if self.t is None:
+            self.t = t
+        if t > self.t:
+            d = t - self.t
+            # Re-anchor: every stored x becomes x - d, then everything decays by d hours
+            self.sxx += d * d * self.s0 - 2 * d * self.sx
+            self.sxy -= d * self.sy
+            self.sx -= d * self.s0
+            decay = 0.5 ** (d / half_life)
+            self.s0 *= decay
+            self.sx *= decay
+            self.sy *= decay
+            self.sxx *= decay
+            self.sxy *= decay
+            self.t = t
+        x = t - self.t # <= 0 for late readings, which count with their age's weight
+        w = 0.5 ** (-x / half_life)
+        self.s0 += w
+        self.sx += w * x
+        self.sy += w * y
+        self.sxx += w * x * x
+        self.sxy += w * x * y
+
+    def slope(self):
+        """Units per hour (0 until there are two distinct timestamps)."""
+        denom = self.s0 * self.sxx - self.sx * self.sx
+        if denom <= 1e-12 * max(self.s0 * self.sxx, 1.0):
+            return 0.0
+        return (self.s0 * self.sxy - self.sx * self.sy) / denom
+
+    def predict(self, t):
+        if not self.s0:
+            return None
+        slope = self.slope()
+        intercept = (self.sy - slope * self.sx) / self.s0
+        return intercept + slope * (t - self.t)
+
+class SeasonalModel:
+    """
+    Additive Holt-Winters over hourly means with a 24-slot daily season.
+    Readings are summed into the current hour (O(1)); the smoothing step runs
+    once per closed hour. Readings older than the open hour are ignored.
+    """
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.hour = state.get("hour") # Hour index currently being accumulated
+        self.acc_sum = state.get("acc_sum", 0.0)
+        self.acc_n = state.get("acc_n", 0)
+        self.last = state.get("last") # Hour index of the last smoothing step
+        self.level = state.get("level")
+        self.trend = state.get("trend", 0.0)
+        self.season = state.get("season") or [0.0] * SEASON_LENGTH
+        self.init = state.get("init", []) # [hour, mean] pairs until the first full day
+
+    def to_dict(self):
+        return {
+            "hour": self.hour, "acc_sum": self.acc_sum, "acc_n": self.acc_n, "last": self.last,
+            "level": self.level, "trend": self.trend, "season": self.season, "init": self.init
+        }
+
+    @property
+    def ready(self):
+        return self.level is not None
+
+    def update(self, t, y):
+        hour = int(t)
+        if self.hour is None:
+            self.hour = hour
+        if hour < self.hour:
+            return
+        if hour > self.hour:
+            self._close()
+            self.hour = hour
+        self.acc_sum += y
+        self.acc_n += 1
+
+    def _close(self):
+        if not self.acc_n:
+            return
+        mean = self.acc_sum / self.acc_n
+        self.acc_sum, self.acc_n = 0.0, 0
+        if self.ready:
+            self._step(self.hour, mean)
+            return
+
+        self.init.append([self.hour, mean])
+        first = self.init[0][0]
+        if self.hour - first >= SEASON_LENGTH - 1 and len(self.init) >= HW_MIN_INIT_POINTS:
+            self.level = sum(v for _, v in self.init) / len(self.init)
+            slots = {}
+            for h, v in self.init:
+                slots.setdefault(h % SEASON_LENGTH, []).append(v - self.level)
+            self.season = [sum(slots[s]) / len(slots[s]) if s in slots else 0.0 for s in range(SEASON_LENGTH)]
+            self.trend = 0.0
+            self.last = self.hour
+            self.init = []
+
+    def _step(self, hour, y):
+        k = max(hour - self.last, 1) # Hours since the previous step (gaps advance the trend)
+        slot = hour % SEASON_LENGTH
+        previous = self.level
+        self.level = HW_ALPHA * (y - self.season[slot]) + (1 - HW_ALPHA) * (previous + k * self.trend)
+        self.trend = HW_BETA * (self.level - previous) / k + (1 - HW_BETA) * self.trend
+        self.season[slot] = HW_GAMMA * (y - self.level) + (1 - HW_GAMMA) * self.season[slot]
+        self.last = hour
+
+    def predict(self, t):
+        if not self.ready:
+            return None
+        hour = int(t)
+        return self.level + (hour - self.last) * self.trend + self.season[hour % SEASON_LENGTH]
+
+class SensorModel:
+    """Trend + seasonal model per metric for one sensor (JSON-serialisable)."""
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.samples = state.get("samples", 0)
+        self.metrics = {
+            m: (TrendModel(state.get(m, {}).get("trend")), SeasonalModel(state.get(m, {}).get("seasonal")))
+            for m in METRICS
+        }
+
+    def to_dict(self):
+        state = {"samples": self.samples}
+        for m, (trend, seasonal) in self.metrics.items():
+            state[m] = {"trend": trend.to_dict(), "seasonal": seasonal.to_dict()}
+        return state
+
+    def update(self, ts, temperature, humidity):
+        t = _hours(ts)
+        for m, value in (("temperature", temperature), ("humidity", humidity)):
+            if value is None:
+                continue
+            trend, seasonal = self.metrics[m]
+            trend.update(t, value)
+            seasonal.update(t, value)
+        self.samples += 1
+
+    def predict(self, metric, ts, method):
+        """(value, method actually used). Holt-Winters falls back to linear until it has a full day."""
+        trend, seasonal = self.metrics[metric]
+        t = _hours(ts)
+        if method == "holt_winters" and seasonal.ready:
+            return seasonal.predict(t), "holt_winters"
+        return trend.predict(t), "linear"
+
+def model_key(sensor_id):
+    return f"{MODEL_PREFIX}{sensor_id}"
+
+def load_model(sensor_id, client=None):
+    client = client or redis_client
+    raw = client.get(model_key(sensor_id)) if client else None
+    return SensorModel(json.loads(raw)) if raw else None
+
+def _apply(client, sensor_id, readings):
+    """
+    Fold readings into one sensor's stored model (optimistic WATCH/MULTI).
+    Raises WatchError if the model kept changing for FORECAST_WATCH_RETRIES attempts.
+    """
+    key = model_key(sensor_id)
+    for _ in range(FORECAST_WATCH_RETRIES):
+        with client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                raw = pipe.get(key)
+                model = SensorModel(json.loads(raw) if raw else None)
+                for ts, temperature, humidity in readings:
+                    model.update(ts, temperature, humidity)
+                pipe.multi()
+                pipe.set(key, json.dumps(model.to_dict()))
+                pipe.execute()
+                return
+            except WatchError:
+                continue
+    raise WatchError(f"{key} changed on every attempt")
+
+def update_models(rows, client=None):
+    """
+    Fold persisted readings into the per-sensor models (O(1) per reading).
+    `rows` is a list of (sensor_id, timestamp, temperature, humidity).
+    Called after the history commit; errors are logged, never raised.
+    """
+    client = client or redis_client
+    if not client or not rows:
+        return
+    by_sensor = {}
+    for sensor_id, ts, temperature, humidity in sorted(rows, key=lambda r: r[1]):
+        by_sensor.setdefault(sensor_id, []).append((ts, temperature, humidity))
+    for sensor_id, readings in by_sensor.items():
+        try:
+            _apply(client, sensor_id, readings)
+        except WatchError:
+            print(f"⚠️ Forecast model for sensor {sensor_id} kept changing concurrently, skipped this batch")
+        except Exception as e:
+            print(f"⚠️ Error updating forecast model for sensor {sensor_id}: {e}")
+
+def warm_up(session, now=None, client=None):
+    """Replay the last FORECAST_WARMUP_HOURS of history for sensors without a model. Returns sensors built."""
+    client = client or redis_client
+    if not client:
+        return 0
+    now = now or datetime.now()
+    built = 0
+    for (sensor_id,) in session.query(Sensor.id).filter_by(active=True).all():
+        if client.exists(model_key(sensor_id)):
+            continue
+        query = session.query(SensorReading.timestamp, SensorReading.temperature, SensorReading.humidity).filter(
+            SensorReading.sensor_id == sensor_id,
+            SensorReading.timestamp >= now - timedelta(hours=FORECAST_WARMUP_HOURS)
+        ).order_by(SensorReading.timestamp.asc()).execution_options(yield_per=10000)
+        model = SensorModel()
+        for ts, temperature, humidity in query:
+            model.update(ts, temperature, humidity)
+        if model.samples:
+            client.set(model_key(sensor_id), json.dumps(model.to_dict()))
+            built += 1
+    return built
+
+def _round(value):
+    return round(value, 2) if value is not None else None
+
+def forecast(sensors, times, method=FORECAST_METHOD, client=None):
+    """
+    Predictions for `sensors` [(id, name)] at each datetime in `times`.
+    Sensors without a model yet are reported with "samples": 0 and null values.
+    """
+    results = []
+    for sensor_id, name in sensors:
+        model = load_model(sensor_id, client)
+        entry = {"sensor_id": sensor_id, "sensor_name": name, "samples": 0, "method": None,
+                 "trend_per_hour": {}, "points": []}
+        if model:
+            entry["samples"] = model.samples
+            entry["trend_per_hour"] = {m: _round(model.metrics[m][0].slope()) for m in METRICS}
+            for ts in times:
+                point = {"timestamp": ts.strftime(TIMESTAMP_FORMAT)}
+                for m in METRICS:
+                    value, used = model.predict(m, ts, method)
+                    point[m] = _round(value)
+                    entry["method"] = used
+                entry["points"].append(point)
+        results.append(entry)
+    return results
+
+def cache_key(sensor_id, method, times):
+    stamps = ",".join(ts.strftime("%Y%m%d%H%M") for ts in times)
+    return f"{CACHE_PREFIX}{sensor_id or 'all'}:{method}:{stamps}"
+
+def get_forecast(session, times, sensor_id=None, method=FORECAST_METHOD):
+    """forecast() for the active sensors (or one), cached for FORECAST_CACHE_TTL. Returns (result, cached)."""
+    times = [ts.replace(second=0, microsecond=0) for ts in times]
+    key = cache_key(sensor_id, method, times)
+    if redis_client:
+        try:
+            cached = redis_client.get(key)
+            if cached:
+                return json.loads(cached), True
+        except Exception as e:
+            print(f"⚠️ Forecast cache read failed: {e}")
+
+    query = session.query(Sensor.id, Sensor.name).filter_by(active=True)
+    if sensor_id:
+        query = query.filter(Sensor.id == sensor_id)
+    result = {"method": method, "sensors": forecast(query.order_by(Sensor.id).all(), times, method)}
+
+    if redis_client:
+        try:
+            redis_client.set(key, json.dumps(result), ex=FORECAST_CACHE_TTL)
+        except Exception as e:
+            print(f"⚠️ Forecast cache write failed: {e}")
+    return result, False
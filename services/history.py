@@ -0,0 +1,174 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func, cast, Integer
+from models.sql_models import SensorReading, Sensor
+
+# --- CONFIG ---
+BUCKETS = {
+    "1m": 60,
+    "5m": 5 * 60,
+    "15m": 15 * 60,
+    "1h": 60 * 60,
+    "6h": 6 * 60 * 60,
+    "1d": 24 * 60 * 60,
+}
+MAX_POINTS_LIMIT = 5000 # Upper bound for ?max_points
+LTTB_RAW_LIMIT = 200_000 # Above this many raw rows, LTTB runs over fine-grained buckets instead
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+EPOCH = datetime(1970, 1, 1)
+
+def _dialect(session):
+    return session.get_bind().dialect.name
+
+def epoch_expression(dialect):
+    """SQL expression for the reading timestamp in epoch seconds (naive wall clock, like EPOCH)."""
+    if dialect == "postgresql":
+        return func.extract("epoch", SensorReading.timestamp)
+    # SQLite: strftime('%s') -> integer seconds
+    return cast(func.strftime("%s", SensorReading.timestamp), Integer)
+
+def bucket_expression(dialect, seconds):
+    """
+    SQL expression for the start of the time bucket (epoch seconds, naive/local time).
+    Timestamps are stored naive, so bucket boundaries follow the stored wall clock.
+    """
+    epoch = epoch_expression(dialect)
+    if dialect == "postgresql":
+        return func.floor(epoch / seconds) * seconds
+    # SQLite: integer division floors
+    return epoch.op("/")(seconds) * seconds
+
+def _filtered(query, start, end, sensor_id):
+    query = query.filter(SensorReading.timestamp >= start, SensorReading.timestamp <= end)
+    if sensor_id:
+        query = query.filter(SensorReading.sensor_id == sensor_id)
+    return query
+
+def aggregate_history(session, start, end, bucket_seconds, sensor_id=None):
+    """
+    min/max/avg/count per sensor per time bucket, computed with GROUP BY in SQL.
+    `temperature`/`humidity` carry the bucket average so the charts can use the rows as-is.
+    """
+    bucket = bucket_expression(_dialect(session), bucket_seconds).label("bucket")
+    query = session.query(
+        bucket,
+        SensorReading.sensor_id,
+        Sensor.name,
+        func.avg(SensorReading.temperature),
+        func.min(SensorReading.temperature),
+        func.max(SensorReading.temperature),
+        func.avg(SensorReading.humidity),
+        func.min(SensorReading.humidity),
+        func.max(SensorReading.humidity),
+        func.count(SensorReading.id)
+    ).join(Sensor, Sensor.id == SensorReading.sensor_id)
+
+    query = _filtered(query, start, end, sensor_id)
+    rows = query.group_by(bucket, SensorReading.sensor_id, Sensor.name).order_by(bucket, SensorReading.sensor_id).all()
+
+    return [{
+        "timestamp": (EPOCH + timedelta(seconds=int(b))).strftime(TIMESTAMP_FORMAT),
+        "sensor_id": sid,
+        "sensor_name": name,
+        "temperature": _round(t_avg),
+        "temp_min": t_min,
+        "temp_max": t_max,
+        "humidity": _round(h_avg),
+        "hum_min": h_min,
+        "hum_max": h_max,
+        "count": count
+    } for b, sid, name, t_avg, t_min, t_max, h_avg, h_min, h_max, count in rows]
+
+def _round(value, digits=2):
+    return round(float(value), digits) if value is not None else None
+
+def lttb(points, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+    `points` is a list of (x, y) sorted by x. Returns the indices of the kept points.
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(range(n)) if threshold >= n else list(range(min(n, threshold)))
+
+    selected = [0]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket (the third triangle vertex)
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        span = points[next_start:next_end] or [points[-1]]
+        avg_x = sum(p[0] for p in span) / len(span)
+        avg_y = sum(p[1] for p in span) / len(span)
+
+        # Pick the point of the current bucket with the largest triangle area
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        ax, ay = points[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+
+    selected.append(n - 1)
+    return selected
+
+def _lttb_indices(rows, key, threshold):
+    series = [(i, r) for i, r in enumerate(rows) if r[key] is not None]
+    if not series:
+        return set()
+    points = [(r["_x"], r[key]) for _, r in series]
+    return {series[k][0] for k in lttb(points, threshold)}
+
+def downsample_history(session, start, end, max_points, sensor_id=None):
+    """
+    Bounded, representative series: at most `max_points` rows per sensor, chosen
+    with LTTB (half of the budget for temperature, half for humidity, merged).
+    Very large ranges are first pre-aggregated into fine buckets in SQL.
+    """
+    total = _filtered(session.query(func.count(SensorReading.id)), start, end, sensor_id).scalar() or 0
+    if total > LTTB_RAW_LIMIT:
+        span = max(1, int((end - start).total_seconds()))
+        rows = aggregate_history(session, start, end, max(1, span // (max_points * 10)), sensor_id)
+    else:
+        query = session.query(
+            SensorReading.timestamp,
+            SensorReading.sensor_id,
+            Sensor.name,
+            SensorReading.temperature,
+            SensorReading.humidity
+        ).join(Sensor, Sensor.id == SensorReading.sensor_id)
+        query = _filtered(query, start, end, sensor_id).order_by(SensorReading.timestamp.asc())
+        rows = [{
+            "timestamp": ts.strftime(TIMESTAMP_FORMAT),
+            "sensor_id": sid,
+            "sensor_name": name,
+            "temperature": temp,
+            "humidity": hum,
+            "_x": ts.timestamp()
+        } for ts, sid, name, temp, hum in query]
+
+    return downsample_rows(rows, max_points)
+
+def downsample_rows(rows, max_points):
+    """LTTB over already-loaded history rows (raw, bucketed or rollup), per sensor."""
+    per_sensor = {}
+    for r in rows:
+        if "_x" not in r:
+            r["_x"] = datetime.strptime(r["timestamp"], TIMESTAMP_FORMAT).timestamp()
+        per_sensor.setdefault(r["sensor_id"], []).append(r)
+
+    result = []
+    half = max(3, max_points // 2)
+    for sensor_rows in per_sensor.values():
+        keep = _lttb_indices(sensor_rows, "temperature", half) | _lttb_indices(sensor_rows, "humidity", half)
+        result.extend(sensor_rows[i] for i in sorted(keep))
+
+    for r in rows:
+        r.pop("_x", None)
+    result.sort(key=lambda r: r["timestamp"])
+    return result
@@ -0,0 +1,127 @@
+import os
+from datetime import datetime, timedelta
+
+# --- CONFIG ---
+MAX_BATCH_READINGS = int(os.getenv('MAX_BATCH_READINGS', 1000))
+MAX_FUTURE_SKEW = timedelta(minutes=5) # Device clocks slightly ahead are tolerated
+MIN_VALID_TIMESTAMP = datetime(2020, 1, 1) # Anything older means the device never synced NTP
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def parse_timestamp(value, now=None):
+    """
+    Accepts epoch seconds (int/float) or "%Y-%m-%d %H:%M:%S".
+    Missing values default to `now`. Raises ValueError on anything else.
+    """
+    now = now or datetime.now()
+    if value is None:
+        return now
+
+    if isinstance(value, bool):
+        raise ValueError("Invalid timestamp")
+    if isinstance(value, (int, float)):
+        try:
+            ts = datetime.fromtimestamp(value)
+        except (OverflowError, OSError, ValueError): # 1e20, inf, nan: not a time at all
+            raise ValueError("Invalid timestamp")
+    elif isinstance(value, str):
+        ts = datetime.strptime(value, TIMESTAMP_FORMAT)
+    else:
+        raise ValueError("Invalid timestamp")
+
+    if ts < MIN_VALID_TIMESTAMP:
+        raise ValueError("Timestamp too old (is the device clock synced?)")
+    if ts > now + MAX_FUTURE_SKEW:
+        raise ValueError("Timestamp in the future")
+    return ts
+
+def _parse_number(value, field):
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"Invalid {field}")
+    return float(value)
+
+def parse_reading(item, now=None):
+    """
+    Validate a single reading object.
+    Returns {"temperature", "humidity", "timestamp"} or raises ValueError.
+    """
+    if not isinstance(item, dict):
+        raise ValueError("Reading must be an object")
+
+    temperature = _parse_number(item.get("temperature"), "temperature")
+    humidity = _parse_number(item.get("humidity"), "humidity")
+    if temperature is None and humidity is None:
+        raise ValueError("Missing temperature and humidity")
+
+    return {
+        "temperature": temperature,
+        "humidity": humidity,
+        "timestamp": parse_timestamp(item.get("timestamp"), now)
+    }
+
+def parse_batch(payload, resolve, now=None):
+    """
+    Validate a bulk payload in one pass.
+
+    Payload: {"token": "...", "readings": [{"timestamp", "temperature", "humidity", "token"?}, ...]}
+    A per-reading "token" overrides the top-level one, so one request can carry many devices.
+    `resolve` maps a token to {"id", "name"} or None; each distinct token is resolved once.
+
+    Returns (accepted, rejected) where accepted is a list of (sensor, reading)
+    sorted by timestamp and rejected is a list of {"index", "error"}.
+    """
+    if not isinstance(payload, dict) or not isinstance(payload.get("readings"), list):
+        raise ValueError("Payload must be an object with a 'readings' array")
+
+    readings = payload["readings"]
+    if len(readings) > MAX_BATCH_READINGS:
+        raise ValueError(f"Too many readings (max {MAX_BATCH_READINGS})")
+
+    now = now or datetime.now()
+    default_token = payload.get("token")
+    sensors = {}
+    accepted = []
+    rejected = []
+
+    for index, item in enumerate(readings):
+        try:
+            token = item.get("token", default_token) if isinstance(item, dict) else default_token
+            if not token or not isinstance(token, str):
+                raise ValueError("Missing token")
+
+            if token not in sensors:
+                sensors[token] = resolve(token)
+            sensor = sensors[token]
+            if not sensor:
+                raise ValueError("Invalid Token")
+
+            accepted.append((sensor, parse_reading(item, now)))
+        except ValueError as e:
+            rejected.append({"index": index, "error": str(e)})
+
+    accepted.sort(key=lambda pair: pair[1]["timestamp"])
+    return accepted, rejected
+
+def collect_tokens(payload):
+    """Distinct tokens referenced by a bulk payload (for resolving them up front)."""
+    if not isinstance(payload, dict) or not isinstance(payload.get("readings"), list):
+        return set()
+    default_token = payload.get("token")
+    tokens = set()
+    for item in payload["readings"][:MAX_BATCH_READINGS]:
+        token = item.get("token", default_token) if isinstance(item, dict) else default_token
+        if isinstance(token, str) and token:
+            tokens.add(token)
+    return tokens
+
+def build_sensor_data(sensor, reading):
+    """Shape stored in sensors:current and sent to SSE clients."""
+    return {
+        "temperature": reading.get("temperature"),
+        "humidity": reading.get("humidity"),
+        "sensor_id": sensor["id"],
+        "sensor_name": sensor["name"],
+        "timestamp": reading["timestamp"].strftime(TIMESTAMP_FORMAT)
+    }
@@ -0,0 +1,464 @@
+import os
+import json
+import time
+import socket
+import threading
+from bisect import bisect_left
+from redis.exceptions import WatchError
+from models.db import redis_client
+
+# Prometheus-style instrumentation without a client library.
+# Each process keeps its own counters/histograms (one lock acquire per
+# observation, well under 1µs; an ingest request takes a single lock for all
+# its stages, see IngestTrace) and flushes a JSON snapshot to a Redis hash
+# every METRICS_FLUSH_SECONDS; /metrics merges the snapshots of every process
+# (Gunicorn workers, nodes), so scrapes see the whole deployment. Counters of
+# processes that stopped flushing are kept in a "retired" snapshot, so the
+# merged counters never go down.
+
+# --- CONFIG ---
+METRICS_PREFIX = "sensorhub_"
+METRICS_KEY = "sensors:metrics:procs" # Hash: process id -> {"ts", "metrics"}
+METRICS_RETIRED_KEY = "sensors:metrics:retired" # Counters/histograms of dead processes, merged into one snapshot
+METRICS_FLUSH_SECONDS = int(os.getenv('METRICS_FLUSH_SECONDS', 5))
+METRICS_STALE_SECONDS = 3 * METRICS_FLUSH_SECONDS # Snapshots older than this belong to dead processes
+METRICS_RETIRE_RETRIES = 5 # WATCH conflicts tolerated before retiring is left to the next scrape
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+QUERY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TASK_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+ROW_BUCKETS = (0, 10, 100, 500, 1000, 2000, 5000, 10000, 50000, 100000)
+
+_registry = {} # name -> metric
+_registry_lock = threading.Lock()
+_flusher = None
+_flush_lock = threading.Lock()
+_flushed = None # Last snapshot this process flushed
+_base = None # Its values already counted in METRICS_RETIRED_KEY (subtracted from later flushes)
+_started = int(time.time())
+
+# Write the snapshot unless the process's entry was retired after an earlier flush (ARGV[3] = "1" on the first one)
+FLUSH_SCRIPT = ("if ARGV[3] == '1' or redis.call('hexists', KEYS[1], ARGV[1]) == 1 then "
+                "redis.call('hset', KEYS[1], ARGV[1], ARGV[2]) return 1 end return 0")
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count", "lock")
+
+    def __init__(self, bounds, lock=None):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1) # Last slot: above the highest bound (+Inf)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = lock or threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.bounds, value) # Prometheus buckets are "le" (value <= bound)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {"counts": list(self.counts), "sum": self.sum, "count": self.count}
+
+class _CounterChild:
+    __slots__ = ("value", "lock")
+
+    def __init__(self, lock=None):
+        self.value = 0.0
+        self.lock = lock or threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def snapshot(self):
+        with self.lock:
+            return self.value
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=(), lock=None):
+        self.name = METRICS_PREFIX + name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._child_lock = lock # Shared by every child when given (metrics updated together)
+        self._children = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry[self.name] = self
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Child for these label values (create once, keep a reference on hot paths)."""
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def snapshot(self):
+        return {
+            "type": self.kind, "help": self.help, "labelnames": list(self.labelnames),
+            "series": [[list(k), c.snapshot()] for k, c in list(self._children.items())]
+        }
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild(self._child_lock)
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS, lock=None):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help_text, labelnames, lock)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets, self._child_lock)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def snapshot(self):
+        snap = super().snapshot()
+        snap["buckets"] = list(self.buckets)
+        return snap
+
+class Gauge(_Metric):
+    """Read at snapshot time from `callback` (a number, or {label value tuple: number})."""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, callback, labelnames=(), merge="sum"):
+        self.callback = callback
+        self.merge = merge # How processes combine: "sum" or "max"
+        super().__init__(name, help_text, labelnames)
+
+    def snapshot(self):
+        try:
+            value = self.callback()
+        except Exception:
+            value = {}
+        if not isinstance(value, dict):
+            value = {(): value}
+        return {
+            "type": self.kind, "help": self.help, "labelnames": list(self.labelnames), "merge": self.merge,
+            "series": [[list(k), v] for k, v in value.items()]
+        }
+
+class Timer:
+    """`with Timer(HISTOGRAM_CHILD):` observes the elapsed seconds."""
+    __slots__ = ("child", "start")
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.start)
+        return False
+
+class IngestTrace:
+    """
+    Stage timings of one ingest request: one perf_counter() per stage
+    (`trace.token = trace.lap()`) and one locked append at the end (record()).
+    Recorded traces are folded into the ingest series every INGEST_FOLD_SIZE
+    requests and before each snapshot. Stages left at None are not observed.
+    """
+    __slots__ = ("start", "last", "token", "encode", "redis")
+
+    def __init__(self):
+        self.start = self.last = time.perf_counter()
+        self.token = self.encode = self.redis = None
+
+    def lap(self):
+        """Seconds since the previous lap (or the start)."""
+        now = time.perf_counter()
+        elapsed = now - self.last
+        self.last = now
+        return elapsed
+
+    def record(self, readings=0, total=True):
+        """Queue the stages (and the total, start to last lap) and the accepted readings count."""
+        entry = (self.token, self.encode, self.redis, self.last - self.start if total else None, readings)
+        with _ingest_lock:
+            _ingest_pending.append(entry)
+            if len(_ingest_pending) >= INGEST_FOLD_SIZE:
+                _fold_ingest()
+
+def _fold_ingest():
+    """Add the queued IngestTraces to the ingest histogram and counter (caller holds _ingest_lock)."""
+    if not _ingest_pending:
+        return
+    bounds = INGEST_SECONDS.buckets
+    for stage, child in enumerate((INGEST_TOKEN, INGEST_ENCODE, INGEST_REDIS, INGEST_TOTAL)):
+        counts = child.counts
+        added = 0
+        total = 0.0
+        for entry in _ingest_pending:
+            value = entry[stage]
+            if value is not None:
+                counts[bisect_left(bounds, value)] += 1
+                total += value
+                added += 1
+        child.sum += total
+        child.count += added
+    _ingest_readings.value += sum(entry[4] for entry in _ingest_pending)
+    _ingest_pending.clear()
+
+# --- METRICS ---
+INGEST_FOLD_SIZE = 256 # Recorded ingest requests queued before they are added to the series
+_ingest_lock = threading.Lock() # One acquire per ingest request for all the series below
+_ingest_pending = [] # IngestTrace.record() entries not folded in yet
+INGEST_SECONDS = Histogram("ingest_seconds", "Ingest latency by stage (Redis write and publish share one pipelined round trip).", ("stage",), lock=_ingest_lock)
+INGEST_TOKEN = INGEST_SECONDS.labels("token_lookup")
+INGEST_ENCODE = INGEST_SECONDS.labels("encode")
+INGEST_REDIS = INGEST_SECONDS.labels("redis_pipeline")
+INGEST_TOTAL = INGEST_SECONDS.labels("total")
+INGEST_READINGS = Counter("ingest_readings_total", "Readings accepted by the ingest endpoints.", lock=_ingest_lock)
+_ingest_readings = INGEST_READINGS.labels()
+
+HISTORY_SECONDS = Histogram("history_query_seconds", "/api/history duration by source.", ("source",), QUERY_BUCKETS)
+HISTORY_ROWS = Histogram("history_rows", "Rows returned per /api/history response.", ("source",), ROW_BUCKETS)
+
+TASK_SECONDS = Histogram("worker_task_seconds", "Worker task run time.", ("task",), TASK_BUCKETS)
+TASK_FAILURES = Counter("worker_task_failures_total", "Worker task runs that raised.", ("task",))
+
+POOL_WAIT_SECONDS = Histogram("db_pool_checkout_seconds", "Time spent waiting for a DB pool connection.")
+
+def snapshot():
+    with _ingest_lock:
+        _fold_ingest()
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return {m.name: m.snapshot() for m in metrics}
+
+def process_id():
+    # Start time included: a restarted process (same host and pid, e.g. pid 1 in a container) starts a new series
+    return f"{socket.gethostname()}-{os.getpid()}-{_started}"
+
+def _subtract(snap, base):
+    """Counters/histograms of `snap` minus their values in `base` (gauges unchanged)."""
+    result = {}
+    for name, metric in snap.items():
+        old = base.get(name)
+        if metric["type"] == "gauge" or not old:
+            result[name] = metric
+            continue
+        before = {tuple(labels): value for labels, value in old["series"]}
+        series = []
+        for labels, value in metric["series"]:
+            prev = before.get(tuple(labels))
+            if prev is None:
+                series.append([labels, value])
+            elif metric["type"] == "histogram":
+                series.append([labels, {
+                    "counts": [a - b for a, b in zip(value["counts"], prev["counts"])],
+                    "sum": value["sum"] - prev["sum"], "count": value["count"] - prev["count"]
+                }])
+            else:
+                series.append([labels, value - prev])
+        result[name] = {**metric, "series": series}
+    return result
+
+def _payload(snap):
+    return json.dumps({"ts": time.time(), "metrics": _subtract(snap, _base) if _base else snap})
+
+def flush(client=None):
+    """
+    Publish this process's snapshot (one HSET). If the process was retired
+    meanwhile (silent longer than METRICS_STALE_SECONDS, e.g. during a Redis
+    outage), what it had flushed is already counted as retired, so from then
+    on it publishes only what it counted since.
+    """
+    global _flushed, _base
+    client = client or redis_client
+    if not client:
+        return
+    with _flush_lock: # Snapshots reach Redis in the order they were taken
+        snap = snapshot()
+        first = "1" if _flushed is None else "0"
+        if not client.eval(FLUSH_SCRIPT, 1, METRICS_KEY, process_id(), _payload(snap), first):
+            _base = _flushed
+            client.hset(METRICS_KEY, process_id(), _payload(snap))
+        _flushed = snap
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            flush()
+        except Exception as e:
+            print(f"⚠️ Metrics flush failed: {e}")
+
+def start_metrics():
+    """Start the per-process flusher (no-op without Redis or if already running)."""
+    global _flusher
+    with _registry_lock:
+        if not redis_client or (_flusher and _flusher.is_alive()):
+            return
+        _flusher = threading.Thread(target=_flush_loop, daemon=True)
+        _flusher.start()
+
+def _split(entries, now):
+    """Process snapshots from METRICS_KEY -> (live snapshots, {stale process: snapshot or None})."""
+    live = []
+    stale = {}
+    for proc, raw in entries.items():
+        try:
+            entry = json.loads(raw)
+        except (json.JSONDecodeError, TypeError):
+            stale[proc] = None
+            continue
+        if now - entry.get("ts", 0) > METRICS_STALE_SECONDS:
+            stale[proc] = entry["metrics"]
+        else:
+            live.append(entry["metrics"])
+    return live, stale
+
+def _counters_only(snap):
+    """A dead process's snapshot without its gauges (they describe the present, not a total)."""
+    return {name: metric for name, metric in snap.items() if metric["type"] != "gauge"}
+
+def _as_snapshot(merged):
+    """merge() output back to the snapshot() shape."""
+    return {name: {**metric, "series": [[list(k), v] for k, v in metric["series"].items()]} for name, metric in merged.items()}
+
+def retire(client=None, now=None):
+    """
+    Fold the counters/histograms of stale processes into METRICS_RETIRED_KEY
+    and remove their snapshots, in one WATCH/MULTI transaction (retried up to
+    METRICS_RETIRE_RETRIES times). Returns the processes retired.
+    """
+    client = client or redis_client
+    now = now or time.time()
+    for _ in range(METRICS_RETIRE_RETRIES):
+        with client.pipeline() as pipe:
+            try:
+                pipe.watch(METRICS_KEY, METRICS_RETIRED_KEY)
+                _, stale = _split(pipe.hgetall(METRICS_KEY), now)
+                if not stale:
+                    return 0
+                retired = pipe.get(METRICS_RETIRED_KEY)
+                snapshots = [json.loads(retired)] if retired else []
+                snapshots += [_counters_only(snap) for snap in stale.values() if snap]
+                pipe.multi()
+                pipe.set(METRICS_RETIRED_KEY, json.dumps(_as_snapshot(merge(snapshots))))
+                pipe.hdel(METRICS_KEY, *stale)
+                pipe.execute()
+                return len(stale)
+            except WatchError:
+                continue
+    return 0
+
+def collect(client=None, now=None):
+    """
+    Snapshots to merge for a scrape: the flushed snapshot of every process
+    (this one flushes first, so no scrape shows newer values than Redis has)
+    plus the counters of dead processes, so summed counters never go down.
+    Stale processes are then retired.
+    """
+    client = client or redis_client
+    if not client:
+        return [snapshot()]
+    now = now or time.time()
+    flush(client)
+    pipe = client.pipeline() # MULTI/EXEC: a consistent view if another scrape retires processes meanwhile
+    pipe.hgetall(METRICS_KEY)
+    pipe.get(METRICS_RETIRED_KEY)
+    entries, retired = pipe.execute()
+    snapshots, stale = _split(entries, now)
+    snapshots += [_counters_only(snap) for snap in stale.values() if snap]
+    if retired:
+        snapshots.append(json.loads(retired))
+    if stale:
+        try:
+            retire(client, now)
+        except Exception as e:
+            print(f"⚠️ Retiring stale metrics failed: {e}")
+    return snapshots
+
+def merge(snapshots):
+    """Sum counters/histograms (and gauges, or max per their merge rule) across processes."""
+    merged = {}
+    for snap in snapshots:
+        for name, metric in snap.items():
+            target = merged.setdefault(name, {**metric, "series": {}})
+            series = target["series"]
+            for labels, value in metric["series"]:
+                key = tuple(labels)
+                if metric["type"] == "histogram":
+                    current = series.get(key)
+                    if current is None or len(current["counts"]) != len(value["counts"]):
+                        series[key] = {"counts": list(value["counts"]), "sum": value["sum"], "count": value["count"]}
+                    else:
+                        current["counts"] = [a + b for a, b in zip(current["counts"], value["counts"])]
+                        current["sum"] += value["sum"]
+                        current["count"] += value["count"]
+                elif metric.get("merge") == "max":
+                    series[key] = max(series.get(key, value), value)
+                else:
+                    series[key] = series.get(key, 0) + value
+    return merged
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render(merged):
+    """Prometheus text exposition format (0.0.4)."""
+    lines = []
+    for name in sorted(merged):
+        metric = merged[name]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        names = metric["labelnames"]
+        for labels, value in sorted(metric["series"].items()):
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{_format_labels(names, labels)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric["buckets"] + [float("inf")], value["counts"]):
+                cumulative += count
+                le = 'le="' + _format_value(float(bound)) + '"'
+                lines.append(f"{name}_bucket{_format_labels(names, labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(names, labels)} {_format_value(value['sum'])}")
+            lines.append(f"{name}_count{_format_labels(names, labels)} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+def instrument_pool(pool):
+    """Time connection checkouts (including the wait for a free connection) on a SQLAlchemy pool."""
+    if getattr(pool, "_sensorhub_timed", False):
+        return pool
+    original = pool._do_get
+
+    def timed_get():
+        start = time.perf_counter()
+        try:
+            return original()
+        finally:
+            POOL_WAIT_SECONDS.observe(time.perf_counter() - start)
+
+    pool._do_get = timed_get
+    pool._sensorhub_timed = True
+    return pool
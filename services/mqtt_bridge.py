@@ -0,0 +1,269 @@
+import os
+import json
+import time
+import fcntl
+import queue
+import socket
+import tempfile
+import threading
+from datetime import datetime
+from models.db import redis_client
+from services.ingest import parse_reading, build_sensor_data, MAX_BATCH_READINGS
+from services.token_cache import resolve_token
+from services.publisher import publish_updates
+from services.metrics import Counter, Timer, INGEST_TOKEN, INGEST_TOTAL, INGEST_READINGS
+
+try:
+    import paho.mqtt.client as mqtt
+except ImportError: # Optional (extra "mqtt"): without paho-mqtt the bridge just doesn't start
+    mqtt = None
+
+# MQTT -> Redis bridge. Devices publish to "sensors/<token>" with the same JSON
+# as POST /api/ingest/<token> (or {"readings": [...]} like /api/ingest/batch).
+# Devices keep their connection to the broker; the server is one subscriber.
+# Messages are queued by the MQTT network thread and handled in micro-batches:
+# one token lookup per distinct token and one publish_updates() pipeline per
+# batch. The raw streams then persist them in bulk (services/raw_persister.py).
+# QoS 1 messages are acknowledged only after their batch reached Redis. With
+# MQTT_CLIENT_ID set, each bridge keeps a persistent session under a stable id
+# (the id plus a per-host slot, see claim_client_id()), so a restarted process
+# gets its unacknowledged messages back. Without it sessions are clean and a
+# crash relies on the broker handing the shared subscription's in-flight
+# messages to another member. A payload that can't be parsed is
+# rejected on its own (and acknowledged); a failing lookup or publish retries
+# the batch with backoff, since brokers only redeliver after a reconnect and
+# unacknowledged messages would fill the in-flight window.
+
+# --- CONFIG ---
+MQTT_HOST = os.getenv('MQTT_HOST') # Broker address; unset = bridge disabled
+MQTT_PORT = int(os.getenv('MQTT_PORT', 1883))
+MQTT_USERNAME = os.getenv('MQTT_USERNAME')
+MQTT_PASSWORD = os.getenv('MQTT_PASSWORD')
+MQTT_TOPIC_PREFIX = os.getenv('MQTT_TOPIC_PREFIX', 'sensors') # Devices publish to <prefix>/<token>
+MQTT_SHARED_GROUP = os.getenv('MQTT_SHARED_GROUP', 'sensorhub') # Processes split messages ($share); '' = every process gets all
+MQTT_QOS = 1
+MQTT_BATCH_MS = int(os.getenv('MQTT_BATCH_MS', 100)) # Max time a message waits for its batch
+MQTT_BATCH_SIZE = int(os.getenv('MQTT_BATCH_SIZE', 500)) # Messages per batch
+MQTT_QUEUE_SIZE = 10000 # Received but unprocessed; when full the network thread waits (backpressure)
+MQTT_KEEPALIVE = 60
+MQTT_RETRY_MAX_DELAY = 30 # Seconds between attempts once the backoff is capped
+MQTT_CLIENT_ID = os.getenv('MQTT_CLIENT_ID') # Stable id prefix (unique per host): enables persistent sessions
+MQTT_SLOT_DIR = os.getenv('MQTT_SLOT_DIR', tempfile.gettempdir()) # Lock files of the per-host client id slots
+MQTT_MAX_SLOTS = 256
+
+_slot_lock = None # Open lock file of the slot this process holds (released by the OS when it exits)
+
+MESSAGES = Counter("mqtt_messages_total", "MQTT ingest messages by outcome.", ("result",))
+_accepted = MESSAGES.labels("accepted")
+_rejected = MESSAGES.labels("rejected") # Unknown token or invalid payload (acknowledged and dropped)
+
+def topic_token(topic, prefix=MQTT_TOPIC_PREFIX):
+    """"sensors/<token>" -> token, or None for any other topic."""
+    head, _, token = topic.partition("/")
+    if head != prefix or not token or "/" in token:
+        return None
+    return token
+
+def claim_client_id(prefix=MQTT_CLIENT_ID, slot_dir=MQTT_SLOT_DIR):
+    """
+    "<prefix>-<n>" for the lowest slot n no running process on this host holds.
+    Each slot is an flock()ed file, so a worker that dies frees its slot at once
+    and its replacement resumes the same broker session.
+    """
+    global _slot_lock
+    if _slot_lock is not None:
+        return f"{prefix}-{_slot_lock.slot}"
+    for slot in range(MQTT_MAX_SLOTS):
+        lock = open(os.path.join(slot_dir, f"{prefix}-{slot}.mqtt.lock"), "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            continue
+        lock.slot = slot
+        _slot_lock = lock
+        return f"{prefix}-{slot}"
+    raise RuntimeError(f"All {MQTT_MAX_SLOTS} MQTT client id slots are taken")
+
+def parse_message(payload, now=None):
+    """MQTT payload -> list of readings (parse_reading() shape). Raises ValueError."""
+    try:
+        data = json.loads(payload)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Payload is not JSON")
+    if isinstance(data, dict) and isinstance(data.get("readings"), list):
+        items = data["readings"]
+        if len(items) > MAX_BATCH_READINGS:
+            raise ValueError(f"Too many readings (max {MAX_BATCH_READINGS})")
+        return [parse_reading(item, now) for item in items]
+    return [parse_reading(data, now)]
+
+def process_messages(messages, resolve=resolve_token, publish=publish_updates, now=None):
+    """
+    Handle one micro-batch of (topic, payload) pairs with a single publish.
+    Returns (accepted readings, rejected messages). A bad message is counted as
+    rejected whatever it raises; lookup/publish errors propagate (the batch is
+    then retried and left unacknowledged until it succeeds).
+    """
+    now = now or datetime.now()
+    sensors = {}
+    accepted = []
+    rejected = 0
+    for topic, payload in messages:
+        token = topic_token(topic)
+        try:
+            if token is None:
+                raise ValueError("Unexpected topic")
+            if token not in sensors:
+                with Timer(INGEST_TOKEN):
+                    sensors[token] = resolve(token)
+            sensor = sensors[token]
+            if not sensor:
+                raise ValueError("Invalid Token")
+        except ValueError:
+            rejected += 1
+            continue
+        try:
+            accepted.extend((sensor, reading) for reading in parse_message(payload, now))
+        except Exception: # e.g. OverflowError from a huge number: one poison message must not hold the batch
+            rejected += 1
+
+    if accepted:
+        accepted.sort(key=lambda pair: pair[1]["timestamp"]) # Chronological order on the live and raw streams
+        publish([build_sensor_data(sensor, reading) for sensor, reading in accepted])
+    _accepted.inc(len(messages) - rejected)
+    _rejected.inc(rejected)
+    INGEST_READINGS.inc(len(accepted))
+    return len(accepted), rejected
+
+class MqttBridge:
+    """
+    One subscriber connection to the broker plus a batching thread.
+    With MQTT_SHARED_GROUP set, every process joins one shared subscription
+    and the broker splits the messages between them. An explicit `client_id`
+    (or MQTT_CLIENT_ID) makes the session persistent; otherwise it is clean.
+    """
+
+    def __init__(self, host=MQTT_HOST, port=MQTT_PORT, resolve=resolve_token, publish=publish_updates,
+                 batch_ms=MQTT_BATCH_MS, batch_size=MQTT_BATCH_SIZE, shared_group=MQTT_SHARED_GROUP,
+                 client_id=None):
+        if mqtt is None:
+            raise RuntimeError("paho-mqtt is not installed")
+        self.host, self.port = host, port
+        self.resolve, self.publish = resolve, publish
+        self.batch_ms, self.batch_size = batch_ms, batch_size
+        topic = f"{MQTT_TOPIC_PREFIX}/+"
+        self.topic = f"$share/{shared_group}/{topic}" if shared_group else topic
+        self.queue = queue.Queue(maxsize=MQTT_QUEUE_SIZE)
+        self.stats = {"batches": 0, "messages": 0, "retries": 0}
+        self._stop = threading.Event()
+
+        # A persistent session only under an id the restarted process reuses; a
+        # per-process id would leave an orphaned session queuing messages on the broker
+        if client_id is None and MQTT_CLIENT_ID:
+            client_id = claim_client_id()
+        self.persistent = client_id is not None
+        self.client = mqtt.Client(
+            callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+            client_id=client_id or f"sensorhub-{socket.gethostname()}-{os.getpid()}",
+            clean_session=not self.persistent
+        )
+        if MQTT_USERNAME:
+            self.client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
+        self.client.manual_ack_set(True)
+        self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            print(f"⚠️ MQTT connection refused: {reason_code}")
+            return
+        client.subscribe(self.topic, qos=MQTT_QOS)
+        session = "persistent session" if self.persistent else "clean session"
+        print(f"📨 MQTT bridge subscribed to {self.topic} on {self.host}:{self.port} ({session})")
+
+    def _on_message(self, client, userdata, msg):
+        self.queue.put((msg.topic, msg.payload, msg.mid, msg.qos)) # Blocks when full
+
+    def _next_batch(self):
+        try:
+            batch = [self.queue.get(timeout=1)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.batch_ms / 1000
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _batch_loop(self):
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            started = time.perf_counter()
+            if not self._process(batch):
+                return # Stopping: left unacknowledged, redelivered to the next session
+            for _, _, mid, qos in batch:
+                if qos:
+                    self.client.ack(mid, qos)
+            self.stats["batches"] += 1
+            self.stats["messages"] += len(batch)
+            INGEST_TOTAL.observe(time.perf_counter() - started)
+
+    def _process(self, batch):
+        """Process a batch, retrying with backoff until it reaches Redis. False if stopped first."""
+        messages = [(topic, payload) for topic, payload, _, _ in batch]
+        delay = 0.5
+        while True:
+            try:
+                process_messages(messages, self.resolve, self.publish)
+                return True
+            except Exception as e:
+                self.stats["retries"] += 1
+                print(f"❌ MQTT batch of {len(batch)} failed, retrying in {delay:g}s: {e}")
+                if self._stop.wait(delay):
+                    return False
+                delay = min(delay * 2, MQTT_RETRY_MAX_DELAY)
+
+    def start(self):
+        self.client.connect_async(self.host, self.port, keepalive=MQTT_KEEPALIVE)
+        self.client.loop_start()
+        t = threading.Thread(target=self._batch_loop, daemon=True)
+        t.start()
+        return t
+
+    def stop(self):
+        self._stop.set()
+        self.client.disconnect()
+        self.client.loop_stop()
+
+def start_mqtt_bridge():
+    """Start the bridge in background threads (no-op without MQTT_HOST, paho-mqtt or Redis)."""
+    if not MQTT_HOST or not redis_client:
+        return None
+    if mqtt is None:
+        print("⚠️⚠️⚠️ MQTT_HOST is set but paho-mqtt is not installed: MQTT devices are NOT ingested. "
+              "Install it with uv sync --extra mqtt.")
+        return None
+    bridge = MqttBridge()
+    bridge.start()
+    return bridge
+
+if __name__ == "__main__":
+    # Standalone bridge: MQTT_HOST=localhost python -m services.mqtt_bridge
+    bridge = start_mqtt_bridge()
+    if not bridge:
+        print("❌ Set MQTT_HOST (and install paho-mqtt with uv sync --extra mqtt, start Redis).")
+    else:
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            bridge.stop()
@@ -0,0 +1,137 @@
+import os
+import json
+from datetime import datetime
+from models.db import redis_client
+from services.metrics import IngestTrace
+
+# --- REDIS KEYS ---
+CURRENT_KEY = "sensors:current" # Hash: sensor_id -> latest sensor_data JSON
+CURRENT_TS_KEY = "sensors:current:ts" # Hash: sensor_id -> reading time of its sensors:current value
+STREAM_CHANNEL = "sensors:stream" # Pub/Sub channel consumed by /stream-data
+RAW_STREAM_PREFIX = "sensors:raw:" # Redis Stream per sensor: every reading, drained by services/raw_persister.py
+RAW_STREAM_INDEX = "sensors:raw:keys" # Set of the per-sensor stream keys (so persisters can discover them)
+CONFIG_CHANNEL = "sensors:config" # Pub/Sub channel: SystemConfig changes ({"key": "value"}), consumed by the worker
+
+# --- CONFIG ---
+RAW_STREAM_ENABLED = os.getenv('RAW_STREAM_ENABLED', '1') == '1' # Lossless capture instead of periodic snapshots
+RAW_STREAM_MAXLEN = int(os.getenv('RAW_STREAM_MAXLEN', 100000)) # Approximate cap per sensor stream while persisters are behind or down
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Store each sensor's value unless the one in sensors:current is newer (a buffered
+# batch of old readings must not move the dashboard back). ARGV: sensor_id, timestamp, JSON, ...
+CURRENT_SCRIPT = """
+for i = 1, #ARGV, 3 do
+    local stored = redis.call('hget', KEYS[2], ARGV[i])
+    if not stored or stored <= ARGV[i + 1] then
+        redis.call('hset', KEYS[1], ARGV[i], ARGV[i + 2])
+        redis.call('hset', KEYS[2], ARGV[i], ARGV[i + 1])
+    end
+end
+return 0
+"""
+
+def raw_stream_key(sensor_id):
+    return f"{RAW_STREAM_PREFIX}{sensor_id}"
+
+def build_update_msg(sensor_data, server_time=None):
+    """Envelope expected by app.js (msg.sensor_id && msg.data)."""
+    return {
+        "sensor_id": sensor_data["sensor_id"],
+        "data": sensor_data,
+        "server_time": sensor_data.get("server_time") or server_time or datetime.now().strftime("%H:%M:%S")
+    }
+
+def raw_entry(sensor_data, now):
+    """Stream entry fields (strings only; empty string = missing value)."""
+    def field(value):
+        return "" if value is None else str(value)
+    return {
+        "sensor_id": str(sensor_data["sensor_id"]),
+        "timestamp": sensor_data.get("timestamp") or now.strftime(TIMESTAMP_FORMAT), # Sensor time when it sent one
+        "temperature": field(sensor_data.get("temperature")),
+        "humidity": field(sensor_data.get("humidity"))
+    }
+
+def _prepare(updates):
+    now = datetime.now()
+    server_time = now.strftime("%H:%M:%S")
+    stamp = now.strftime(TIMESTAMP_FORMAT)
+    latest = {} # sensor_id -> (timestamp, JSON) of its newest reading in the batch
+    messages = []
+    entries = []
+    for sensor_data in updates:
+        sensor_id = str(sensor_data["sensor_id"])
+        ts = sensor_data.get("timestamp") or stamp # TIMESTAMP_FORMAT sorts as text
+        if sensor_id not in latest or ts >= latest[sensor_id][0]:
+            latest[sensor_id] = (ts, json.dumps(sensor_data))
+        messages.append(json.dumps(build_update_msg(sensor_data, server_time)))
+        if RAW_STREAM_ENABLED:
+            entries.append(raw_entry(sensor_data, now))
+    return latest, messages, entries
+
+def _queue(pipe, latest, messages, entries):
+    args = [value for sensor_id, (ts, data) in latest.items() for value in (sensor_id, ts, data)]
+    pipe.eval(CURRENT_SCRIPT, 2, CURRENT_KEY, CURRENT_TS_KEY, *args)
+    for msg in messages:
+        pipe.publish(STREAM_CHANNEL, msg)
+    keys = set()
+    for entry in entries:
+        key = raw_stream_key(entry["sensor_id"])
+        pipe.xadd(key, entry, maxlen=RAW_STREAM_MAXLEN, approximate=True)
+        keys.add(key)
+    if keys:
+        pipe.sadd(RAW_STREAM_INDEX, *keys)
+
+def publish_updates(updates, client=None, trace=None):
+    """
+    Write a batch of sensor updates to Redis in a single round trip.
+
+    `updates` is a list of sensor_data dicts (each with "sensor_id"), in
+    chronological order. The newest reading per sensor goes to sensors:current
+    (one script call; skipped where the stored value is newer), and every
+    update is published to sensors:stream, all through one non-transactional
+    pipeline. With RAW_STREAM_ENABLED every
+    update is also appended to its sensor's capped raw stream.
+    The encode and Redis stages are timed on `trace` (an IngestTrace the
+    caller records); without one they are recorded here.
+    Returns the number of published messages.
+    """
+    client = client or redis_client
+    if not client or not updates:
+        return 0
+
+    own = trace is None
+    trace = trace or IngestTrace()
+    latest, messages, entries = _prepare(updates)
+    trace.encode = trace.lap()
+    pipe = client.pipeline(transaction=False)
+    _queue(pipe, latest, messages, entries)
+    pipe.execute()
+    trace.redis = trace.lap()
+    if own:
+        trace.record(total=False)
+    return len(messages)
+
+async def publish_updates_async(updates, client, trace=None):
+    """publish_updates() for a redis.asyncio client (ASGI routes)."""
+    if not client or not updates:
+        return 0
+
+    own = trace is None
+    trace = trace or IngestTrace()
+    latest, messages, entries = _prepare(updates)
+    trace.encode = trace.lap()
+    pipe = client.pipeline(transaction=False)
+    _queue(pipe, latest, messages, entries)
+    await pipe.execute()
+    trace.redis = trace.lap()
+    if own:
+        trace.record(total=False)
+    return len(messages)
+
+def publish_config(changes, client=None):
+    """Announce SystemConfig changes ({"key": "value"}) so the worker applies them without polling."""
+    client = client or redis_client
+    if not client or not changes:
+        return 0
+    return client.publish(CONFIG_CHANNEL, json.dumps(changes))
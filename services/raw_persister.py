@@ -0,0 +1,247 @@
+import os
+import time
+import socket
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import insert, delete, tuple_
+from redis.exceptions import ResponseError
+from models.db import redis_client, SessionLocal
+from models.sql_models import Sensor, PersistedEntry
+from services.publisher import RAW_STREAM_INDEX, TIMESTAMP_FORMAT
+from services.rollups import apply_readings
+from services.bulk_writer import bulk_insert_readings
+from services.forecast import update_models
+from services.read_cache import note_readings
+
+# --- CONFIG ---
+PERSIST_GROUP = "persisters" # Consumer group shared by every persister process
+PERSIST_BATCH_SIZE = int(os.getenv('PERSIST_BATCH_SIZE', 500)) # Max entries read per stream per round
+PERSIST_BLOCK_MS = int(os.getenv('PERSIST_BLOCK_MS', 2000)) # XREADGROUP block time when idle
+CLAIM_IDLE_MS = int(os.getenv('PERSIST_CLAIM_IDLE_MS', 60000)) # Pending entries older than this are taken over (dead consumer)
+PERSIST_DEDUP_HOURS = int(os.getenv('PERSIST_DEDUP_HOURS', 24)) # Persisted entry ids are remembered this long (replays are skipped)
+KEYS_REFRESH_SECONDS = 10 # How often new sensor streams are picked up
+CLAIM_EVERY_SECONDS = 10 # How often stale pending entries are checked for
+PRUNE_EVERY_SECONDS = 60 # How often expired persisted entry ids are deleted
+DEDUP_CHUNK = 500 # (stream, entry id) pairs per lookup query
+
+CONSUMER_NAME = f"{socket.gethostname()}-{os.getpid()}"
+
+def parse_entry(fields):
+    """Stream entry -> (sensor_id, timestamp, temperature, humidity). Raises ValueError."""
+    def number(value):
+        return float(value) if value not in (None, "") else None
+    return (
+        int(fields["sensor_id"]),
+        datetime.strptime(fields["timestamp"], TIMESTAMP_FORMAT),
+        number(fields.get("temperature")),
+        number(fields.get("humidity"))
+    )
+
+def already_persisted(session, keys):
+    """The (stream, entry_id) pairs among `keys` that an earlier commit already wrote."""
+    seen = set()
+    for i in range(0, len(keys), DEDUP_CHUNK):
+        chunk = keys[i:i + DEDUP_CHUNK]
+        seen.update(tuple(row) for row in session.query(PersistedEntry.stream, PersistedEntry.entry_id).filter(
+            tuple_(PersistedEntry.stream, PersistedEntry.entry_id).in_(chunk)
+        ))
+    return seen
+
+def persist_entries(session, entries):
+    """
+    Insert parsed readings (and fold them into the rollups) in one transaction,
+    then into the forecast models.
+    `entries` is a list of (stream, entry_id, fields). Malformed entries are skipped
+    (and still acknowledged) so one bad payload can't wedge the stream.
+    Entry ids are committed with the rows, so replayed entries are skipped; two
+    persisters racing on one entry make the second commit fail on the primary key.
+    Returns the number of rows written.
+    """
+    parsed = [] # ((stream, entry_id), reading)
+    for stream, entry_id, fields in entries:
+        try:
+            parsed.append(((stream, entry_id), parse_entry(fields)))
+        except (KeyError, ValueError, TypeError):
+            print(f"⚠️ Skipping malformed raw entry {stream} {entry_id}: {fields}")
+
+    # Entries of sensors deleted after the reading was captured are dropped
+    sensor_ids = {r[0] for _, r in parsed}
+    if sensor_ids:
+        known = {sid for (sid,) in session.query(Sensor.id).filter(Sensor.id.in_(sensor_ids))}
+        parsed = [(key, r) for key, r in parsed if r[0] in known]
+    if parsed:
+        seen = already_persisted(session, [key for key, _ in parsed])
+        parsed = [(key, r) for key, r in parsed if key not in seen]
+
+    readings = [r for _, r in parsed]
+    if readings:
+        now = datetime.now()
+        session.execute(insert(PersistedEntry), [
+            {"stream": stream, "entry_id": entry_id, "persisted_at": now} for (stream, entry_id), _ in parsed
+        ])
+        bulk_insert_readings(session, readings)
+        apply_readings(session, readings)
+    session.commit()
+    note_readings([r[1] for r in readings]) # Late readings change cached closed history windows
+    update_models(readings)
+    return len(readings)
+
+class RawPersister:
+    """
+    Drains the per-sensor raw streams into sensor_readings through a consumer group.
+
+    Delivery is at-least-once: entries are XACKed only after the DB commit, so a
+    crash replays them (another persister claims them after CLAIM_IDLE_MS); the
+    entry ids committed with the rows make the replay write nothing twice.
+    After each ack the streams are trimmed to what is still unpersisted, so
+    RAW_STREAM_MAXLEN only bounds the backlog while persisters are behind.
+    Any number of processes can run one; the group splits entries between them.
+    """
+
+    def __init__(self, client=None, consumer=CONSUMER_NAME):
+        self.client = client or redis_client
+        self.consumer = consumer
+        self.streams = set()
+        self._keys_refreshed = 0
+        self._claimed_at = 0
+        self._pruned_at = 0
+
+    def refresh_streams(self, now=None):
+        now = now or time.monotonic()
+        if now - self._keys_refreshed < KEYS_REFRESH_SECONDS and self.streams:
+            return
+        self._keys_refreshed = now
+        for key in self.client.smembers(RAW_STREAM_INDEX) - self.streams:
+            try:
+                self.client.xgroup_create(key, PERSIST_GROUP, id="0", mkstream=True)
+            except ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+            self.streams.add(key)
+
+    def claim_stale(self, now=None):
+        """Entries delivered to a consumer that died before acknowledging them."""
+        now = now or time.monotonic()
+        if now - self._claimed_at < CLAIM_EVERY_SECONDS or not self.streams:
+            return []
+        self._claimed_at = now
+        keys = list(self.streams)
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.xautoclaim(key, PERSIST_GROUP, self.consumer, CLAIM_IDLE_MS, "0-0", count=PERSIST_BATCH_SIZE)
+        entries = []
+        for key, result in zip(keys, pipe.execute()):
+            # Entries trimmed by MAXLEN while pending come back without fields
+            entries.extend((key, entry_id, fields) for entry_id, fields in result[1] if fields)
+        return entries
+
+    def read_new(self, block_ms=PERSIST_BLOCK_MS):
+        if not self.streams:
+            time.sleep(block_ms / 1000)
+            return []
+        result = self.client.xreadgroup(
+            PERSIST_GROUP, self.consumer,
+            {key: ">" for key in self.streams},
+            count=PERSIST_BATCH_SIZE, block=block_ms
+        ) or []
+        return [(key, entry_id, fields) for key, items in result for entry_id, fields in items]
+
+    def ack(self, entries):
+        by_stream = {}
+        for key, entry_id, _ in entries:
+            by_stream.setdefault(key, []).append(entry_id)
+        pipe = self.client.pipeline(transaction=False)
+        for key, ids in by_stream.items():
+            pipe.xack(key, PERSIST_GROUP, *ids)
+        pipe.execute()
+        self.trim(list(by_stream))
+
+    def trim(self, keys):
+        """
+        Drop the entries every persister is done with: everything before the
+        oldest pending entry, or before the group's last delivered entry when
+        nothing is pending. Entries read by another persister but not acked yet
+        are pending, so they are never trimmed. Returns the entries removed.
+        """
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.xinfo_groups(key)
+            pipe.xpending(key, PERSIST_GROUP)
+        results = pipe.execute()
+
+        pipe = self.client.pipeline(transaction=False)
+        for i, key in enumerate(keys):
+            groups, pending = results[2 * i], results[2 * i + 1]
+            group = next((g for g in groups if g["name"] == PERSIST_GROUP), None)
+            if group is None:
+                continue
+            minid = pending["min"] if pending["pending"] else group["last-delivered-id"]
+            pipe.xtrim(key, minid=minid, approximate=False)
+        return sum(pipe.execute())
+
+    def prune(self, now=None):
+        """Forget persisted entry ids older than PERSIST_DEDUP_HOURS (long past any replay)."""
+        now = now or time.monotonic()
+        if now - self._pruned_at < PRUNE_EVERY_SECONDS:
+            return 0
+        self._pruned_at = now
+        session = SessionLocal()
+        try:
+            cutoff = datetime.now() - timedelta(hours=PERSIST_DEDUP_HOURS)
+            result = session.execute(delete(PersistedEntry).where(PersistedEntry.persisted_at < cutoff))
+            session.commit()
+            return result.rowcount
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def run_once(self, block_ms=PERSIST_BLOCK_MS):
+        """One round: pick up new streams, reclaim stale entries, read, persist, ack."""
+        self.prune()
+        self.refresh_streams()
+        entries = self.claim_stale() or self.read_new(block_ms)
+        if not entries:
+            return 0
+
+        session = SessionLocal()
+        try:
+            written = persist_entries(session, entries)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        self.ack(entries)
+        return written
+
+def _persister_loop(stop=None):
+    print(f"📥 Raw stream persister started ({CONSUMER_NAME}).")
+    persister = RawPersister()
+    while not (stop and stop.is_set()):
+        try:
+            written = persister.run_once()
+            if written:
+                print(f"💾 [HISTORY] {written} raw reading(s) saved.")
+        except ResponseError as e:
+            if "NOGROUP" not in str(e):
+                print(f"❌ Raw persister error: {e}. Retrying...")
+                time.sleep(1)
+            persister.streams.clear() # A stream was deleted (sensor removed) or Redis was flushed
+        except Exception as e:
+            print(f"❌ Raw persister error: {e}. Retrying...")
+            persister.streams.clear() # Recreate groups in case Redis was flushed/restarted
+            time.sleep(1)
+
+def start_raw_persister(stop=None):
+    """Start the persister in a background thread (no-op without Redis). Setting `stop` ends it."""
+    if not redis_client:
+        return None
+    t = threading.Thread(target=_persister_loop, args=(stop,), daemon=True)
+    t.start()
+    return t
+
+if __name__ == "__main__":
+    # Extra persisters can run standalone: python -m services.raw_persister
+    _persister_loop()
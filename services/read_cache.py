@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from models.db import redis_client
+from models.sql_models import Sensor, SystemConfig
+
+# Versioned read-through cache for rarely-changing reads.
+# Every namespace has a version in Redis, bumped after each committed write
+# (sensor CRUD, SystemConfig changes, late or deleted readings). Entries are
+# stored under "<namespace>:<version>", so a bump makes every process miss at
+# once and nothing is ever overwritten in place. Readers pay one HMGET for the
+# versions; the entry itself comes from process memory, then Redis, then the DB.
+
+# --- CONFIG ---
+READ_CACHE_TTL = int(os.getenv('READ_CACHE_TTL', 300)) # Seconds an entry lives (bounds staleness after an unannounced write)
+HISTORY_CACHE_TTL = int(os.getenv('HISTORY_CACHE_TTL', 24 * 3600)) # Closed history windows (immutable keys)
+HISTORY_CLOSED_MINUTES = 20 # A window is closed once its end is this far in the past (readings arrive late)
+VERSIONS_KEY = "sensors:cache:versions" # Hash: namespace -> version, "<namespace>:modified" -> epoch seconds
+ENTRY_PREFIX = "sensors:cache:"
+
+SENSORS = "sensors" # Sensor table
+CONFIG = "config" # SystemConfig table
+HISTORY = "history" # Readings outside the open window (late uploads, retention)
+
+_local = {} # namespace -> entry (this process)
+_local_versions = {} # Versions when running without Redis (single process)
+_lock = threading.Lock()
+
+def _now():
+    return time.time()
+
+def versions(*namespaces):
+    """{namespace: (version, modified epoch seconds or None)} in one round trip."""
+    if not redis_client:
+        with _lock:
+            return {ns: _local_versions.get(ns, (0, None)) for ns in namespaces}
+    fields = [f for ns in namespaces for f in (ns, f"{ns}:modified")]
+    values = redis_client.hmget(VERSIONS_KEY, fields)
+    result = {}
+    for i, ns in enumerate(namespaces):
+        version, modified = values[2 * i], values[2 * i + 1]
+        result[ns] = (int(version or 0), float(modified) if modified else None)
+    return result
+
+def bump(*namespaces):
+    """Invalidate namespaces after a committed write (all processes)."""
+    now = _now()
+    with _lock:
+        for ns in namespaces:
+            _local.pop(ns, None)
+            if not redis_client:
+                _local_versions[ns] = (_local_versions.get(ns, (0, None))[0] + 1, now)
+    if not redis_client:
+        return
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for ns in namespaces:
+            pipe.hincrby(VERSIONS_KEY, ns, 1)
+            pipe.hset(VERSIONS_KEY, f"{ns}:modified", now)
+        pipe.execute()
+    except Exception as e:
+        print(f"⚠️ Cache invalidation failed ({', '.join(namespaces)}): {e}")
+
+def make_entry(data, modified=None):
+    """{"data", "body" (JSON), "etag", "modified"} for a payload."""
+    body = json.dumps(data)
+    return {
+        "data": data,
+        "body": body,
+        "etag": hashlib.blake2b(body.encode(), digest_size=16).hexdigest(),
+        "modified": modified or _now()
+    }
+
+def _stored(entry):
+    """What goes to Redis (the body only once; data is parsed back from it)."""
+    return json.dumps({"body": entry["body"], "etag": entry["etag"], "modified": entry["modified"]})
+
+def get(namespace, loader):
+    """Entry for `namespace`, calling `loader()` (the DB read) only on a miss."""
+    try:
+        version, modified = versions(namespace)[namespace]
+    except Exception as e:
+        print(f"⚠️ Cache version read failed: {e}")
+        return make_entry(loader())
+
+    now = _now()
+    with _lock:
+        entry = _local.get(namespace)
+    if entry and entry["version"] == version and entry["expires"] > now:
+        return entry
+
+    key = f"{ENTRY_PREFIX}{namespace}:{version}"
+    entry = None
+    if redis_client:
+        try:
+            cached = redis_client.get(key)
+            if cached:
+                entry = json.loads(cached)
+                entry["data"] = json.loads(entry["body"])
+        except Exception as e:
+            print(f"⚠️ Cache read failed: {e}")
+    if entry is None:
+        entry = make_entry(loader(), modified)
+        if redis_client:
+            try:
+                redis_client.set(key, _stored(entry), ex=READ_CACHE_TTL)
+            except Exception as e:
+                print(f"⚠️ Cache write failed: {e}")
+
+    entry["version"] = version
+    entry["expires"] = now + READ_CACHE_TTL
+    with _lock:
+        _local[namespace] = entry
+    return entry
+
+# --- CACHED READS ---
+def sensors_entry(session):
+    """Active sensors as to_dict() rows."""
+    return get(SENSORS, lambda: [s.to_dict() for s in session.query(Sensor).filter_by(active=True).all()])
+
+def config_entry(session):
+    """Every SystemConfig row as {key: value}."""
+    return get(CONFIG, lambda: {c.key: c.value for c in session.query(SystemConfig).all()})
+
+def active_sensors(session):
+    return sensors_entry(session)["data"]
+
+def system_config(session):
+    return config_entry(session)["data"]
+
+def weather_sensors(session):
+    """(id, name, lat, lon) of active OpenWeather sensors, as services/weather.py takes them."""
+    return [(s["id"], s["name"], s["lat"], s["lon"]) for s in active_sensors(session) if s["type"] == "openweather"]
+
+# --- CLOSED HISTORY WINDOWS ---
+def is_closed(end, now=None):
+    """Whether no more readings are expected before `end` (naive wall-clock time)."""
+    now = now or datetime.now()
+    return end < now - timedelta(minutes=HISTORY_CLOSED_MINUTES)
+
+def history_key(params):
+    """
+    Immutable key for a closed-window history response: the query plus the
+    versions of everything it reads, so a change produces a new key instead of
+    rewriting an old one.
+    """
+    current = versions(SENSORS, HISTORY)
+    query = "&".join(f"{k}={value}" for k, value in sorted(params.items()))
+    digest = hashlib.blake2b(query.encode(), digest_size=16).hexdigest()
+    return f"{ENTRY_PREFIX}{HISTORY}:{current[SENSORS][0]}.{current[HISTORY][0]}:{digest}"
+
+def get_history(key):
+    """Cached {"body", "etag", "modified"} for a history key, or None."""
+    if not redis_client:
+        return None
+    try:
+        cached = redis_client.get(key)
+        return json.loads(cached) if cached else None
+    except Exception as e:
+        print(f"⚠️ History cache read failed: {e}")
+        return None
+
+def put_history(key, data):
+    entry = make_entry(data)
+    if redis_client:
+        try:
+            redis_client.set(key, _stored(entry), ex=HISTORY_CACHE_TTL)
+        except Exception as e:
+            print(f"⚠️ History cache write failed: {e}")
+    return entry
+
+def note_readings(timestamps, now=None):
+    """Bump HISTORY if any reading landed in an already closed window (late upload)."""
+    now = now or datetime.now()
+    if any(is_closed(ts, now) for ts in timestamps):
+        bump(HISTORY)
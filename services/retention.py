@@ -0,0 +1,108 @@
+import os
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select
+from models.sql_models import SensorReading, SensorReadingHourly, SensorReadingDaily
+from models.partitions import readings_partitioned, drop_partitions_before, month_start
+from services.read_cache import system_config
+
+# --- CONFIG ---
+RETENTION_DEFAULTS = {
+    "retention_raw_days": 365, # Raw sensor_readings kept this many days (0 = forever)
+    "retention_rollup_months": 36, # Hourly/daily rollups kept this many months (0 = forever)
+}
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', 5000)) # Rows per DELETE statement
+RETENTION_MAX_BATCHES = int(os.getenv('RETENTION_MAX_BATCHES', 100)) # Per run; the rest waits for the next one
+RETENTION_PAUSE_SECONDS = 0.05 # Between batches, so writers get the lock in between
+
+def get_policy(session):
+    """{"retention_raw_days": N, "retention_rollup_months": M} from SystemConfig (defaults if unset/invalid)."""
+    policy = dict(RETENTION_DEFAULTS)
+    config = system_config(session) # Read cache: this runs on every /api/history request
+    for key in RETENTION_DEFAULTS:
+        try:
+            policy[key] = max(0, int(config[key]))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return policy
+
+def months_ago(now, months):
+    """First instant of the month `months` months before `now`'s month."""
+    index = now.year * 12 + now.month - 1 - months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+def delete_in_batches(session, model, column, cutoff, batch_size=RETENTION_BATCH_SIZE, max_batches=RETENTION_MAX_BATCHES):
+    """
+    DELETE rows with column < cutoff, `batch_size` rows per statement and commit,
+    so no single transaction holds the write lock for long. Returns rows deleted.
+    """
+    pk = list(model.__table__.primary_key.columns)
+    total = 0
+    for _ in range(max_batches):
+        if len(pk) == 1:
+            ids = select(pk[0]).where(column < cutoff).limit(batch_size).scalar_subquery()
+            result = session.execute(delete(model).where(pk[0].in_(ids)))
+            done = result.rowcount < batch_size
+        else:
+            # Composite keys (rollups): step through the time column instead of the key
+            boundary = session.execute(
+                select(column).where(column < cutoff).order_by(column).offset(batch_size - 1).limit(1)
+            ).scalar()
+            done = boundary is None
+            result = session.execute(delete(model).where(column < cutoff if done else column <= boundary))
+        session.commit()
+        total += result.rowcount
+        if done:
+            break
+        time.sleep(RETENTION_PAUSE_SECONDS)
+    return total
+
+def raw_cutoff(session, now=None):
+    """Oldest raw reading the DB must still hold under the policy (None = kept forever)."""
+    days = get_policy(session)["retention_raw_days"]
+    return (now or datetime.now()) - timedelta(days=days) if days else None
+
+def rollup_cutoff(session, now=None):
+    """Oldest bucket the rollup tables still hold under the policy (None = kept forever)."""
+    months = get_policy(session)["retention_rollup_months"]
+    return months_ago(now or datetime.now(), months) if months else None
+
+def enforce_retention(session, now=None, raw_floor=None, delete_raw=None, can_drop=None):
+    """
+    Apply the retention policy once. Raw readings on a partitioned PostgreSQL
+    table are removed by dropping whole expired months; everything else is
+    deleted in bounded batches. `raw_floor` caps the raw cutoff (e.g. data
+    not archived yet). `delete_raw(session, cutoff)` replaces the plain raw
+    DELETE and `can_drop(month)` vetoes a partition drop (both: only rows
+    confirmed in the archive). Returns a summary dict.
+    """
+    now = now or datetime.now()
+    policy = get_policy(session)
+    summary = {"raw_deleted": 0, "partitions_dropped": [], "rollups_deleted": 0}
+
+    raw_days = policy["retention_raw_days"]
+    if raw_days:
+        cutoff = now - timedelta(days=raw_days)
+        if raw_floor is not None:
+            cutoff = min(cutoff, raw_floor)
+        conn = session.connection()
+        if readings_partitioned(conn):
+            def check(month):
+                allowed = can_drop is None or can_drop(month)
+                session.commit() # DETACH ... CONCURRENTLY waits for every open transaction on the table, ours too
+                return allowed
+            session.commit()
+            # Partitions only go once the whole month is expired (up to a month of extra data)
+            summary["partitions_dropped"] = drop_partitions_before(session.get_bind(), month_start(cutoff), check)
+        elif delete_raw:
+            summary["raw_deleted"] = delete_raw(session, cutoff)
+        else:
+            summary["raw_deleted"] = delete_in_batches(session, SensorReading, SensorReading.timestamp, cutoff)
+
+    rollup_months = policy["retention_rollup_months"]
+    if rollup_months:
+        cutoff = months_ago(now, rollup_months)
+        for model in (SensorReadingHourly, SensorReadingDaily):
+            summary["rollups_deleted"] += delete_in_batches(session, model, model.bucket_start, cutoff)
+
+    return summary
@@ -0,0 +1,170 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models.sql_models import SensorReading, SensorReadingHourly, SensorReadingDaily, Sensor, SystemConfig
+from services.history import bucket_expression, EPOCH
+from services.read_cache import CONFIG, HISTORY, bump, system_config
+
+# --- CONFIG ---
+ROLLUP_MODELS = {
+    "hour": SensorReadingHourly,
+    "day": SensorReadingDaily,
+}
+PERIOD_SECONDS = {"hour": 3600, "day": 86400}
+HOURLY_MIN_RANGE = timedelta(days=2) # /api/history ranges at least this long are served from hourly rollups
+DAILY_MIN_RANGE = timedelta(days=60) # ...and from daily rollups beyond this
+READY_KEY = "rollups_ready" # SystemConfig flag set once the backfill has run
+UPSERT_BATCH_SIZE = 500 # Buckets per INSERT ... ON CONFLICT statement
+SUM_FIELDS = ("count", "temp_count", "temp_sum", "temp_sumsq", "hum_count", "hum_sum", "hum_sumsq")
+
+def truncate(ts, period):
+    """Start of the hour/day bucket for a timestamp (naive, stored wall clock)."""
+    ts = ts.replace(tzinfo=None, minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0) if period == "day" else ts
+
+def _fold(acc, temperature, humidity):
+    acc["count"] += 1
+    if temperature is not None:
+        acc["temp_count"] += 1
+        acc["temp_sum"] += temperature
+        acc["temp_sumsq"] += temperature * temperature
+        acc["temp_min"] = temperature if acc["temp_min"] is None else min(acc["temp_min"], temperature)
+        acc["temp_max"] = temperature if acc["temp_max"] is None else max(acc["temp_max"], temperature)
+    if humidity is not None:
+        acc["hum_count"] += 1
+        acc["hum_sum"] += humidity
+        acc["hum_sumsq"] += humidity * humidity
+        acc["hum_min"] = humidity if acc["hum_min"] is None else min(acc["hum_min"], humidity)
+        acc["hum_max"] = humidity if acc["hum_max"] is None else max(acc["hum_max"], humidity)
+
+def _empty():
+    return {
+        "count": 0,
+        "temp_count": 0, "temp_sum": 0.0, "temp_sumsq": 0.0, "temp_min": None, "temp_max": None,
+        "hum_count": 0, "hum_sum": 0.0, "hum_sumsq": 0.0, "hum_min": None, "hum_max": None,
+    }
+
+def _upsert(session, model, rows):
+    """
+    INSERT ... ON CONFLICT DO UPDATE SET sum = sum + excluded.sum (min/max likewise),
+    so concurrent persisters add to a bucket in the database instead of
+    overwriting each other's read-modify-write. Returns False on other dialects.
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        insert, least, greatest = pg_insert, func.least, func.greatest
+    elif dialect == "sqlite":
+        insert, least, greatest = sqlite_insert, func.min, func.max # Multi-argument min()/max() are scalar in SQLite
+    else:
+        return False
+
+    table = model.__table__
+    for i in range(0, len(rows), UPSERT_BATCH_SIZE):
+        stmt = insert(table).values(rows[i:i + UPSERT_BATCH_SIZE])
+        new = stmt.excluded
+        updates = {field: table.c[field] + new[field] for field in SUM_FIELDS}
+        for field, pick in (("temp_min", least), ("temp_max", greatest), ("hum_min", least), ("hum_max", greatest)):
+            # coalesce both ways: a NULL side (no value yet) must not win
+            updates[field] = pick(func.coalesce(table.c[field], new[field]), func.coalesce(new[field], table.c[field]))
+        session.execute(stmt.on_conflict_do_update(index_elements=[table.c.sensor_id, table.c.bucket_start], set_=updates))
+    return True
+
+def apply_readings(session, readings):
+    """
+    Fold new readings into the hourly and daily rollups (same transaction as the insert).
+    `readings` is an iterable of (sensor_id, timestamp, temperature, humidity).
+    Readings are grouped in memory first, so each touched bucket is one upsert row.
+    Buckets go in key order, so concurrent transactions lock them in the same order.
+    """
+    deltas = {}
+    for sensor_id, timestamp, temperature, humidity in readings:
+        for period in ROLLUP_MODELS:
+            key = (period, sensor_id, truncate(timestamp, period))
+            _fold(deltas.setdefault(key, _empty()), temperature, humidity)
+
+    for period, model in ROLLUP_MODELS.items():
+        rows = [dict(delta, sensor_id=sensor_id, bucket_start=bucket_start)
+                for (p, sensor_id, bucket_start), delta in sorted(deltas.items()) if p == period]
+        if rows and not _upsert(session, model, rows):
+            _merge_rows(session, model, rows)
+
+def _merge_rows(session, model, rows):
+    """ORM read-modify-write for dialects without ON CONFLICT (single writer only)."""
+    for delta in rows:
+        sensor_id, bucket_start = delta["sensor_id"], delta["bucket_start"]
+        row = session.get(model, (sensor_id, bucket_start))
+        if row is None:
+            session.add(model(**delta))
+            continue
+
+        for field in SUM_FIELDS:
+            setattr(row, field, (getattr(row, field) or 0) + delta[field])
+        for field, pick in (("temp_min", min), ("temp_max", max), ("hum_min", min), ("hum_max", max)):
+            values = [v for v in (getattr(row, field), delta[field]) if v is not None]
+            setattr(row, field, pick(values) if values else None)
+
+def backfill(session):
+    """
+    Rebuild both rollup tables from sensor_readings with one GROUP BY per period.
+    Run it with the worker stopped (or accept that rows written meanwhile may be missed).
+    """
+    dialect = session.get_bind().dialect.name
+    totals = {}
+    for period, model in ROLLUP_MODELS.items():
+        bucket = bucket_expression(dialect, PERIOD_SECONDS[period]).label("bucket")
+        temp = SensorReading.temperature
+        hum = SensorReading.humidity
+        rows = session.query(
+            SensorReading.sensor_id,
+            bucket,
+            func.count(SensorReading.id),
+            func.count(temp), func.coalesce(func.sum(temp), 0.0), func.coalesce(func.sum(temp * temp), 0.0), func.min(temp), func.max(temp),
+            func.count(hum), func.coalesce(func.sum(hum), 0.0), func.coalesce(func.sum(hum * hum), 0.0), func.min(hum), func.max(hum)
+        ).group_by(SensorReading.sensor_id, bucket).all()
+
+        session.query(model).delete(synchronize_session=False)
+        session.bulk_insert_mappings(model, [{
+            "sensor_id": sensor_id,
+            "bucket_start": EPOCH + timedelta(seconds=int(b)),
+            "count": count,
+            "temp_count": t_n, "temp_sum": t_sum, "temp_sumsq": t_sq, "temp_min": t_min, "temp_max": t_max,
+            "hum_count": h_n, "hum_sum": h_sum, "hum_sumsq": h_sq, "hum_min": h_min, "hum_max": h_max,
+        } for sensor_id, b, count, t_n, t_sum, t_sq, t_min, t_max, h_n, h_sum, h_sq, h_min, h_max in rows])
+        totals[period] = len(rows)
+
+    config = session.get(SystemConfig, READY_KEY)
+    if config:
+        config.value = "1"
+        config.updated_at = datetime.now()
+    else:
+        session.add(SystemConfig(key=READY_KEY, value="1"))
+    session.commit()
+    bump(CONFIG, HISTORY)
+    return totals
+
+def rollups_ready(session):
+    return system_config(session).get(READY_KEY) == "1"
+
+def choose_period(start, end, min_points=0):
+    """
+    Which rollup should serve a range: 'day', 'hour' or None (raw readings).
+    `min_points` skips a rollup too coarse to give that many buckets (for ?max_points).
+    """
+    span = end - start
+    for period, threshold in (("day", DAILY_MIN_RANGE), ("hour", HOURLY_MIN_RANGE)):
+        if span >= threshold and span.total_seconds() / PERIOD_SECONDS[period] >= min_points:
+            return period
+    return None
+
+def rollup_history(session, start, end, period, sensor_id=None):
+    """Rows shaped like aggregate_history(), read from the rollup table (plus temp_std/hum_std)."""
+    model = ROLLUP_MODELS[period]
+    query = session.query(model, Sensor.name).join(Sensor, Sensor.id == model.sensor_id).filter(
+        model.bucket_start >= truncate(start, period),
+        model.bucket_start <= end
+    )
+    if sensor_id:
+        query = query.filter(model.sensor_id == sensor_id)
+    rows = query.order_by(model.bucket_start, model.sensor_id).all()
+    return [row.to_dict(name) for row, name in rows]
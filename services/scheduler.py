@@ -0,0 +1,134 @@
+import os
+import time
+import heapq
+import random
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from services.metrics import TASK_SECONDS, TASK_FAILURES
+
+# --- CONFIG ---
+SCHEDULER_MAX_WORKERS = int(os.getenv('SCHEDULER_MAX_WORKERS', 4)) # Tasks that can run at the same time
+SCHEDULER_JITTER = 0.1 # Each run is moved by up to ±10% of the interval (processes/tasks don't line up)
+
+class Task:
+    def __init__(self, name, func, interval, jitter):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.version = 0 # Bumped on reschedule; heap entries with an older version are ignored
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0 # Deadlines hit while the previous run was still going
+        self.last_duration = None
+
+class Scheduler:
+    """
+    Runs periodic tasks from a priority queue of next-run deadlines.
+
+    One thread sleeps until the earliest deadline (or until a task is added or
+    rescheduled) and hands due tasks to a thread pool, so a slow task never
+    delays the others. A task never overlaps with itself: if it is still running
+    at its next deadline, that run is skipped.
+    """
+
+    def __init__(self, max_workers=SCHEDULER_MAX_WORKERS):
+        self._tasks = {}
+        self._heap = [] # (deadline, seq, name, version)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="worker-task")
+        self._stopped = False
+
+    def _next_deadline(self, task, now):
+        spread = task.interval * task.jitter
+        return now + task.interval + random.uniform(-spread, spread)
+
+    def _push(self, task, deadline):
+        task.version += 1
+        heapq.heappush(self._heap, (deadline, next(self._seq), task.name, task.version))
+        self._cond.notify()
+
+    def add(self, name, func, interval, delay=None, jitter=SCHEDULER_JITTER):
+        """Run `func` every `interval` seconds; the first run is after `delay` (default: one interval)."""
+        with self._cond:
+            task = Task(name, func, interval, jitter)
+            self._tasks[name] = task
+            now = time.monotonic()
+            self._push(task, now + delay if delay is not None else self._next_deadline(task, now))
+        return task
+
+    def set_interval(self, name, interval):
+        """Change a task's interval; the next run is one new interval from now."""
+        with self._cond:
+            task = self._tasks.get(name)
+            if task is None or task.interval == interval:
+                return False
+            task.interval = interval
+            self._push(task, self._next_deadline(task, time.monotonic()))
+        return True
+
+    def _run_task(self, task):
+        start = time.monotonic()
+        try:
+            task.func()
+        except Exception as e:
+            task.failures += 1
+            TASK_FAILURES.labels(task.name).inc()
+            print(f"❌ Scheduled task '{task.name}' failed: {e}")
+        finally:
+            duration = time.monotonic() - start
+            TASK_SECONDS.labels(task.name).observe(duration)
+            with self._cond:
+                task.running = False
+                task.runs += 1
+                task.last_duration = duration
+
+    def run(self):
+        """Scheduler loop (blocks until stop())."""
+        with self._cond:
+            while not self._stopped:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                deadline, _, name, version = self._heap[0]
+                wait = deadline - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+
+                heapq.heappop(self._heap)
+                task = self._tasks.get(name)
+                if task is None or version != task.version:
+                    continue # Rescheduled since this entry was queued
+                if task.running:
+                    task.skipped += 1
+                else:
+                    task.running = True
+                    self._pool.submit(self._run_task, task)
+                self._push(task, self._next_deadline(task, time.monotonic()))
+
+    def start(self):
+        t = threading.Thread(target=self.run, daemon=True)
+        t.start()
+        return t
+
+    def stop(self, wait=True):
+        """Stop scheduling; queued runs are cancelled and (with `wait`) running ones are waited for."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+    def get_stats(self):
+        with self._cond:
+            return {name: {
+                "interval": t.interval,
+                "running": t.running,
+                "runs": t.runs,
+                "failures": t.failures,
+                "skipped": t.skipped,
+                "last_duration": t.last_duration
+            } for name, t in self._tasks.items()}
@@ -1,61 +1,76 @@
 import time
 import json
+import atexit
 import threading
 from datetime import datetime
 import pytz
 import os
-import requests
+import uuid
+import socket
 from models.db import redis_client, SessionLocal
-from models.sql_models import SensorReading, SystemConfig, Sensor
+from services.publisher import publish_updates, RAW_STREAM_ENABLED, CONFIG_CHANNEL
+from services.raw_persister import start_raw_persister
+from services.rollups import apply_readings, backfill, rollups_ready
+from services.bulk_writer import bulk_insert_readings
+from services.forecast import update_models, warm_up
+from services.retention import enforce_retention, raw_cutoff
+from services.archive import ARCHIVE_ENABLED, archive_closed_months, archived_before, delete_archived, partition_archived
+from services.weather import fetch_weather, mark_published
+from services.scheduler import Scheduler
+from services.read_cache import HISTORY, bump, system_config, weather_sensors
 
 # --- CONFIG ---
 TIMEZONE_QUITO = pytz.timezone('America/Guayaquil')
-SAVE_INTERVAL_MINUTES = 15
+SAVE_INTERVAL_MINUTES = 15 # Default when save_interval_minutes is not configured
+WEATHER_INTERVAL_SECONDS = 2 * 60
+RETENTION_INTERVAL_SECONDS = 60 * 60 # How often the retention policy is enforced
+
+LEADER_KEY = "sensors:worker:leader" # Holder id of the worker lease
+LEADER_LEASE_SECONDS = int(os.getenv('WORKER_LEASE_SECONDS', 15)) # Lease length (failover time)
+LEADER_RENEW_SECONDS = max(1, LEADER_LEASE_SECONDS // 3) # Renewal (and follower retry) period
+
+# Scheduled task names
+WEATHER_TASK = "weather"
+RETENTION_TASK = "retention"
+HISTORY_TASK = "history"
+
+_leader = False # This process currently holds the worker lease
 OPENWEATHER_API_KEY = os.getenv('OPENWEATHER_API_KEY')
 
 def update_weather_sensors():
-    """Fetch data from OpenWeather for all active sensors."""
+    """Fetch data from OpenWeather for all active sensors (concurrent, deduped, cached, see services/weather.py)."""
     if not OPENWEATHER_API_KEY:
         return
 
     session = SessionLocal()
     try:
-        sensors = session.query(Sensor).filter_by(type='openweather', active=True).all()
-        for s in sensors:
-            try:
-                url = f"https://api.openweathermap.org/data/2.5/weather?lat={s.lat}&lon={s.lon}&APPID={OPENWEATHER_API_KEY}"
-                resp = requests.get(url, timeout=5)
-                if resp.status_code == 200:
-                    data = resp.json()
-                    weather_data = {
-                        "temperature": data['main']['temp'] - 273.15,
-                        "humidity": data['main']['humidity'],
-                        "sensor_id": s.id,
-                        "sensor_name": s.name,
-                        "server_time": datetime.now().strftime("%H:%M:%S")
-                    }
-                    
-                    if redis_client:
-                        # Save to Current State
-                        redis_client.hset("sensors:current", str(s.id), json.dumps(weather_data))
-                        
-                        # Publish to Stream
-                        update_msg = {
-                            "sensor_id": s.id,
-                            "data": weather_data,
-                            "server_time": weather_data["server_time"]
-                        }
-                        redis_client.publish("sensors:stream", json.dumps(update_msg))
-                        print(f"☁️ Weather updated for {s.name}")
-            except Exception as e:
-                print(f"⚠️ Error updating weather for {s.name}: {e}")
+        try:
+            sensors = weather_sensors(session)
+        finally:
+            session.close() # Not held open during the HTTP calls
+
+        updates, results = fetch_weather(sensors)
+        for result in results:
+            if "error" in result:
+                print(f"⚠️ Error updating weather for sensor {result['id']}: {result['error']}")
+
+        server_time = datetime.now().strftime("%H:%M:%S")
+        for weather_data in updates:
+            weather_data["server_time"] = server_time
+
+        # Save to Current State + Publish to Stream (one round trip for all sensors)
+        if publish_updates(updates):
+            mark_published(updates)
+            print(f"☁️ Weather updated for {len(updates)} sensor(s)")
     except Exception as e:
         print(f"❌ Error in weather update loop: {e}")
-    finally:
-        session.close()
 
 def guardar_historial():
-    """Reads current state from Redis and saves to SQLite."""
+    """
+    Reads current state from Redis and saves to SQLite.
+    Only used when RAW_STREAM_ENABLED=0; otherwise services/raw_persister.py
+    stores every reading as it arrives.
+    """
     if not redis_client:
         return
 
@@ -67,6 +82,9 @@ def guardar_historial():
             return
 
         session = SessionLocal()
+        # One timestamp for the whole snapshot (stored naive, Quito wall clock as before)
+        now = datetime.now(TIMEZONE_QUITO).replace(tzinfo=None)
+        rows = []
         
         for sensor_id_str, json_val in current_data.items():
             try:
@@ -77,59 +95,262 @@ def guardar_historial():
                     continue 
 
                 data = json.loads(json_val)
+                rows.append((sensor_id, now, data.get("temperature"), data.get("humidity")))
                 
-                reading = SensorReading(
-                    sensor_id=sensor_id,
-                    timestamp=datetime.now(TIMEZONE_QUITO),
-                    temperature=data.get("temperature"),
-                    humidity=data.get("humidity")
-                )
-                session.add(reading)
-                
-            except (json.JSONDecodeError, ValueError) as e:
+            except (json.JSONDecodeError, ValueError, AttributeError) as e:
                 # print(f"⚠️ Error parsing data for sensor {sensor_id_str}: {e}")
                 continue
 
+        # Bulk insert (executemany / COPY) + rollups, in one transaction
+        bulk_insert_readings(session, rows)
+        apply_readings(session, rows)
         session.commit()
+        update_models(rows)
         print(f"💾 [HISTORY] Data saved to SQLite.")
         session.close()
 
     except Exception as e:
         print(f"❌ Error saving history: {e}")
 
-def _worker_loop():
-    """Simple loop that saves data periodically."""
-    print("🚀 Persistence Worker started.")
-    last_save_time = time.time()
-    last_weather_time = 0
-    
-    while True:
-        time.sleep(10) # Check every 10 seconds
-        
-        ahora = time.time()
+def ensure_rollups():
+    """Build the rollup tables from existing readings the first time (older databases)."""
+    session = SessionLocal()
+    try:
+        if not rollups_ready(session):
+            print("🧮 Backfilling hourly/daily rollups...")
+            totals = backfill(session)
+            print(f"✅ Rollups ready: {totals.get('hour', 0)} hourly, {totals.get('day', 0)} daily buckets.")
+    except Exception as e:
+        session.rollback()
+        print(f"⚠️ Error backfilling rollups: {e}")
+    finally:
+        session.close()
+
+def ensure_forecast_models():
+    """Build forecast models from recent history for sensors that don't have one yet."""
+    session = SessionLocal()
+    try:
+        built = warm_up(session)
+        if built:
+            print(f"📈 Forecast models built for {built} sensor(s).")
+    except Exception as e:
+        print(f"⚠️ Error building forecast models: {e}")
+    finally:
+        session.close()
 
-        # 1. Update Weather (Every 2 min)
-        if (ahora - last_weather_time) > (2 * 60):
-            update_weather_sensors()
-            last_weather_time = ahora
+def aplicar_retencion():
+    """
+    Archive closed months to Parquet (if pyarrow is installed), then enforce the
+    retention policy (raw days / rollup months from SystemConfig). Raw rows are
+    only deleted once they are in the archive (late uploads are merged first).
+    """
+    session = SessionLocal()
+    try:
+        raw_floor = delete_raw = can_drop = None
+        if ARCHIVE_ENABLED:
+            delete_raw = delete_archived
+            can_drop = lambda month: partition_archived(session, month)
+            try:
+                archived = archive_closed_months(session, expired_before=raw_cutoff(session))
+                if archived["files"]:
+                    print(f"🗄️ [ARCHIVE] {archived['files']} month file(s), {archived['rows']} rows.")
+                raw_floor = archived_before()
+            except Exception as e:
+                session.rollback()
+                raw_floor = datetime.min # Keep every raw row until archiving works again
+                print(f"⚠️ Error archiving history: {e}")
+        summary = enforce_retention(session, raw_floor=raw_floor, delete_raw=delete_raw, can_drop=can_drop)
+        if summary["raw_deleted"] or summary["partitions_dropped"] or summary["rollups_deleted"]:
+            bump(HISTORY) # Closed windows without an archive copy just changed
+            print(f"🧹 [RETENTION] {summary}")
+    except Exception as e:
+        session.rollback()
+        print(f"⚠️ Error enforcing retention: {e}")
+    finally:
+        session.close()
 
-        # 2. Save History (Dynamic Config)
-        interval_minutes = 15 # Default
+def read_save_interval():
+    """save_interval_minutes from SystemConfig (default SAVE_INTERVAL_MINUTES)."""
+    session = SessionLocal()
+    try:
+        value = system_config(session).get('save_interval_minutes')
+        return _parse_interval(value) if value is not None else SAVE_INTERVAL_MINUTES
+    except Exception as e:
+        print(f"⚠️ Error reading config: {e}")
+        return SAVE_INTERVAL_MINUTES
+    finally:
+        session.close()
+
+def _parse_interval(value):
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return SAVE_INTERVAL_MINUTES
+
+def apply_config(scheduler, changes):
+    """Apply announced SystemConfig changes to the running schedule (keys for tasks not scheduled are no-ops)."""
+    if 'save_interval_minutes' in changes:
+        minutes = _parse_interval(changes['save_interval_minutes'])
+        if scheduler.set_interval(HISTORY_TASK, minutes * 60):
+            print(f"⏱️ History interval set to {minutes}m.")
+
+def _config_listener(scheduler, stop):
+    """Follow CONFIG_CHANNEL; after every (re)connect the DB value is re-read, in case a change was missed."""
+    while not stop.is_set():
+        pubsub = None
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(CONFIG_CHANNEL)
+            apply_config(scheduler, {'save_interval_minutes': read_save_interval()})
+            while not stop.is_set():
+                message = pubsub.get_message(timeout=1.0)
+                if not message or message['type'] != 'message':
+                    continue
+                try:
+                    apply_config(scheduler, json.loads(message['data']))
+                except (json.JSONDecodeError, TypeError, AttributeError):
+                    continue
+        except Exception as e:
+            print(f"❌ Config listener error: {e}. Reconnecting...")
+            time.sleep(1)
+        finally:
+            if pubsub is not None:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+
+def build_scheduler():
+    """Weather, retention and (snapshot mode) history as independent scheduled tasks."""
+    scheduler = Scheduler()
+    scheduler.add(WEATHER_TASK, update_weather_sensors, WEATHER_INTERVAL_SECONDS, delay=0)
+    scheduler.add(RETENTION_TASK, aplicar_retencion, RETENTION_INTERVAL_SECONDS, delay=0)
+    # Snapshot mode only, raw capture persists continuously
+    if not RAW_STREAM_ENABLED:
+        scheduler.add(HISTORY_TASK, guardar_historial, read_save_interval() * 60)
+    return scheduler
+
+class LeaderElection:
+    """
+    Redis lease so that exactly one process (across Gunicorn workers and nodes) runs the worker.
+
+    The leader holds LEADER_KEY (SET NX EX) and renews it every LEADER_RENEW_SECONDS;
+    renew/release only touch the key if it still holds this process's id. If the
+    leader dies, the lease expires and a follower takes over within about
+    LEADER_LEASE_SECONDS + LEADER_RENEW_SECONDS.
+    """
+
+    RENEW_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('expire', KEYS[1], ARGV[2]) end return 0"
+    RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+    def __init__(self, client=None, key=LEADER_KEY, lease=LEADER_LEASE_SECONDS, identity=None):
+        self.client = client or redis_client
+        self.key = key
+        self.lease = lease
+        self.identity = identity or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.expires_at = 0.0 # Local (monotonic) end of the lease we know we hold
+
+    def acquire(self):
+        try:
+            acquired = bool(self.client.set(self.key, self.identity, nx=True, ex=self.lease))
+        except Exception as e:
+            print(f"⚠️ Leader election error: {e}")
+            return False
+        if acquired:
+            self.expires_at = time.monotonic() + self.lease
+        return acquired
+
+    def renew(self):
+        """True while we still hold the lease. A Redis outage is tolerated until the lease would have expired."""
         try:
-             session = SessionLocal()
-             config = session.query(SystemConfig).filter_by(key='save_interval_minutes').first()
-             if config:
-                 interval_minutes = int(config.value)
-             session.close()
+            renewed = bool(self.client.eval(self.RENEW_SCRIPT, 1, self.key, self.identity, self.lease))
         except Exception as e:
-            print(f"⚠️ Error reading config: {e}")
+            print(f"⚠️ Lease renewal error: {e}")
+            return time.monotonic() < self.expires_at - LEADER_RENEW_SECONDS
+        if renewed:
+            self.expires_at = time.monotonic() + self.lease
+        return renewed
+
+    def release(self):
+        try:
+            self.client.eval(self.RELEASE_SCRIPT, 1, self.key, self.identity)
+        except Exception:
+            pass
+        self.expires_at = 0.0
+
+    def current_leader(self):
+        return self.client.get(self.key)
+
+def _worker_loop(stop):
+    """Start-up work, then the task scheduler until `stop` is set (leadership lost)."""
+    print("🚀 Persistence Worker started.")
+    ensure_rollups()
+    ensure_forecast_models()
+    if stop.is_set():
+        return
+    persister = None
+    if RAW_STREAM_ENABLED:
+        persister = start_raw_persister(stop) # After the backfill, so the two never race on the rollup tables
+
+    scheduler = build_scheduler()
+    if redis_client: # Raw and snapshot mode alike
+        threading.Thread(target=_config_listener, args=(scheduler, stop), daemon=True).start()
+    scheduler.start()
+    stop.wait()
+    scheduler.stop() # Waits for running tasks, so they never overlap with the next leader's
+    if persister:
+        persister.join()
+    print("🛑 Persistence Worker stopped.")
+
+def _election_loop(election):
+    """
+    Follower until the lease is won; then run the worker while renewing it.
+    After stepping down, this process stays out of the election until its
+    worker (and every task it was running) has finished.
+    """
+    global _leader
+    worker = None
+    while True:
+        if worker and worker.is_alive():
+            worker.join(LEADER_RENEW_SECONDS)
+            continue
+        if not election.acquire():
+            time.sleep(LEADER_RENEW_SECONDS)
+            continue
+
+        print(f"👑 Worker leadership acquired ({election.identity}).")
+        _leader = True
+        stop = threading.Event()
+        worker = threading.Thread(target=_worker_loop, args=(stop,), daemon=True)
+        worker.start()
+        while True:
+            time.sleep(LEADER_RENEW_SECONDS)
+            if not election.renew():
+                break
+        _leader = False
+        print(f"⚠️ Worker leadership lost ({election.identity}), stopping tasks.")
+        stop.set()
+        worker.join(timeout=LEADER_LEASE_SECONDS)
+        if worker.is_alive():
+            print("⏳ Previous worker still finishing its tasks, staying out of the election until it stops.")
 
-        if (ahora - last_save_time) > (interval_minutes * 60):
-             print(f"⏱️ Interval of {interval_minutes}m reached. Saving history...")
-             guardar_historial()
-             last_save_time = ahora
+def is_leader():
+    """Whether this process currently runs the worker."""
+    return _leader
 
 def start_sensor_worker():
-    """Start the worker in a background thread."""
-    t = threading.Thread(target=_worker_loop, daemon=True)
-    t.start()
\ No newline at end of file
+    """
+    Start the worker in a background thread. With Redis, every process joins
+    the leader election and only the leader persists and polls; without Redis
+    (single process) the worker just runs.
+    """
+    global _leader
+    if redis_client:
+        election = LeaderElection()
+        atexit.register(election.release) # Clean shutdown hands over at once instead of after the lease
+        t = threading.Thread(target=_election_loop, args=(election,), daemon=True)
+    else:
+        _leader = True
+        t = threading.Thread(target=_worker_loop, args=(threading.Event(),), daemon=True)
+    t.start()
+    return t
@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from models.db import redis_client
+from services.publisher import STREAM_CHANNEL
+
+# --- CONFIG ---
+CLIENT_QUEUE_SIZE = int(os.getenv('STREAM_CLIENT_QUEUE_SIZE', 100)) # Messages buffered per SSE client
+KEEPALIVE_SECONDS = 15 # Idle clients get a comment frame so dead sockets are detected
+STREAM_COALESCE_MS = int(os.getenv('STREAM_COALESCE_MS', 1000)) # Max one frame per sensor per window (0 = off)
+
+class StreamClient:
+    """
+    Bounded per-client buffer fed by the shared subscriber.
+    When a slow consumer's buffer is full, the older message for the same
+    sensor is replaced (coalesced); if there is none, the oldest message is dropped.
+    `sensor_ids` (optional set) restricts the client to those sensors.
+    """
+
+    def __init__(self, maxsize=CLIENT_QUEUE_SIZE, sensor_ids=None):
+        self.maxsize = maxsize
+        self.sensor_ids = sensor_ids
+        self.dropped = 0
+        self._buffer = deque() # (sensor_id, raw json)
+        self._cond = threading.Condition()
+
+    def push(self, sensor_id, raw):
+        if self.sensor_ids is not None and sensor_id not in self.sensor_ids:
+            return
+        with self._cond:
+            if len(self._buffer) >= self.maxsize:
+                self._evict(sensor_id)
+                self.dropped += 1
+            self._buffer.append((sensor_id, raw))
+            self._cond.notify()
+
+    def _evict(self, sensor_id):
+        if sensor_id is not None:
+            for i, (sid, _) in enumerate(self._buffer):
+                if sid == sensor_id:
+                    del self._buffer[i]
+                    return
+        self._buffer.popleft()
+
+    def drain(self, timeout=KEEPALIVE_SECONDS):
+        """Block until messages are available (or timeout) and return them all."""
+        with self._cond:
+            if not self._buffer:
+                self._cond.wait(timeout)
+            messages = [raw for _, raw in self._buffer]
+            self._buffer.clear()
+            return messages
+
+    def depth(self):
+        return len(self._buffer)
+
+class Coalescer:
+    """
+    Per-sensor rate limit applied once per process, before the fan-out.
+    The first update of a sensor goes out immediately; further updates inside
+    the window are held back and only the latest one is sent when it closes.
+    Not thread-safe: owned by the subscriber loop.
+    """
+
+    def __init__(self, window_ms=STREAM_COALESCE_MS):
+        self.window = window_ms / 1000
+        self._last_sent = {} # sensor_id -> monotonic time of last frame
+        self._pending = {} # sensor_id -> latest held-back message
+
+    def offer(self, sensor_id, raw, now):
+        """Returns the message if it may be sent now, otherwise holds it and returns None."""
+        if self.window <= 0 or sensor_id is None:
+            return raw
+        last = self._last_sent.get(sensor_id)
+        if last is None or now - last >= self.window:
+            self._last_sent[sensor_id] = now
+            self._pending.pop(sensor_id, None)
+            return raw
+        self._pending[sensor_id] = raw
+        return None
+
+    def due(self, now):
+        """Held-back messages whose window has closed, as (sensor_id, raw)."""
+        ready = [sid for sid in self._pending if now - self._last_sent[sid] >= self.window]
+        for sid in ready:
+            self._last_sent[sid] = now
+        return [(sid, self._pending.pop(sid)) for sid in ready]
+
+    def next_timeout(self, now, default=1.0):
+        """Seconds until the next held-back message is due (for the subscriber's poll timeout)."""
+        if not self._pending:
+            return default
+        earliest = min(self._last_sent[sid] for sid in self._pending)
+        return max(0.0, min(default, earliest + self.window - now))
+
+def parse_sensor_id(raw):
+    try:
+        return json.loads(raw).get("sensor_id")
+    except (json.JSONDecodeError, AttributeError):
+        return None
+
+def parse_sensor_filter(value):
+    """'1,2,5' (the ?sensors= query param) -> frozenset({1, 2, 5}); empty/invalid -> None (all sensors)."""
+    if not value:
+        return None
+    ids = set()
+    for part in value.split(","):
+        try:
+            ids.add(int(part))
+        except ValueError:
+            continue
+    return frozenset(ids) or None
+
+def snapshot_messages(current_data, sensor_ids=None):
+    """
+    Turn the sensors:current hash into stream-shaped JSON messages
+    (msg.sensor_id && msg.data, as app.js expects) for a client's initial state.
+    """
+    for sensor_id, json_val in current_data.items():
+        # Skip legacy/invalid keys strictly
+        try:
+            if sensor_ids is not None and int(sensor_id) not in sensor_ids:
+                continue
+            data_obj = json.loads(json_val)
+            envelope = {
+                "sensor_id": int(sensor_id),
+                "data": data_obj,
+                "server_time": data_obj.get("server_time") or "Init"
+            }
+        except (ValueError, json.JSONDecodeError, AttributeError):
+            continue
+        yield json.dumps(envelope)
+
+_clients = set()
+_clients_lock = threading.Lock()
+_listener = None
+_listener_lock = threading.Lock()
+
+def _fan_out(sensor_id, raw):
+    with _clients_lock:
+        clients = list(_clients)
+    for client in clients:
+        client.push(sensor_id, raw)
+
+def _listener_loop():
+    """Single Redis subscription per process, coalesced and fanned out to every SSE client."""
+    print("📡 Stream hub subscriber started.")
+    coalescer = Coalescer()
+    while True:
+        pubsub = None
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(STREAM_CHANNEL)
+            while True:
+                message = pubsub.get_message(timeout=coalescer.next_timeout(time.monotonic()))
+                now = time.monotonic()
+                if message and message['type'] == 'message':
+                    sensor_id = parse_sensor_id(message['data'])
+                    raw = coalescer.offer(sensor_id, message['data'], now)
+                    if raw is not None:
+                        _fan_out(sensor_id, raw)
+                for sensor_id, raw in coalescer.due(now):
+                    _fan_out(sensor_id, raw)
+        except Exception as e:
+            print(f"❌ Stream hub subscriber error: {e}. Reconnecting...")
+            time.sleep(1)
+        finally:
+            if pubsub is not None:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+
+def _ensure_listener():
+    global _listener
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = threading.Thread(target=_listener_loop, daemon=True)
+            _listener.start()
+
+def register_client(sensor_ids=None):
+    """Attach a new SSE client. Starts the subscriber thread on first use."""
+    if not redis_client:
+        return None
+    client = StreamClient(sensor_ids=sensor_ids)
+    with _clients_lock:
+        _clients.add(client)
+    _ensure_listener()
+    return client
+
+def unregister_client(client):
+    with _clients_lock:
+        _clients.discard(client)
+
+def get_stats():
+    with _clients_lock:
+        clients = list(_clients)
+    return {
+        "clients": len(clients),
+        "listener_alive": bool(_listener and _listener.is_alive()),
+        "queued": sum(c.depth() for c in clients),
+        "max_depth": max((c.depth() for c in clients), default=0),
+        "dropped": sum(c.dropped for c in clients)
+    }
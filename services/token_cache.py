@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from sqlalchemy import select
+from models.db import redis_client, SessionLocal
+from models.sql_models import Sensor
+
+# --- CONFIG ---
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 4096))
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', 30)) # Seconds a local entry is trusted
+TOKEN_NEGATIVE_TTL = int(os.getenv('TOKEN_NEGATIVE_TTL', 60)) # Seconds a bad token is remembered
+
+REDIS_TOKENS_KEY = "sensors:tokens" # Hash: token -> {"id", "name"}
+REDIS_INVALID_PREFIX = "sensors:tokens:invalid:" # String keys with EX for unknown tokens
+
+_MISS = object()
+
+# token -> (expires_at, sensor dict or None for a known-bad token)
+_local = OrderedDict()
+_lock = threading.Lock()
+_stats = {
+    "local_hits": 0,
+    "redis_hits": 0,
+    "db_lookups": 0,
+    "negative_hits": 0,
+}
+
+def _sensor_entry(sensor):
+    return {"id": sensor.id, "name": sensor.name}
+
+def _store_local(token, value):
+    ttl = TOKEN_CACHE_TTL if value is not None else TOKEN_NEGATIVE_TTL
+    with _lock:
+        _local[token] = (time.monotonic() + ttl, value)
+        _local.move_to_end(token)
+        while len(_local) > TOKEN_CACHE_SIZE:
+            _local.popitem(last=False)
+
+def _lookup_redis(token):
+    """Returns the cached sensor dict, None for a known-bad token or _MISS."""
+    if not redis_client:
+        return _MISS
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hget(REDIS_TOKENS_KEY, token)
+        pipe.exists(REDIS_INVALID_PREFIX + token)
+        raw, invalid = pipe.execute()
+    except Exception as e:
+        print(f"⚠️ Token cache Redis lookup failed: {e}")
+        return _MISS
+    return _parse_redis_result(raw, invalid)
+
+def _lookup_db(token):
+    session = SessionLocal()
+    try:
+        sensor = session.query(Sensor).filter_by(token=token, type='esp32').first()
+        return _sensor_entry(sensor) if sensor else None
+    finally:
+        session.close()
+
+def _store_redis(token, value):
+    if not redis_client:
+        return
+    try:
+        if value is not None:
+            redis_client.hset(REDIS_TOKENS_KEY, token, json.dumps(value))
+        else:
+            redis_client.set(REDIS_INVALID_PREFIX + token, "1", ex=TOKEN_NEGATIVE_TTL)
+    except Exception as e:
+        print(f"⚠️ Token cache Redis write failed: {e}")
+
+def _lookup_local(token):
+    now = time.monotonic()
+    with _lock:
+        entry = _local.get(token)
+        if entry and entry[0] > now:
+            _local.move_to_end(token)
+            if entry[1] is None:
+                _stats["negative_hits"] += 1
+            else:
+                _stats["local_hits"] += 1
+            return entry[1]
+    return _MISS
+
+def _count_redis_result(value):
+    with _lock:
+        if value is None:
+            _stats["negative_hits"] += 1
+        else:
+            _stats["redis_hits"] += 1
+
+def _parse_redis_result(raw, invalid):
+    if raw:
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError:
+            return _MISS
+    if invalid:
+        return None
+    return _MISS
+
+def resolve_token(token):
+    """
+    Resolve an ESP32 token to {"id", "name"} or None if the token is invalid.
+    Lookup order: in-process LRU -> Redis hash -> database.
+    """
+    value = _lookup_local(token)
+    if value is not _MISS:
+        return value
+
+    value = _lookup_redis(token)
+    if value is not _MISS:
+        _count_redis_result(value)
+        _store_local(token, value)
+        return value
+
+    with _lock:
+        _stats["db_lookups"] += 1
+    value = _lookup_db(token)
+    _store_redis(token, value)
+    _store_local(token, value)
+    return value
+
+async def resolve_token_async(token, aredis, session_factory):
+    """
+    Same lookup chain as resolve_token() for the ASGI routes, using a
+    redis.asyncio client and an async SQLAlchemy session factory.
+    Shares the in-process LRU and counters with the sync path.
+    """
+    value = _lookup_local(token)
+    if value is not _MISS:
+        return value
+
+    try:
+        pipe = aredis.pipeline(transaction=False)
+        pipe.hget(REDIS_TOKENS_KEY, token)
+        pipe.exists(REDIS_INVALID_PREFIX + token)
+        raw, invalid = await pipe.execute()
+        value = _parse_redis_result(raw, invalid)
+    except Exception as e:
+        print(f"⚠️ Token cache Redis lookup failed: {e}")
+        value = _MISS
+
+    if value is not _MISS:
+        _count_redis_result(value)
+        _store_local(token, value)
+        return value
+
+    with _lock:
+        _stats["db_lookups"] += 1
+    async with session_factory() as session:
+        result = await session.execute(select(Sensor).filter_by(token=token, type='esp32').limit(1))
+        sensor = result.scalars().first()
+        value = _sensor_entry(sensor) if sensor else None
+
+    try:
+        if value is not None:
+            await aredis.hset(REDIS_TOKENS_KEY, token, json.dumps(value))
+        else:
+            await aredis.set(REDIS_INVALID_PREFIX + token, "1", ex=TOKEN_NEGATIVE_TTL)
+    except Exception as e:
+        print(f"⚠️ Token cache Redis write failed: {e}")
+    _store_local(token, value)
+    return value
+
+def cache_sensor(sensor):
+    """Prime the cache for a freshly created ESP32 sensor."""
+    if not sensor.token:
+        return
+    value = _sensor_entry(sensor)
+    if redis_client:
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.delete(REDIS_INVALID_PREFIX + sensor.token)
+            pipe.hset(REDIS_TOKENS_KEY, sensor.token, json.dumps(value))
+            pipe.execute()
+        except Exception as e:
+            print(f"⚠️ Token cache Redis write failed: {e}")
+    _store_local(sensor.token, value)
+
+def invalidate_token(token):
+    """
+    Drop a token from every cache layer (e.g. after the sensor is deleted).
+    Other processes keep their local entry for at most TOKEN_CACHE_TTL seconds.
+    """
+    if not token:
+        return
+    with _lock:
+        _local.pop(token, None)
+    if redis_client:
+        try:
+            redis_client.hdel(REDIS_TOKENS_KEY, token)
+        except Exception as e:
+            print(f"⚠️ Token cache Redis delete failed: {e}")
+
+def get_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats["local_size"] = len(_local)
+    lookups = stats["local_hits"] + stats["redis_hits"] + stats["negative_hits"] + stats["db_lookups"]
+    stats["hit_ratio"] = round((lookups - stats["db_lookups"]) / lookups, 4) if lookups else 0.0
+    return stats
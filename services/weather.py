@@ -0,0 +1,162 @@
+import os
+import time
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+# --- CONFIG ---
+OPENWEATHER_API_KEY = os.getenv('OPENWEATHER_API_KEY')
+OPENWEATHER_URL = os.getenv('OPENWEATHER_URL', 'https://api.openweathermap.org/data/2.5/weather')
+WEATHER_MAX_WORKERS = int(os.getenv('WEATHER_MAX_WORKERS', 4)) # Concurrent requests (and pooled connections)
+WEATHER_TIMEOUT = float(os.getenv('WEATHER_TIMEOUT', 5)) # Seconds per request
+WEATHER_CACHE_TTL = int(os.getenv('WEATHER_CACHE_TTL', 300)) # Seconds a location's reading is reused (OpenWeather refreshes ~10 min)
+COORD_PRECISION = 2 # Sensors whose lat/lon round to the same value (~1 km) share one request
+BACKOFF_INITIAL_SECONDS = 30 # After a 429 without Retry-After; doubles on each consecutive 429
+BACKOFF_MAX_SECONDS = 15 * 60
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_session = None
+_session_lock = threading.Lock()
+_cache = {} # (lat, lon) -> (expires_at, {"temperature", "humidity"})
+_cache_lock = threading.Lock()
+_published = {} # sensor_id -> observation timestamp last published (see mark_published())
+_backoff = {"until": 0.0, "delay": 0} # Shared by every thread: no requests while rate limited
+
+class RateLimited(Exception):
+    pass
+
+def get_session():
+    """One pooled requests.Session per process (keep-alive across polls)."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=WEATHER_MAX_WORKERS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+def location_key(lat, lon):
+    return (round(float(lat), COORD_PRECISION), round(float(lon), COORD_PRECISION))
+
+def _cached(key, now):
+    with _cache_lock:
+        entry = _cache.get(key)
+    if entry and entry[0] > now:
+        return entry[1]
+    return None
+
+def _rate_limited(now):
+    return now < _backoff["until"]
+
+def _start_backoff(response):
+    retry_after = response.headers.get("Retry-After")
+    with _cache_lock:
+        if retry_after and retry_after.isdigit():
+            delay = int(retry_after)
+        else:
+            delay = min(max(_backoff["delay"] * 2, BACKOFF_INITIAL_SECONDS), BACKOFF_MAX_SECONDS)
+        _backoff["delay"] = delay
+        _backoff["until"] = max(_backoff["until"], time.monotonic() + delay)
+    print(f"⚠️ OpenWeather rate limit hit, pausing requests for {delay}s")
+
+def fetch_location(key, api_key=None):
+    """Current {"temperature" (°C), "humidity", "timestamp"} at a rounded (lat, lon). Raises on failure."""
+    now = time.monotonic()
+    cached = _cached(key, now)
+    if cached:
+        return cached
+    if _rate_limited(now):
+        raise RateLimited("rate limited by OpenWeather")
+
+    lat, lon = key
+    try:
+        resp = get_session().get(OPENWEATHER_URL, params={
+            "lat": lat, "lon": lon, "APPID": api_key or OPENWEATHER_API_KEY
+        }, timeout=WEATHER_TIMEOUT)
+    except requests.RequestException as e:
+        # requests' messages include the URL, and with it the API key
+        raise RuntimeError(f"OpenWeather request failed ({type(e).__name__})") from None
+    if resp.status_code == 429:
+        _start_backoff(resp)
+        raise RateLimited("rate limited by OpenWeather")
+    if resp.status_code != 200:
+        raise RuntimeError(f"OpenWeather HTTP {resp.status_code}")
+
+    data = resp.json()
+    reading = {
+        "temperature": data['main']['temp'] - 273.15,
+        "humidity": data['main']['humidity']
+    }
+    if data.get('dt'): # Observation time: the same one is served until OpenWeather refreshes the station
+        reading["timestamp"] = datetime.fromtimestamp(data['dt']).strftime(TIMESTAMP_FORMAT)
+    with _cache_lock:
+        _cache[key] = (time.monotonic() + WEATHER_CACHE_TTL, reading)
+        _backoff["delay"] = 0
+    return reading
+
+def fetch_weather(sensors, api_key=None, max_workers=WEATHER_MAX_WORKERS):
+    """
+    Current weather for OpenWeather sensors, given as (id, name, lat, lon) tuples.
+
+    Sensors are grouped by rounded coordinates (one request per location),
+    locations are fetched concurrently over a pooled session, fresh results
+    come from a TTL cache, and a 429 pauses every request until the backoff ends.
+    Sensors whose observation was already published (mark_published()) get
+    status "unchanged" and no update, so a cached or not yet refreshed reading
+    is not stored twice.
+    Returns (updates, results): sensor_data dicts ready for publish_updates(),
+    and one {"id", "status"} / {"id", "error"} per sensor.
+    """
+    locations = {}
+    for sensor in sensors:
+        try:
+            locations.setdefault(location_key(sensor[2], sensor[3]), []).append(sensor)
+        except (TypeError, ValueError):
+            continue
+
+    outcomes = {}
+    if locations:
+        workers = max(1, min(max_workers, len(locations)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {key: pool.submit(fetch_location, key, api_key) for key in locations}
+        for key, future in futures.items():
+            try:
+                outcomes[key] = future.result()
+            except Exception as e:
+                outcomes[key] = e
+
+    with _cache_lock:
+        published = dict(_published)
+    updates, results = [], []
+    for sensor in sensors:
+        sensor_id, name = sensor[0], sensor[1]
+        try:
+            outcome = outcomes.get(location_key(sensor[2], sensor[3]))
+        except (TypeError, ValueError):
+            outcome = ValueError("invalid coordinates")
+        if not isinstance(outcome, dict):
+            results.append({"id": sensor_id, "error": str(outcome)})
+        elif outcome.get("timestamp") and published.get(sensor_id) == outcome["timestamp"]:
+            results.append({"id": sensor_id, "status": "unchanged"})
+        else:
+            updates.append({**outcome, "sensor_id": sensor_id, "sensor_name": name})
+            results.append({"id": sensor_id, "status": "ok"})
+    return updates, results
+
+def mark_published(updates):
+    """Remember the observations of `updates` (call once publish_updates() succeeded)."""
+    with _cache_lock:
+        for update in updates:
+            if update.get("timestamp"):
+                _published[update["sensor_id"]] = update["timestamp"]
+
+def clear_cache():
+    """Forget cached readings and any running backoff."""
+    with _cache_lock:
+        _cache.clear()
+        _backoff["until"] = 0.0
+        _backoff["delay"] = 0
@@ -1,7 +1,9 @@
 #include <WiFi.h>
 #include <HTTPClient.h>
+#include <WiFiUdp.h>
 #include <DHT.h>
 #include <ArduinoJson.h> // Make sure to install ArduinoJson library via Library Manager
+#include <time.h>
 
 // ---------------------------------------------------------------------------
 // 1. CONFIGURATION
@@ -19,6 +21,24 @@ const char* serverBaseUrl = "http://YOUR_SERVER_IP:5000";
 // Update Interval (Milliseconds)
 const unsigned long interval = 10000; // 10 seconds
 
+// Offline Buffer
+// Readings are timestamped (NTP) and kept in RAM while WiFi is down,
+// then flushed in a single request to /api/ingest/batch.
+#define BUFFER_SIZE 360       // 1 hour at 10s interval (oldest readings are dropped when full)
+#define MAX_BATCH_UPLOAD 60   // Readings per HTTP request when flushing
+const char* ntpServer = "pool.ntp.org";
+
+// Binary UDP transport (optional)
+// Sends 15-byte frames instead of HTTP + JSON (layout in services/binary_frame.py):
+// much less airtime per reading. The server needs BINARY_INGEST_PORT set.
+// UDP has no acknowledgement: buffered readings are sent once, then dropped.
+#define USE_BINARY_UDP 0
+const char* udpServerHost = "YOUR_SERVER_IP";
+const uint16_t udpServerPort = 5683;
+#define FRAME_VERSION 1
+#define FRAME_SIZE 15
+#define FRAMES_PER_DATAGRAM 60  // 900 bytes per packet, below the 1500-byte MTU
+
 // Sensor Configuration
 #define DHTPIN 4     // Digital Pin connected to DHT Sensor
 #define DHTTYPE DHT22   // DHT 11 or DHT 22
@@ -30,6 +50,20 @@ const unsigned long interval = 10000; // 10 seconds
 DHT dht(DHTPIN, DHTTYPE);
 unsigned long lastSendTime = 0;
 
+struct Reading {
+  uint32_t timestamp; // Epoch seconds (UTC)
+  float temperature;
+  float humidity;
+};
+
+WiFiUDP udp;
+uint8_t tokenId[6];       // Hex digits of the token as raw bytes (binary frames)
+bool tokenIdValid = false;
+
+Reading buffer[BUFFER_SIZE];
+int bufferStart = 0;  // Index of the oldest reading
+int bufferCount = 0;
+
 // SENSOR TOKEN (Get this from the Web Panel -> Config -> Add Sensor)
 // You can hardcode it here or manage multiple devices
 String deviceToken = "PASTE_YOUR_TOKEN_HERE"; 
@@ -56,21 +90,146 @@ void setup() {
   Serial.println("\nWiFi Connected!");
   Serial.print("IP Address: ");
   Serial.println(WiFi.localIP());
+
+  // Sync clock so buffered readings carry the time they were taken
+  configTime(0, 0, ntpServer);
+
+  tokenIdValid = parseTokenId();
+  if (USE_BINARY_UDP && !tokenIdValid) {
+    Serial.println("Token is not key_ + 12 hex digits: binary frames disabled.");
+  }
 }
 
 // ---------------------------------------------------------------------------
-// 4. MAIN LOOP
+// 4. BUFFER HELPERS
 // ---------------------------------------------------------------------------
-void loop() {
-  // Check Wifi Status
-  if(WiFi.status() != WL_CONNECTED) {
-    Serial.println("WiFi Disconnected. Reconnecting...");
-    WiFi.disconnect();
-    WiFi.reconnect();
-    delay(5000);
-    return;
+void bufferPush(uint32_t ts, float t, float h) {
+  if (bufferCount == BUFFER_SIZE) {
+    // Full: overwrite the oldest reading
+    bufferStart = (bufferStart + 1) % BUFFER_SIZE;
+    bufferCount--;
+  }
+  int idx = (bufferStart + bufferCount) % BUFFER_SIZE;
+  buffer[idx] = { ts, t, h };
+  bufferCount++;
+}
+
+// Sends up to MAX_BATCH_UPLOAD readings. Returns true if they were accepted.
+bool flushBuffer() {
+  int n = bufferCount < MAX_BATCH_UPLOAD ? bufferCount : MAX_BATCH_UPLOAD;
+  if (n == 0) return true;
+
+  DynamicJsonDocument doc(256 + n * 96);
+  doc["token"] = deviceToken;
+  JsonArray readings = doc.createNestedArray("readings");
+  for (int i = 0; i < n; i++) {
+    Reading& r = buffer[(bufferStart + i) % BUFFER_SIZE];
+    JsonObject obj = readings.createNestedObject();
+    obj["timestamp"] = r.timestamp;
+    obj["temperature"] = r.temperature;
+    obj["humidity"] = r.humidity;
+  }
+
+  String jsonOutput;
+  serializeJson(doc, jsonOutput);
+
+  HTTPClient http;
+  String url = String(serverBaseUrl) + "/api/ingest/batch";
+
+  Serial.printf("Flushing %d reading(s) to: %s\n", n, url.c_str());
+
+  http.begin(url);
+  http.addHeader("Content-Type", "application/json");
+
+  int httpResponseCode = http.POST(jsonOutput);
+  bool ok = false;
+
+  if (httpResponseCode > 0) {
+    String response = http.getString();
+    Serial.printf("HTTP Response code: %d\n", httpResponseCode);
+    Serial.println(response);
+    // 400 means the readings themselves were rejected: drop them instead of retrying forever
+    ok = httpResponseCode == 200 || httpResponseCode == 400;
+  } else {
+    Serial.printf("Error code: %d\n", httpResponseCode);
   }
 
+  http.end();
+
+  if (ok) {
+    bufferStart = (bufferStart + n) % BUFFER_SIZE;
+    bufferCount -= n;
+  }
+  return ok;
+}
+
+// ---------------------------------------------------------------------------
+// 5. BINARY FRAMES (UDP)
+// ---------------------------------------------------------------------------
+int hexValue(char c) {
+  if (c >= '0' && c <= '9') return c - '0';
+  if (c >= 'a' && c <= 'f') return c - 'a' + 10;
+  if (c >= 'A' && c <= 'F') return c - 'A' + 10;
+  return -1;
+}
+
+// "key_0123456789ab" -> tokenId = {0x01, 0x23, 0x45, 0x67, 0x89, 0xab}
+bool parseTokenId() {
+  if (deviceToken.length() != 16 || !deviceToken.startsWith("key_")) return false;
+  for (int i = 0; i < 6; i++) {
+    int hi = hexValue(deviceToken[4 + i * 2]);
+    int lo = hexValue(deviceToken[5 + i * 2]);
+    if (hi < 0 || lo < 0) return false;
+    tokenId[i] = (hi << 4) | lo;
+  }
+  return true;
+}
+
+// Value x 100 as int16; -32768 means "not measured"
+int16_t scaleValue(float v) {
+  if (isnan(v)) return -32768;
+  long s = lroundf(v * 100);
+  if (s < -32767) s = -32767;
+  if (s > 32767) s = 32767;
+  return (int16_t) s;
+}
+
+// Frame: version(1) token(6) timestamp(4) temperature(2) humidity(2), big-endian
+void encodeFrame(uint8_t* p, const Reading& r) {
+  int16_t t = scaleValue(r.temperature);
+  int16_t h = scaleValue(r.humidity);
+  p[0] = FRAME_VERSION;
+  memcpy(p + 1, tokenId, 6);
+  p[7] = r.timestamp >> 24; p[8] = r.timestamp >> 16; p[9] = r.timestamp >> 8; p[10] = r.timestamp;
+  p[11] = (uint16_t) t >> 8; p[12] = (uint16_t) t & 0xFF;
+  p[13] = (uint16_t) h >> 8; p[14] = (uint16_t) h & 0xFF;
+}
+
+// Sends up to FRAMES_PER_DATAGRAM readings in one UDP packet. Returns true if it went out.
+bool flushBufferUdp() {
+  int n = bufferCount < FRAMES_PER_DATAGRAM ? bufferCount : FRAMES_PER_DATAGRAM;
+  if (n == 0) return true;
+  if (!tokenIdValid) return false; // Keep buffering; fix deviceToken
+
+  static uint8_t packet[FRAMES_PER_DATAGRAM * FRAME_SIZE];
+  for (int i = 0; i < n; i++) {
+    encodeFrame(packet + i * FRAME_SIZE, buffer[(bufferStart + i) % BUFFER_SIZE]);
+  }
+
+  if (!udp.beginPacket(udpServerHost, udpServerPort)) return false;
+  udp.write(packet, n * FRAME_SIZE);
+  if (!udp.endPacket()) return false;
+
+  Serial.printf("Sent %d frame(s) (%d bytes) over UDP\n", n, n * FRAME_SIZE);
+  bufferStart = (bufferStart + n) % BUFFER_SIZE;
+  bufferCount -= n;
+  return true;
+}
+
+// ---------------------------------------------------------------------------
+// 6. MAIN LOOP
+// ---------------------------------------------------------------------------
+void loop() {
   unsigned long currentMillis = millis();
 
   if (currentMillis - lastSendTime >= interval) {
@@ -83,40 +242,42 @@ void loop() {
     // Check if read failed
     if (isnan(h) || isnan(t)) {
       Serial.println("Failed to read from DHT sensor!");
-      return;
+    } else {
+      Serial.printf("Temp: %.1fC, Hum: %.1f%%\n", t, h);
+
+      time_t now;
+      time(&now);
+      if (now > 1577836800) { // Clock synced (after 2020-01-01)
+        bufferPush((uint32_t) now, t, h);
+      } else {
+        Serial.println("Clock not synced yet, skipping reading.");
+      }
     }
+  }
 
-    Serial.printf("Temp: %.1fC, Hum: %.1f%%\n", t, h);
-
-    // 2. Prepare JSON Payload
-    // Uses ArduinoJson (StaticJsonDocument for small payload)
-    StaticJsonDocument<200> doc;
-    doc["temperature"] = t;
-    doc["humidity"] = h;
-    
-    String jsonOutput;
-    serializeJson(doc, jsonOutput);
-
-    // 3. Send HTTP POST
-    HTTPClient http;
-    String url = String(serverBaseUrl) + "/api/ingest/" + deviceToken;
-    
-    Serial.print("Sending data to: ");
-    Serial.println(url);
-
-    http.begin(url);
-    http.addHeader("Content-Type", "application/json");
-
-    int httpResponseCode = http.POST(jsonOutput);
-
-    if (httpResponseCode > 0) {
-      String response = http.getString();
-      Serial.printf("HTTP Response code: %d\n", httpResponseCode);
-      Serial.println(response);
-    } else {
-      Serial.printf("Error code: %d\n", httpResponseCode);
+  // 2. Check Wifi Status (keep buffering while offline)
+  if(WiFi.status() != WL_CONNECTED) {
+    static unsigned long lastReconnect = 0;
+    if (currentMillis - lastReconnect >= 5000) {
+      lastReconnect = currentMillis;
+      Serial.printf("WiFi Disconnected (%d buffered). Reconnecting...\n", bufferCount);
+      WiFi.disconnect();
+      WiFi.reconnect();
     }
+    return;
+  }
 
-    http.end();
+  // 3. Flush buffered readings in batches (one request per batch)
+  static unsigned long lastFlushFailure = 0;
+  if (lastFlushFailure != 0 && currentMillis - lastFlushFailure < 5000) {
+    return; // Back off after a failed upload
+  }
+  lastFlushFailure = 0;
+  while (bufferCount > 0) {
+    bool sent = USE_BINARY_UDP ? flushBufferUdp() : flushBuffer();
+    if (!sent) {
+      lastFlushFailure = currentMillis; // Server unreachable, retry later
+      break;
+    }
   }
 }
@@ -32,11 +32,13 @@ export const fetchOpenWeatherMapData = async () => {
 
 /**
  * Hourly history
+ * maxPoints: optional, server downsamples (LTTB) to at most N points per sensor
  */
-export const fetchHourlyHistory = async (hours, sensorId) => {
+export const fetchHourlyHistory = async (hours, sensorId, maxPoints) => {
   try {
     let url = `/api/history?hours=${hours}`;
     if(sensorId && sensorId !== 'all') url += `&sensor_id=${sensorId}`;
+    if(maxPoints) url += `&max_points=${maxPoints}`;
     
     const response = await fetch(url);
 
@@ -53,6 +55,62 @@ export const fetchHourlyHistory = async (hours, sensorId) => {
   }
 };
 
+/**
+ * Server-side analytics (stats, outages, uptime, daily SD over every reading in the range)
+ */
+export const fetchAnalytics = async (hours, sensorId) => {
+  try {
+    let url = `/api/analytics?hours=${hours}`;
+    if(sensorId && sensorId !== 'all') url += `&sensor_id=${sensorId}`;
+
+    const response = await fetch(url);
+
+    if (!response.ok) throw new Error(`HTTP Error: ${response.status}`);
+    const json = await response.json();
+
+    if (!json.success) throw new Error("API responded with success: false");
+    return json;
+
+  } catch (error) {
+    console.error("Error fetching analytics:", error);
+    setError(`Error loading analytics: ${error.message}`);
+    return null;
+  }
+};
+
+/**
+ * Forecast from the server-side incremental models
+ * times: local wall-clock strings "YYYY-MM-DD HH:MM:SS"
+ */
+export const fetchForecast = async (times, sensorId) => {
+  try {
+    const params = new URLSearchParams();
+    times.forEach(t => params.append('at', t));
+    if(sensorId && sensorId !== 'all') params.append('sensor_id', sensorId);
+
+    const response = await fetch(`/api/forecast?${params.toString()}`);
+
+    if (!response.ok) throw new Error(`HTTP Error: ${response.status}`);
+    const json = await response.json();
+
+    if (!json.success) throw new Error("API responded with success: false");
+    return json.sensors;
+
+  } catch (error) {
+    console.error("Error fetching forecast:", error);
+    return [];
+  }
+};
+
+/**
+ * Server-side export URL (streamed CSV/NDJSON, every raw reading in the range)
+ */
+export const buildExportUrl = (hours, sensorId, format = 'csv') => {
+  let url = `/api/history/export?format=${format}&hours=${hours}`;
+  if(sensorId && sensorId !== 'all') url += `&sensor_id=${sensorId}`;
+  return url;
+};
+
 /**
  * Range history (start/end)
  */
@@ -48,11 +48,13 @@ import {
   btnSystemSettings,
   configViewSystem,
   systemConfigForm,
-  sysSaveIntervalInput
+  sysSaveIntervalInput,
+  sysRetentionRawDaysInput,
+  sysRetentionRollupMonthsInput
 } from "./config.js";
 
-import { fetchHourlyHistory, fetchRangeHistory } from "./api.js";
-import { triggerCsvDownload, createLinearRegressionModel } from "./utils.js"; 
+import { fetchHourlyHistory, fetchRangeHistory, buildExportUrl, fetchAnalytics, fetchForecast } from "./api.js";
+import { triggerCsvDownload, formatApiTimestamp } from "./utils.js"; 
 import {
   renderCurrentStats,
   renderDynamicDashboard,
@@ -70,7 +72,10 @@ import {
 let activeTab = "temperature";
 let chartMode = "realtime"; 
 let cachedHistoryData = []; 
+let cachedAnalytics = null; // Last /api/analytics report (re-rendered on tab switch)
 let currentLogFilter = { sensorId: 'all', sort: 'newest' }; 
+const CHART_MAX_POINTS = 500; // History chart gets a bounded, downsampled series (LTTB on the server)
+const PREDICTIONS_REFRESH_MS = 5 * 60 * 1000; // Forecasts are cheap to fetch (no history download)
 
 // API CALLS
 const fetchSensors = async () => {
@@ -103,81 +108,41 @@ const formatDateTimeInput = (val) => {
     return val.replace("T", " ") + ":00"; 
 };
 
-// PREDICTIONS
-const updatePredictions = async () => {
-    const hoursForTrend = 12;
-    let data = [];
-    try { data = await fetchHourlyHistory(hoursForTrend); } catch (e) { console.error(e); return; }
-    
-    if (!data || data.length < 10) return; // Need some data points
+// PREDICTIONS (server-side incremental models, see /api/forecast)
+const PREDICTION_SLOTS = [['pred-morning', 9], ['pred-afternoon', 14], ['pred-night', 20]];
 
-    // 1. Identify Sensors from Global State
+const updatePredictions = async () => {
     // Use the first 3 active sensors available in the system
     const sensorsToPredict = globalSensors.slice(0, 3);
-    
     if(sensorsToPredict.length === 0) return;
 
-    // Helper: UI Render for status
-    const updateStatus = (msg) => {
-        ['pred-morning', 'pred-afternoon', 'pred-night'].forEach(id => {
-            const el = document.getElementById(id);
-            if(el) el.innerHTML = `<span class="text-xs text-slate-500 italic">${msg}</span>`;
-        });
-    };
-
-    if (!data || data.length < 2) {
-        updateStatus("Gathering Data...");
-        return; 
-    }
-
-    // 2. Helper to filter data for a sensor
-    const getSensorReadings = (sId) => 
-        data.filter(d => d.sensor_id === sId)
-            .map(d => ({ timestamp: d.timestamp, val: parseFloat(d.temperature) }))
-            .filter(d => !isNaN(d.val));
-
-    // 3. Create Models
-    const models = sensorsToPredict.map(s => {
-        const readings = getSensorReadings(s.id);
-        if(readings.length < 2) {
-            return { sensor: s, model: null }; // Not enough data for this specific sensor
-        }
-        return {
-            sensor: s,
-            model: createLinearRegressionModel(readings)
-        };
+    const slotTimes = PREDICTION_SLOTS.map(([, hour]) => {
+        const d = new Date(); d.setHours(hour, 0, 0, 0);
+        return formatApiTimestamp(d);
     });
+    const forecasts = await fetchForecast(slotTimes);
+    const byId = Object.fromEntries(forecasts.map(f => [f.sensor_id, f]));
 
-    const now = new Date();
-    // Reset date objects for each render to ensure correctness
-    
     // UI Render Helper
-    const renderTimeSlot = (containerId, hour) => {
-        const d = new Date(); d.setHours(hour, 0, 0);
-        // If hour is passed, predict for tomorrow? Logic constraint: 12h trend. 
-        // Simple linear regression extends line. 
-        
+    const renderTimeSlot = (containerId, slotIdx) => {
         const el = document.getElementById(containerId);
         if(!el) return;
 
         let htmlVals = '';
         let htmlLabels = '';
         
-        models.forEach((m, idx) => {
-             // Fallback if model failed (insufficient sensor data)
-             let val = "--";
-             if(m.model) {
-                 val = m.model.predict(d).toFixed(1) + "°";
-             } else {
-                 val = "Low Data"; 
-             }
+        sensorsToPredict.forEach((s, idx) => {
+             // Fallback if the sensor has no model yet (no readings persisted)
+             const f = byId[s.id];
+             const value = f && f.points.length ? f.points[slotIdx].temperature : null;
+             const val = value !== null ? value.toFixed(1) + "°" : "Low Data";
 
              // Cycle colors: Emerald, Cyan, Amber
              const colors = ["text-emerald-400", "text-cyan-400", "text-amber-400"];
              const color = colors[idx % 3];
              
-             htmlVals += `<span class="${color} font-bold text-[10px]" title="${m.sensor.name}">${val}</span>`;
-             htmlLabels += `<span>${m.sensor.name.substring(0,6)}</span>`;
+             htmlVals += `<span class="${color} font-bold text-[10px]" title="${s.name}">${val}</span>`;
+             htmlLabels += `<span>${s.name.substring(0,6)}</span>`;
         });
 
         el.innerHTML = `
@@ -190,22 +155,21 @@ const updatePredictions = async () => {
         `;
     };
 
-    renderTimeSlot('pred-morning', 9);
-    renderTimeSlot('pred-afternoon', 14);
-    renderTimeSlot('pred-night', 20);
+    PREDICTION_SLOTS.forEach(([containerId], idx) => renderTimeSlot(containerId, idx));
 
     const btnCustom = document.getElementById('btn-predict-custom');
     if (btnCustom) {
-        btnCustom.onclick = () => {
+        btnCustom.onclick = async () => {
             const timeInput = document.getElementById('pred-time-input').value;
             if (!timeInput) return;
             const [h, m] = timeInput.split(':');
-            const t = new Date(); t.setHours(h, m, 0);
+            const t = new Date(); t.setHours(h, m, 0, 0);
             
-            // Use first model avail for custom
+            // First sensor for custom
             let pVal = "--";
-            if(models.length > 0 && models[0].model) {
-                 pVal = models[0].model.predict(t).toFixed(1);
+            const [f] = await fetchForecast([formatApiTimestamp(t)], sensorsToPredict[0].id);
+            if (f && f.points.length && f.points[0].temperature !== null) {
+                 pVal = f.points[0].temperature.toFixed(1);
             }
             
             document.getElementById('custom-prediction-result').classList.remove('hidden');
@@ -287,12 +251,18 @@ const loadHistoryData = async () => {
     if(chartMode === 'analytics') document.getElementById("stat-total-samples").innerText = "...";
 
     try {
-        const data = await fetchHourlyHistory(hours, currentLogFilter.sensorId);
+        // Analytics are computed server-side over every sample; the chart only needs its shape
+        const maxPoints = chartMode === 'history' ? CHART_MAX_POINTS : null;
+        const [data, report] = await Promise.all([
+            fetchHourlyHistory(hours, currentLogFilter.sensorId, maxPoints),
+            chartMode === 'analytics' ? fetchAnalytics(hours, currentLogFilter.sensorId) : null
+        ]);
         // Mark as DB source
         cachedHistoryData = data.map(d => ({ ...d, source: 'db' })); 
+        cachedAnalytics = report;
 
         if (chartMode === 'analytics') {
-            renderAnalytics(cachedHistoryData, activeTab, globalSensors);
+            renderAnalytics(cachedAnalytics, activeTab);
             renderDataLogTable(cachedHistoryData, globalSensors, currentLogFilter.sort);
         } else if (chartMode === 'history') {
             renderStaticChart(cachedHistoryData, activeTab, globalSensors);
@@ -337,9 +307,9 @@ const setupEventListeners = () => {
         initComparisonChart(activeTab, globalSensors);
         if(chartMode === 'history' || chartMode === 'analytics'){
              // Re-render with existing cache if valid
-             if (cachedHistoryData.length > 0) {
+             if (cachedHistoryData.length > 0 && (chartMode !== 'analytics' || cachedAnalytics)) {
                  if (chartMode === 'analytics') {
-                    renderAnalytics(cachedHistoryData, activeTab, globalSensors);
+                    renderAnalytics(cachedAnalytics, activeTab);
                     renderDataLogTable(cachedHistoryData, globalSensors, currentLogFilter.sort);
                  } else {
                      renderStaticChart(cachedHistoryData, activeTab, globalSensors);
@@ -458,6 +428,8 @@ const setupEventListeners = () => {
           if(data.save_interval_minutes) {
               sysSaveIntervalInput.value = data.save_interval_minutes;
           }
+          if(data.retention_raw_days !== undefined) sysRetentionRawDaysInput.value = data.retention_raw_days;
+          if(data.retention_rollup_months !== undefined) sysRetentionRollupMonthsInput.value = data.retention_rollup_months;
       } catch(e) { console.error("Error loading config:", e); }
   };
 
@@ -470,11 +442,14 @@ const setupEventListeners = () => {
       systemConfigForm.addEventListener('submit', async (e) => {
           e.preventDefault();
           const val = sysSaveIntervalInput.value;
+          const settings = { save_interval_minutes: val };
+          if(sysRetentionRawDaysInput.value !== '') settings.retention_raw_days = sysRetentionRawDaysInput.value;
+          if(sysRetentionRollupMonthsInput.value !== '') settings.retention_rollup_months = sysRetentionRollupMonthsInput.value;
           try {
               const res = await fetch('/api/config/system', {
                   method: 'POST',
                   headers: {'Content-Type': 'application/json'},
-                  body: JSON.stringify({ save_interval_minutes: val })
+                  body: JSON.stringify(settings)
               });
               const data = await res.json();
               if(data.success) {
@@ -565,6 +540,12 @@ const setupEventListeners = () => {
   if(rangeSearchBtn) rangeSearchBtn.addEventListener("click", loadHistoryData);
   if(downloadCsvButton) {
       downloadCsvButton.addEventListener("click", () => {
+          // Stored history: let the server stream the full range (not just what's loaded)
+          if(chartMode === 'history' || chartMode === 'analytics') {
+              const hours = parseInt(historyHoursInput.value) || 12;
+              window.location.href = buildExportUrl(hours, currentLogFilter.sensorId);
+              return;
+          }
           const { headers, rows } = getVisibleChartData(globalSensors);
           if(headers && rows) {
             triggerCsvDownload(headers, rows, `sensor_data_${new Date().toISOString().slice(0,10)}.csv`);
@@ -581,7 +562,8 @@ document.addEventListener("DOMContentLoaded", () => {
   setupEventListeners();
   setupStreamListener();
   
-  fetchSensors(); // Load dynamic sensors
+  fetchSensors().then(updatePredictions); // Load dynamic sensors, then their forecasts
+  setInterval(updatePredictions, PREDICTIONS_REFRESH_MS);
   
   // Start Realtime Chart Interval (1Hz)
   setInterval(() => {
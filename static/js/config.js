@@ -98,6 +98,8 @@ export let btnSystemSettings = null;
 export let configViewSystem = null;
 export let systemConfigForm = null;
 export let sysSaveIntervalInput = null;
+export let sysRetentionRawDaysInput = null;
+export let sysRetentionRollupMonthsInput = null;
 
 export let typeSelectEsp32 = null;
 export let typeSelectWeather = null;
@@ -174,6 +176,8 @@ export const initDOMRefs = () => {
   configViewSystem = document.getElementById("config-view-system");
   systemConfigForm = document.getElementById("system-config-form");
   sysSaveIntervalInput = document.getElementById("sys-save-interval");
+  sysRetentionRawDaysInput = document.getElementById("sys-retention-raw-days");
+  sysRetentionRollupMonthsInput = document.getElementById("sys-retention-rollup-months");
   
   // -- ADD SENSOR FORM --
   typeSelectEsp32 = document.getElementById("type-select-esp32");
@@ -301,14 +301,14 @@ export const getVisibleChartData = () => {
  * =========================================================================
  */
 
-const calculateStdDev = (arr, mean) => {
-    if(arr.length === 0) return 0;
-    return Math.sqrt(arr.map(x => Math.pow(x - mean, 2)).reduce((a, b) => a + b) / arr.length);
-};
+const formatClock = (timestamp) => timestamp.split(' ')[1].slice(0, 5);
 
-export const renderAnalytics = (data, dataType = 'temperature', globalSensors) => {
+/**
+ * report: /api/analytics response (stats, gaps, uptime and daily SD computed server-side)
+ */
+export const renderAnalytics = (report, dataType = 'temperature') => {
     
-    if (!data || data.length === 0 || !globalSensors) {
+    if (!report || !report.sensors || report.total_samples === 0) {
         document.getElementById("stat-total-samples").textContent = "0";
         document.getElementById("outages-list").innerHTML = '<li class="text-xs text-slate-500 italic p-2">No data available.</li>';
         return;
@@ -316,54 +316,34 @@ export const renderAnalytics = (data, dataType = 'temperature', globalSensors) =
 
     const isTemp = dataType === 'temperature';
     const unit = isTemp ? "°" : "%";
-    
-    let allOutages = [];
-    let statsPerSensor = [];
-    const GAP_THRESHOLD_MS = 20 * 60 * 1000; 
+    const sensors = report.sensors.filter(s => s.count > 0);
 
-    // Process per sensor
-    globalSensors.forEach(sensor => {
-        const sensorReadings = data.filter(d => d.sensor_id === sensor.id).sort((a,b) => new Date(a.timestamp) - new Date(b.timestamp));
-        
-        // 1. Calculate Stats
-        const values = sensorReadings.map(d => isTemp ? d.temperature : d.humidity).filter(v => v !== null);
-        
-        let stats = { min: 0, max: 0, avg: 0, std: 0, name: sensor.name, type: sensor.type };
-        if (values.length > 0) {
-            stats.min = Math.min(...values);
-            stats.max = Math.max(...values);
-            const sum = values.reduce((a, b) => a + b, 0);
-            stats.avg = sum / values.length;
-            stats.std = calculateStdDev(values, stats.avg);
-        }
-        statsPerSensor.push(stats);
-
-        // 2. Detect Outages
-        let previousTime = null;
-        sensorReadings.forEach(d => {
-            const time = new Date(d.timestamp.replace(" ", "T")).getTime();
-            if (previousTime) {
-                const diff = time - previousTime;
-                if (diff > GAP_THRESHOLD_MS) {
-                    allOutages.push({
-                        sensor: sensor.name,
-                        date: d.timestamp.split(' ')[0],
-                        from: new Date(previousTime).toLocaleTimeString([], {hour: '2-digit', minute:'2-digit'}),
-                        to: new Date(time).toLocaleTimeString([], {hour: '2-digit', minute:'2-digit'}),
-                        duration: Math.floor(diff / 60000)
-                    });
-                }
-            }
-            previousTime = time;
-        });
+    const statsPerSensor = sensors.map(s => {
+        const stats = isTemp ? s.temperature : s.humidity;
+        return {
+            name: s.sensor_name,
+            type: s.type,
+            min: stats.min ?? 0,
+            max: stats.max ?? 0,
+            avg: stats.avg ?? 0,
+            std: stats.std ?? 0,
+            daily: s.daily.map(d => `${d.date}: ±${(isTemp ? d.temp_std : d.hum_std) ?? '-'}`).join('\n')
+        };
     });
 
+    const allOutages = sensors.flatMap(s => s.gaps.map(g => ({
+        sensor: s.sensor_name,
+        date: g.from.split(' ')[0],
+        from: formatClock(g.from),
+        to: formatClock(g.to),
+        duration: g.minutes
+    })));
+
     // Update DOM
-    const total = data.length;
-    const outages = allOutages;
-    document.getElementById("stat-total-samples").textContent = total;
-    document.getElementById("stat-uptime").textContent = outages.length === 0 ? "100%" : (100 - (outages.length * 0.5)).toFixed(1) + "%"; 
-    document.getElementById("stat-outages-count").textContent = outages.length;
+    const uptime = sensors.reduce((acc, s) => acc + s.uptime_pct, 0) / (sensors.length || 1);
+    document.getElementById("stat-total-samples").textContent = report.total_samples;
+    document.getElementById("stat-uptime").textContent = uptime.toFixed(1) + "%"; 
+    document.getElementById("stat-outages-count").textContent = allOutages.length;
     
     // Dynamic Summary Cards
     const container = document.getElementById("analytics-cards-container");
@@ -390,7 +370,7 @@ export const renderAnalytics = (data, dataType = 'temperature', globalSensors) =
             <td class="text-right font-mono text-slate-300">${s.min.toFixed(1)}${unit}</td>
             <td class="text-right font-mono text-slate-300">${s.max.toFixed(1)}${unit}</td>
             <td class="text-right font-mono text-${s.type==='openweather'?'amber':'cyan'}-400 font-bold">${s.avg.toFixed(1)}${unit}</td>
-            <td class="text-right font-mono text-xs text-slate-500">±${s.std.toFixed(2)}</td>
+            <td class="text-right font-mono text-xs text-slate-500" title="${s.daily}">±${s.std.toFixed(2)}</td>
         </tr>
     `).join('');
 
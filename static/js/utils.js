@@ -47,41 +47,12 @@ export const triggerCsvDownload = (headers, rows, filename) => {
 };
 
 /**
- * PREDICTION ENGINE
+ * Local wall-clock "YYYY-MM-DD HH:MM:SS" (the format the API stores and parses)
  */
-export const createLinearRegressionModel = (data) => {
-    if (!data || data.length < 2) return null;
-
-    let sumX = 0, sumY = 0, sumXY = 0, sumXX = 0;
-    const n = data.length;
-
-    const startTime = new Date(data[0].timestamp).getTime();
-
-    const normalizedData = data.map(point => {
-        const x = (new Date(point.timestamp).getTime() - startTime) / 60000; // x in minutes
-        const y = point.val;
-        return { x, y };
-    });
-
-    normalizedData.forEach(p => {
-        sumX += p.x;
-        sumY += p.y;
-        sumXY += (p.x * p.y);
-        sumXX += (p.x * p.x);
-    });
-
-    const slope = (n * sumXY - sumX * sumY) / (n * sumXX - sumX * sumX);
-    const intercept = (sumY - slope * sumX) / n;
-
-    return {
-        slope,
-        intercept,
-        startTime,
-        predict: (futureDateObj) => {
-            const xFuture = (futureDateObj.getTime() - startTime) / 60000;
-            return (slope * xFuture) + intercept;
-        }
-    };
+export const formatApiTimestamp = (dateObj) => {
+    const pad = (n) => String(n).padStart(2, '0');
+    return `${dateObj.getFullYear()}-${pad(dateObj.getMonth() + 1)}-${pad(dateObj.getDate())} ` +
+           `${pad(dateObj.getHours())}:${pad(dateObj.getMinutes())}:${pad(dateObj.getSeconds())}`;
 };
 
 export const formatTimeDisplay = (dateObj) => {
@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, insert, delete
+from sqlalchemy.orm import sessionmaker
+
+# Add parent dir to path to allow imports if run directly
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.sql_models import Base, Sensor, SensorReading
+from services.bulk_writer import bulk_insert_readings
+
+# Benchmark: rows/sec writing sensor_readings, one ORM object per row (the old
+# guardar_historial path) vs services/bulk_writer.py (executemany, COPY on PostgreSQL).
+# Uses a temp SQLite file unless --url points somewhere else (never sensors.db).
+
+SENSORS = 50
+
+def make_rows(n):
+    now = datetime.now().replace(microsecond=0)
+    return [(
+        1 + i % SENSORS,
+        now - timedelta(seconds=i // SENSORS),
+        round(20 + random.random() * 5, 2),
+        round(50 + random.random() * 10, 2)
+    ) for i in range(n)]
+
+def write_orm(session, rows, batch_size):
+    for sensor_id, timestamp, temperature, humidity in rows:
+        session.add(SensorReading(sensor_id=sensor_id, timestamp=timestamp, temperature=temperature, humidity=humidity))
+    session.commit()
+
+def write_bulk(session, rows, batch_size):
+    bulk_insert_readings(session, rows, batch_size)
+    session.commit()
+
+def run(label, fn, Session, rows, batch_size):
+    session = Session()
+    try:
+        session.execute(delete(SensorReading))
+        session.commit()
+        start = time.perf_counter()
+        fn(session, rows, batch_size)
+        elapsed = time.perf_counter() - start
+    finally:
+        session.close()
+    rate = len(rows) / elapsed if elapsed else 0
+    print(f"   {label:<22} {len(rows):>9} rows in {elapsed:7.2f}s -> {rate:>10.0f} rows/sec")
+
+def main():
+    parser = argparse.ArgumentParser(description="sensor_readings write throughput (ORM vs bulk).")
+    parser.add_argument("--url", help="Database URL (default: temp SQLite file)")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 1_000_000])
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--orm-max", type=int, default=100_000, help="Skip the ORM path above this many rows (it is slow)")
+    args = parser.parse_args()
+
+    url = args.url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_bulk.db')}"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    with engine.begin() as conn:
+        if not conn.execute(Sensor.__table__.select().limit(1)).first():
+            conn.execute(insert(Sensor), [{"name": f"Bench {i + 1}", "type": "esp32", "token": f"bench-{i + 1}"} for i in range(SENSORS)])
+
+    print(f"📊 Bulk insert benchmark ({engine.dialect.name}: {engine.url.render_as_string(hide_password=True)})")
+    for n in args.rows:
+        rows = make_rows(n)
+        print(f"\n   -- {n} rows --")
+        if n <= args.orm_max:
+            run("ORM add() per row", write_orm, Session, rows, None)
+        for size in args.batch_size:
+            run(f"bulk (batch {size})", write_bulk, Session, rows, size)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import sessionmaker
+
+# Add parent dir to path to allow imports if run directly
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.sql_models import Base, Sensor, SensorReading
+from services.history import aggregate_history
+
+# Benchmark: /api/history query latency over a generated multi-million-row table,
+# with and without the (sensor_id, timestamp) / (timestamp) indexes.
+# Uses its own SQLite file (temp dir by default), never sensors.db.
+
+WINDOWS = {"1h": timedelta(hours=1), "24h": timedelta(hours=24), "30d": timedelta(days=30)}
+CHUNK = 50_000
+
+def generate(engine, rows, sensors, days):
+    """`rows` readings spread evenly over `sensors` sensors and the last `days` days."""
+    Base.metadata.create_all(bind=engine)
+    end = datetime.now().replace(microsecond=0)
+    per_sensor = rows // sensors
+    step = timedelta(seconds=days * 86400 / per_sensor)
+
+    with engine.begin() as conn:
+        conn.execute(insert(Sensor), [{"name": f"Bench {i + 1}", "type": "esp32", "token": f"bench-{i + 1}"} for i in range(sensors)])
+
+    start = time.perf_counter()
+    batch = []
+    with engine.begin() as conn:
+        # Interleaved by time, like the worker writes them
+        for n in range(per_sensor):
+            ts = end - step * (per_sensor - n)
+            for sensor_id in range(1, sensors + 1):
+                batch.append({
+                    "sensor_id": sensor_id,
+                    "timestamp": ts,
+                    "temperature": round(20 + random.random() * 5, 2),
+                    "humidity": round(50 + random.random() * 10, 2)
+                })
+            if len(batch) >= CHUNK:
+                conn.execute(insert(SensorReading), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(SensorReading), batch)
+    print(f"   Generated {per_sensor * sensors} rows in {time.perf_counter() - start:.1f}s")
+    return end
+
+def raw_query(session, sensor_id, start, end):
+    """Same shape as the raw /api/history path."""
+    query = session.query(SensorReading, Sensor.name).join(Sensor, Sensor.id == SensorReading.sensor_id)
+    query = query.filter(SensorReading.sensor_id == sensor_id, SensorReading.timestamp >= start, SensorReading.timestamp <= end)
+    return query.order_by(SensorReading.timestamp.asc()).limit(2001).all()
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+def measure(Session, end, sensors, repeat):
+    session = Session()
+    try:
+        results = {}
+        for label, window in WINDOWS.items():
+            start = end - window
+            sensor_id = random.randint(1, sensors)
+            raw_ms = timed(lambda: raw_query(session, sensor_id, start, end), repeat)
+            agg_ms = timed(lambda: aggregate_history(session, start, end, 3600, sensor_id), repeat)
+            results[label] = (raw_ms, agg_ms)
+        return results
+    finally:
+        session.close()
+
+def query_plan(engine, end):
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "EXPLAIN QUERY PLAN SELECT * FROM sensor_readings "
+            "WHERE sensor_id = 1 AND timestamp >= :start AND timestamp <= :end ORDER BY timestamp"
+        ), {"start": end - WINDOWS["24h"], "end": end}).all()
+    return "; ".join(row[-1] for row in rows)
+
+def main():
+    parser = argparse.ArgumentParser(description="History query latency with and without composite indexes.")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--sensors", type=int, default=10)
+    parser.add_argument("--days", type=int, default=60, help="Time span covered by the generated readings")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per query (median is reported)")
+    parser.add_argument("--db", help="SQLite file to use (default: a temp file)")
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), "bench_history.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Session = sessionmaker(bind=engine)
+    print(f"📊 History benchmark: {args.rows} rows, {args.sensors} sensors, {args.days} days ({path})")
+
+    end = generate(engine, args.rows, args.sensors, args.days)
+    indexes = list(SensorReading.__table__.indexes)
+
+    for index in indexes:
+        index.drop(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    print(f"   Plan without indexes: {query_plan(engine, end)}")
+    before = measure(Session, end, args.sensors, args.repeat)
+
+    start = time.perf_counter()
+    for index in indexes:
+        index.create(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    print(f"   Indexes built in {time.perf_counter() - start:.1f}s")
+    print(f"   Plan with indexes:    {query_plan(engine, end)}")
+    after = measure(Session, end, args.sensors, args.repeat)
+
+    print(f"\n   {'window':<7} {'raw (no idx)':>13} {'raw (idx)':>10} {'1h agg (no idx)':>16} {'1h agg (idx)':>13}")
+    for label in WINDOWS:
+        print(f"   {label:<7} {before[label][0]:>11.1f}ms {after[label][0]:>8.1f}ms {before[label][1]:>14.1f}ms {after[label][1]:>11.1f}ms")
+
+if __name__ == "__main__":
+    main()
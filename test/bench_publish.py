@@ -0,0 +1,71 @@
+import os
+import sys
+import json
+import time
+import argparse
+import redis
+from datetime import datetime
+
+# Add parent dir to path to allow imports if run directly
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.publisher import publish_updates, build_update_msg, CURRENT_KEY, STREAM_CHANNEL
+
+# Benchmark: per-sensor HSET + PUBLISH (old paths) vs services/publisher.py pipeline.
+# Runs against a local Redis. Uses a separate DB by default so live data is untouched.
+
+def make_updates(n_sensors):
+    return [{
+        "temperature": 20.0 + (i % 10),
+        "humidity": 50.0,
+        "sensor_id": i + 1,
+        "sensor_name": f"Bench {i + 1}",
+        "server_time": datetime.now().strftime("%H:%M:%S")
+    } for i in range(n_sensors)]
+
+def publish_naive(client, updates):
+    """What ingest_data / update_weather_sensors did before: 2 round trips per sensor."""
+    for sensor_data in updates:
+        client.hset(CURRENT_KEY, str(sensor_data["sensor_id"]), json.dumps(sensor_data))
+        client.publish(STREAM_CHANNEL, json.dumps(build_update_msg(sensor_data)))
+    return len(updates)
+
+def run(label, fn, client, updates, rounds):
+    sent = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        sent += fn(updates, client=client) if fn is publish_updates else fn(client, updates)
+    elapsed = time.perf_counter() - start
+    rate = sent / elapsed if elapsed else 0
+    print(f"   {label:<10} {sent:>8} msgs in {elapsed:7.3f}s -> {rate:>10.0f} msgs/sec")
+    return rate
+
+def main():
+    parser = argparse.ArgumentParser(description="Redis publish benchmark (naive vs pipelined).")
+    parser.add_argument("--host", default=os.getenv('REDIS_HOST', 'localhost'))
+    parser.add_argument("--port", type=int, default=int(os.getenv('REDIS_PORT', 6379)))
+    parser.add_argument("--db", type=int, default=15, help="Redis DB used for the benchmark (default 15)")
+    parser.add_argument("--sensors", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--messages", type=int, default=20000, help="Approx. messages per scenario")
+    args = parser.parse_args()
+
+    client = redis.Redis(host=args.host, port=args.port, db=args.db, decode_responses=True)
+    try:
+        client.ping()
+    except Exception as e:
+        print(f"❌ Cannot connect to Redis at {args.host}:{args.port}: {e}")
+        return
+
+    print(f"🏁 Publish benchmark against {args.host}:{args.port}/{args.db}")
+    for n in args.sensors:
+        updates = make_updates(n)
+        rounds = max(1, args.messages // n)
+        print(f"\n📦 {n} sensor(s) per update cycle, {rounds} cycles")
+        before = run("naive", publish_naive, client, updates, rounds)
+        after = run("pipeline", publish_updates, client, updates, rounds)
+        print(f"   ⚡ Speedup: x{after / before:.1f}" if before else "")
+
+    client.delete(CURRENT_KEY)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,15 @@
-import requests
+import os
+import sys
 import time
 import random
-import sys
+import socket
+import argparse
+import requests
+
+# Add parent dir to path to allow imports if run directly
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.binary_frame import encode_frame
 
 # Configuration
 SERVER_BASE = "http://localhost:5000/api/ingest"
@@ -13,37 +21,58 @@ def generate_sensor_data():
         "humidity": round(random.uniform(40.0, 70.0), 1)
     }
 
+def send_http(url, data):
+    try:
+        response = requests.post(url, json=data, timeout=2)
+        if response.status_code == 200:
+            print(f"✅ Sent: {data}")
+        else:
+            print(f"⚠️ Failed: {response.status_code} - {response.text}")
+    except requests.exceptions.ConnectionError:
+        print(f"❌ Connection Error: Is the server running?")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+
+def send_udp(sock, address, token, data):
+    """One 15-byte binary frame (services/binary_frame.py). UDP: no reply to check."""
+    frame = encode_frame(token, data["temperature"], data["humidity"], timestamp=int(time.time()))
+    sock.sendto(frame, address)
+    print(f"✅ Sent {len(frame)} bytes: {data}")
+
 def simulate_esp32():
+    parser = argparse.ArgumentParser(description="Simulated ESP32 sending a reading every few seconds.")
+    parser.add_argument("token", nargs="?", help="Sensor token (from Web UI)")
+    parser.add_argument("--udp", metavar="HOST:PORT", help="Send binary frames to the UDP listener instead of HTTP JSON")
+    parser.add_argument("--interval", type=float, default=5, help="Seconds between readings")
+    args = parser.parse_args()
+
     print(f"🚀 Starting ESP32 Simulator")
-    
-    if len(sys.argv) > 1:
-        token = sys.argv[1]
-    else:
-        token = input("🔑 Enter Sensor Token (from Web UI): ").strip()
+    token = args.token or input("🔑 Enter Sensor Token (from Web UI): ").strip()
     
     if not token:
         print("❌ Token required.")
         return
 
-    url = f"{SERVER_BASE}/{token}"
-    print(f"📡 Sending data to: {url}")
+    sock = address = None
+    if args.udp:
+        host, _, port = args.udp.rpartition(":")
+        address = (host or "localhost", int(port))
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        print(f"📡 Sending binary frames to: udp://{address[0]}:{address[1]}")
+    else:
+        url = f"{SERVER_BASE}/{token}"
+        print(f"📡 Sending data to: {url}")
     print("Press Ctrl+C to stop.")
     
     try:
         while True:
             data = generate_sensor_data()
-            try:
-                response = requests.post(url, json=data, timeout=2)
-                if response.status_code == 200:
-                    print(f"✅ Sent: {data}")
-                else:
-                    print(f"⚠️ Failed: {response.status_code} - {response.text}")
-            except requests.exceptions.ConnectionError:
-                print(f"❌ Connection Error: Is the server running?")
-            except Exception as e:
-                print(f"❌ Error: {e}")
+            if sock:
+                send_udp(sock, address, token, data)
+            else:
+                send_http(url, data)
             
-            time.sleep(5) # Delay
+            time.sleep(args.interval) # Delay
 
     except KeyboardInterrupt:
         print("\n🛑 Simulator stopped.")
@@ -0,0 +1,376 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+from urllib.parse import urlparse
+
+# Sibling scripts (run as test/load_ingest.py, so test/ is on the path)
+from esp32_simulator import generate_sensor_data
+from load_sse import SSEListener, percentile, read_rss_kb
+
+# Ingest load test: thousands of simulated ESP32 devices on one asyncio loop.
+#   - provisions the devices through /api/sensors (reused on the next run)
+#   - posts readings at a fixed aggregate rate (open loop: latency is measured
+#     from each reading's scheduled send time, so a slow server can't hide
+#     behind a slower client)
+#   - attaches N /stream-data listeners and times ingest -> SSE delivery
+#     for a sample of the devices
+# Prints a JSON report; --output/--baseline compare runs between commits.
+# --serve wsgi|asgi starts the server itself on a fresh SQLite file.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class HTTPConnection:
+    """Keep-alive HTTP/1.1 client connection (JSON bodies with Content-Length only)."""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, payload=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload).encode() if payload is not None else b""
+        head = (f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nConnection: keep-alive\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n")
+        try:
+            self.writer.write(head.encode() + body)
+            await self.writer.drain()
+
+            status_line = await self.reader.readline()
+            if not status_line:
+                raise ConnectionError("connection closed by server")
+            version, status = status_line.split()[:2]
+            headers = {}
+            while True:
+                line = await self.reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            if "content-length" in headers:
+                data = await self.reader.readexactly(int(headers["content-length"]))
+            else:
+                data = await self.reader.read() # Server closes to end the body
+                headers["connection"] = "close"
+            if version == b"HTTP/1.0" or headers.get("connection", "").lower() == "close":
+                self.close()
+            return int(status), data
+        except BaseException:
+            self.close() # Unknown state (timeout, reset...): start over on the next request
+            raise
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+class ConnectionPool:
+    def __init__(self, host, port, size):
+        self.idle = asyncio.Queue()
+        for _ in range(size):
+            self.idle.put_nowait(HTTPConnection(host, port))
+
+    async def request(self, method, path, payload=None, timeout=10.0):
+        conn = await self.idle.get()
+        try:
+            return await asyncio.wait_for(conn.request(method, path, payload), timeout)
+        finally:
+            self.idle.put_nowait(conn)
+
+    def close(self):
+        while not self.idle.empty():
+            self.idle.get_nowait().close()
+
+class Stats:
+    def __init__(self):
+        self.sent = 0
+        self.ok = 0
+        self.errors = {} # "http_500" / "timeout" / exception name -> count
+        self.latency = [] # ms from scheduled send time to response
+        self.service = [] # ms from the send attempt to response (includes waiting for a free connection)
+
+    def error(self, kind):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+class TrackingListener(SSEListener):
+    """SSE client that times every delivery of a tracked (sensor_id, temperature) reading."""
+
+    def __init__(self, host, port, path, sent):
+        super().__init__(host, port, path)
+        self.sent = sent # (sensor_id, temperature) -> perf_counter() of the POST
+        self.latency = []
+
+    def on_message(self, raw):
+        try:
+            msg = json.loads(raw)
+            key = (msg["sensor_id"], msg["data"]["temperature"])
+        except (ValueError, KeyError, TypeError):
+            return
+        sent_at = self.sent.get(key)
+        if sent_at is not None:
+            self.latency.append((time.perf_counter() - sent_at) * 1000)
+
+def summarize(values):
+    if not values:
+        return {"p50": None, "p90": None, "p99": None, "max": None, "mean": None}
+    return {
+        "p50": round(percentile(values, 50), 3),
+        "p90": round(percentile(values, 90), 3),
+        "p99": round(percentile(values, 99), 3),
+        "max": round(max(values), 3),
+        "mean": round(statistics.fmean(values), 3)
+    }
+
+async def provision(pool, prefix, count, timeout):
+    """Tokens for `count` devices named '<prefix> N', creating the missing ones."""
+    status, body = await pool.request("GET", "/api/sensors", timeout=timeout)
+    if status != 200:
+        raise RuntimeError(f"GET /api/sensors returned HTTP {status}")
+    existing = {s["name"]: s for s in json.loads(body) if s.get("type") == "esp32"}
+
+    async def create(name):
+        status, body = await pool.request("POST", "/api/sensors", {"name": name, "type": "esp32"}, timeout=timeout)
+        if status != 201:
+            raise RuntimeError(f"POST /api/sensors returned HTTP {status}: {body[:200]!r}")
+        return json.loads(body)
+
+    names = [f"{prefix} {i + 1}" for i in range(count)]
+    missing = [n for n in names if n not in existing]
+    if missing:
+        print(f"🔑 Provisioning {len(missing)} sensors ({len(existing)} reused)...")
+        for sensor in await asyncio.gather(*(create(n) for n in missing)):
+            existing[sensor["name"]] = sensor
+    return [(existing[n]["id"], existing[n]["token"]) for n in names]
+
+async def device(pool, sensor_id, token, first_at, interval, end_at, warmup_end, stats, sent, timeout):
+    seq = 0
+    next_at = first_at
+    while next_at < end_at:
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        reading = generate_sensor_data()
+        seq += 1
+        reading["temperature"] = round(20 + (seq % 10000) / 1000, 3) # Unique per device: marks the SSE frame
+        measured = next_at >= warmup_end
+        started = time.perf_counter()
+        if sent is not None and measured:
+            sent[(sensor_id, reading["temperature"])] = started
+        try:
+            status, _ = await pool.request("POST", f"/api/ingest/{token}", reading, timeout=timeout)
+            if measured:
+                stats.sent += 1
+                if status == 200:
+                    stats.ok += 1
+                    done = time.perf_counter()
+                    stats.latency.append((done - next_at) * 1000)
+                    stats.service.append((done - started) * 1000)
+                else:
+                    stats.error(f"http_{status}")
+        except asyncio.TimeoutError:
+            if measured:
+                stats.sent += 1
+                stats.error("timeout")
+        except Exception as e:
+            if measured:
+                stats.sent += 1
+                stats.error(type(e).__name__)
+        next_at += interval
+
+def start_server(mode, port, redis_db, workdir):
+    """Run manage.py (Flask) or uvicorn (ASGI) against a fresh SQLite file."""
+    env = dict(os.environ, PORT=str(port), REDIS_DB=str(redis_db),
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'load.db')}")
+    if mode == "asgi":
+        cmd = [sys.executable, "-m", "uvicorn", "asgi:application", "--port", str(port), "--log-level", "warning"]
+    else:
+        cmd = [sys.executable, "manage.py"]
+    log = open(os.path.join(workdir, "server.log"), "w")
+    print(f"🚀 Starting {mode} server on port {port} (log: {log.name})")
+    return subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+async def wait_ready(pool, proc, timeout=60):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if proc and proc.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            status, _ = await pool.request("GET", "/api/sensors", timeout=2)
+            if status == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError("server did not become ready")
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+async def main_async(args, proc):
+    url = urlparse(args.url)
+    host, port = url.hostname, url.port or 80
+    pool = ConnectionPool(host, port, args.connections)
+    try:
+        await wait_ready(pool, proc)
+        devices = await provision(pool, args.prefix, args.devices, args.timeout)
+
+        interval = args.devices / args.rate # Seconds between readings of one device
+        if args.listeners and interval * 1000 < args.coalesce_ms:
+            print(f"⚠️ Each device sends every {interval:.2f}s, faster than the {args.coalesce_ms}ms stream "
+                  "coalescing window: superseded readings will count as missed SSE deliveries.")
+
+        tracked = devices[:args.tracked] if args.listeners else []
+        sent = {} if tracked else None
+        listeners, listener_tasks = [], []
+        if tracked:
+            path = "/stream-data?sensors=" + ",".join(str(sensor_id) for sensor_id, _ in tracked)
+            print(f"🔌 Opening {args.listeners} SSE listeners for {len(tracked)} tracked devices...")
+            listeners = [TrackingListener(host, port, path, sent) for _ in range(args.listeners)]
+            listener_tasks = [asyncio.create_task(l.run()) for l in listeners]
+            await asyncio.wait_for(asyncio.gather(*(l.connected.wait() for l in listeners)), timeout=60)
+            await asyncio.sleep(1) # Initial snapshots
+
+        rss_before = read_rss_kb(args.pid) if args.pid else None
+        print(f"📡 {args.devices} devices, {args.rate:g} readings/s for {args.duration:g}s "
+              f"(+{args.warmup:g}s warmup) over {args.connections} connections...")
+        stats = Stats()
+        tracked_ids = {sensor_id for sensor_id, _ in tracked}
+        start = time.perf_counter()
+        warmup_end = start + args.warmup
+        end_at = warmup_end + args.duration
+        await asyncio.gather(*(
+            device(pool, sensor_id, token, start + random.uniform(0, interval), interval, end_at, warmup_end,
+                   stats, sent if sensor_id in tracked_ids else None, args.timeout)
+            for sensor_id, token in devices
+        ))
+        elapsed = time.perf_counter() - warmup_end
+        rss_after = read_rss_kb(args.pid) if args.pid else None
+
+        await asyncio.sleep(args.drain) # Let the last broadcasts arrive
+        for t in listener_tasks:
+            t.cancel()
+        await asyncio.gather(*listener_tasks, return_exceptions=True)
+    finally:
+        pool.close()
+
+    connected = [l for l in listeners if not l.errors]
+    sse_latency = [ms for l in connected for ms in l.latency]
+    expected = len(sent or {}) * len(connected)
+    report = {
+        "commit": git_commit(),
+        "started_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "config": {
+            "url": args.url, "server": args.serve, "devices": args.devices, "rate": args.rate,
+            "duration": args.duration, "warmup": args.warmup, "connections": args.connections,
+            "listeners": args.listeners, "tracked": len(tracked)
+        },
+        "ingest": {
+            "sent": stats.sent,
+            "ok": stats.ok,
+            "achieved_rate": round(stats.sent / elapsed, 1) if elapsed > 0 else None,
+            "error_rate": round(1 - stats.ok / stats.sent, 5) if stats.sent else None,
+            "errors": stats.errors,
+            "latency_ms": summarize(stats.latency),
+            "service_ms": summarize(stats.service)
+        },
+        "sse": {
+            "listeners": len(listeners),
+            "connected": len(connected),
+            "expected": expected,
+            "received": len(sse_latency),
+            "missed": max(expected - len(sse_latency), 0),
+            "latency_ms": summarize(sse_latency)
+        }
+    }
+    if rss_before is not None and rss_after is not None:
+        report["server_rss_kb"] = {"before": rss_before, "after": rss_after}
+    return report
+
+def compare(report, baseline, tolerance):
+    """Print p50/p99 and error-rate changes against a previous report; False on regression."""
+    ok = True
+    print(f"📊 vs baseline {baseline.get('commit')} ({baseline.get('started_at')}):")
+    for section, field in (("ingest", "latency_ms"), ("ingest", "service_ms"), ("sse", "latency_ms")):
+        for p in ("p50", "p99"):
+            old = baseline.get(section, {}).get(field, {}).get(p)
+            new = report[section][field][p]
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0
+            regressed = p == "p99" and change > tolerance
+            ok &= not regressed
+            print(f"   {section}.{field}.{p:<4} {old:>10.2f} -> {new:>10.2f} ms ({change:+.1%}) {'❌' if regressed else ''}")
+    old_err, new_err = baseline.get("ingest", {}).get("error_rate") or 0, report["ingest"]["error_rate"] or 0
+    if new_err > old_err:
+        ok = False
+    print(f"   ingest.error_rate  {old_err:>10.5f} -> {new_err:>10.5f} {'❌' if new_err > old_err else ''}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated ESP32 fleet: ingest latency, SSE delivery latency and errors.")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--devices", type=int, default=1000, help="Simulated sensors (provisioned on first run)")
+    parser.add_argument("--rate", type=float, default=200, help="Aggregate readings per second")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="Seconds of load before measuring")
+    parser.add_argument("--connections", type=int, default=50, help="Concurrent keep-alive connections")
+    parser.add_argument("--listeners", type=int, default=10, help="SSE clients on /stream-data (0 = none)")
+    parser.add_argument("--tracked", type=int, default=50, help="Devices whose readings are timed through SSE")
+    parser.add_argument("--coalesce-ms", type=int, default=int(os.getenv('STREAM_COALESCE_MS', 1000)),
+                        help="Server's STREAM_COALESCE_MS (only used for a warning)")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Seconds per request")
+    parser.add_argument("--drain", type=float, default=3.0, help="Seconds to wait for late SSE frames")
+    parser.add_argument("--prefix", default="LoadTest", help="Name prefix of the provisioned sensors")
+    parser.add_argument("--serve", choices=["wsgi", "asgi"], help="Start the server here on a temp SQLite DB")
+    parser.add_argument("--redis-db", type=int, default=14, help="REDIS_DB for --serve (keeps live data apart)")
+    parser.add_argument("--pid", type=int, help="Server PID to sample RSS from (/proc)")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--baseline", help="Previous JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p99 growth vs the baseline")
+    args = parser.parse_args()
+
+    proc = None
+    workdir = None
+    if args.serve:
+        workdir = tempfile.mkdtemp(prefix="sensorhub-load-")
+        proc = start_server(args.serve, urlparse(args.url).port or 5000, args.redis_db, workdir)
+        args.pid = args.pid or proc.pid
+
+    try:
+        report = asyncio.run(main_async(args, proc))
+    except KeyboardInterrupt:
+        print("\n🛑 Load test stopped.")
+        return
+    finally:
+        if proc:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            ok = compare(report, json.load(f), args.tolerance)
+        sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
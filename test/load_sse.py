@@ -0,0 +1,175 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+import urllib.request
+from urllib.parse import urlparse
+
+# SSE load test: opens N concurrent /stream-data clients, then measures
+#   - server memory per connection (RSS delta, needs --pid of the server process)
+#   - broadcast latency: time from an ingest POST until each client sees it
+# Works against both `manage.py`/Gunicorn and `uvicorn asgi:application`.
+# Only uses the standard library so it can run anywhere.
+
+def read_rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def http_json(method, url, payload=None, timeout=10):
+    data = json.dumps(payload).encode() if payload is not None else None
+    req = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read() or b"null")
+
+class SSEListener:
+    """Minimal SSE client over a raw asyncio connection (HTTP/1.0, no chunking)."""
+
+    def __init__(self, host, port, path="/stream-data"):
+        self.host, self.port, self.path = host, port, path
+        self.connected = asyncio.Event()
+        self.waiters = {} # marker -> future
+        self.errors = 0
+
+    async def run(self):
+        try:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+            writer.write(f"GET {self.path} HTTP/1.0\r\nHost: {self.host}\r\nAccept: text/event-stream\r\n\r\n".encode())
+            await writer.drain()
+
+            status = await reader.readline()
+            if b" 200" not in status:
+                raise ConnectionError(status.decode(errors="replace").strip())
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            self.connected.set()
+
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.startswith(b"data: "):
+                    self.on_message(line[6:])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.errors += 1
+            self.connected.set()
+
+    def on_message(self, raw):
+        if not self.waiters:
+            return
+        try:
+            temperature = json.loads(raw)["data"]["temperature"]
+        except (ValueError, KeyError, TypeError):
+            return
+        fut = self.waiters.pop(temperature, None)
+        if fut and not fut.done():
+            fut.set_result(time.perf_counter())
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+async def main_async(args):
+    url = urlparse(args.url)
+    host, port = url.hostname, url.port or 80
+
+    token = args.token
+    if not token:
+        sensor = await asyncio.to_thread(http_json, "POST", f"{args.url}/api/sensors", {"name": "LoadTest SSE", "type": "esp32"})
+        token = sensor["token"]
+        print(f"🔑 Created sensor {sensor['id']} with token {token}")
+
+    rss_before = read_rss_kb(args.pid) if args.pid else None
+
+    print(f"🔌 Opening {args.clients} SSE connections...")
+    listeners = [SSEListener(host, port) for _ in range(args.clients)]
+    tasks = []
+    for i, listener in enumerate(listeners):
+        tasks.append(asyncio.create_task(listener.run()))
+        if args.ramp and i % args.ramp == 0:
+            await asyncio.sleep(0.05)
+    await asyncio.wait_for(asyncio.gather(*(l.connected.wait() for l in listeners)), timeout=120)
+    await asyncio.sleep(1) # Let the server settle
+
+    failed = sum(l.errors for l in listeners)
+    rss_after = read_rss_kb(args.pid) if args.pid else None
+    connected = args.clients - failed
+    print(f"✅ {connected} connected, {failed} failed")
+
+    latencies = []
+    missed = 0
+    for round_no in range(args.rounds):
+        marker = round(1000 + round_no + (time.time() % 1) / 10, 4) # Unique temperature value
+        loop = asyncio.get_running_loop()
+        futures = []
+        for listener in listeners:
+            if listener.errors:
+                continue
+            fut = loop.create_future()
+            listener.waiters[marker] = fut
+            futures.append(fut)
+
+        sent_at = time.perf_counter()
+        await asyncio.to_thread(http_json, "POST", f"{args.url}/api/ingest/{token}", {"temperature": marker, "humidity": 0})
+        done, pending = await asyncio.wait(futures, timeout=args.timeout)
+        latencies.extend((f.result() - sent_at) * 1000 for f in done)
+        missed += len(pending)
+        for listener in listeners:
+            listener.waiters.pop(marker, None)
+        await asyncio.sleep(args.interval)
+
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    result = {
+        "clients": args.clients,
+        "connected": connected,
+        "rounds": args.rounds,
+        "deliveries": len(latencies),
+        "missed": missed,
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p99": percentile(latencies, 99),
+            "max": max(latencies) if latencies else None,
+            "mean": statistics.fmean(latencies) if latencies else None
+        }
+    }
+    if rss_before is not None and rss_after is not None:
+        result["server_rss_kb"] = {"before": rss_before, "after": rss_after}
+        result["rss_per_connection_kb"] = round((rss_after - rss_before) / connected, 2) if connected else None
+
+    print(json.dumps(result, indent=2))
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent SSE clients: memory per connection and broadcast latency.")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=20, help="Broadcasts to measure")
+    parser.add_argument("--interval", type=float, default=1.2, help="Seconds between broadcasts (keep above STREAM_COALESCE_MS)")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Seconds to wait for a broadcast")
+    parser.add_argument("--ramp", type=int, default=100, help="Pause briefly every N new connections (0 = no pause)")
+    parser.add_argument("--token", help="ESP32 token to ingest with (a sensor is created if omitted)")
+    parser.add_argument("--pid", type=int, help="Server PID to sample RSS from (/proc)")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(main_async(args))
+    except KeyboardInterrupt:
+        print("\n🛑 Load test stopped.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+import os
+import sys
+import json
+import time
+import socket
+import struct
+import argparse
+import threading
+import collections
+import socketserver
+
+# Add parent dir to path to allow imports if run directly
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services.mqtt_bridge as bridge_module
+
+# Checks services/mqtt_bridge.py against a local broker: many device
+# connections publishing to sensors/<token>, micro-batching, invalid tokens and
+# payloads, and QoS 1 acknowledgements sent only after the batch was published.
+# Also checks that a poison message or a failing publish doesn't stall delivery,
+# and that unacknowledged messages are redelivered to a restarted bridge.
+# Uses a minimal in-process MQTT 3.1.1 broker (QoS 0/1, persistent sessions, an
+# in-flight window and DUP redelivery on reconnect) unless --broker points at a
+# real one (e.g. mosquitto). Sensor lookup and Redis publishing are stubbed,
+# so neither Redis nor a database is needed.
+
+# --- Minimal broker ---
+INFLIGHT_MAX = 20 # Unacknowledged QoS 1 messages per session, like mosquitto's max_inflight_messages
+def encode_length(n):
+    out = bytearray()
+    while True:
+        byte, n = n % 128, n // 128
+        out.append(byte | (0x80 if n else 0))
+        if not n:
+            return bytes(out)
+
+def read_packet(sock_file):
+    head = sock_file.read(1)
+    if not head:
+        return None, None
+    length, shift = 0, 0
+    while True:
+        byte = sock_file.read(1)[0]
+        length |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            break
+    return head[0], sock_file.read(length)
+
+def mqtt_string(value):
+    raw = value.encode()
+    return struct.pack("!H", len(raw)) + raw
+
+def topic_matches(pattern, topic):
+    p, t = pattern.split("/"), topic.split("/")
+    for i, part in enumerate(p):
+        if part == "#":
+            return True
+        if i >= len(t) or (part != "+" and part != t[i]):
+            return False
+    return len(p) == len(t)
+
+class Session:
+    """Broker-side client session; kept across connections unless clean_session is set."""
+    def __init__(self, client_id, clean):
+        self.client_id, self.clean = client_id, clean
+        self.handler = None # Current connection, None while disconnected
+        self.subscriptions = [] # (filter, qos)
+        self.inflight = {} # packet id -> (topic, payload): QoS 1 sent, not yet acknowledged
+        self.pending = collections.deque() # QoS 1 waiting for a free in-flight slot
+        self.next_id = 0
+
+class BrokerState:
+    def __init__(self, inflight_max=INFLIGHT_MAX):
+        self.lock = threading.Lock()
+        self.sessions = {} # client id -> Session
+        self.inflight_max = inflight_max
+        self.published = 0 # PUBLISH packets received from devices
+        self.acked = 0 # PUBACKs received from subscribers
+        self.redelivered = 0 # QoS 1 messages resent with DUP after a reconnect
+
+    @property
+    def subscribers(self):
+        with self.lock:
+            return [s for s in self.sessions.values() if s.handler and s.subscriptions]
+
+    def inflight(self):
+        with self.lock:
+            return sum(len(s.inflight) for s in self.sessions.values())
+
+    def route(self, topic, payload, qos):
+        with self.lock:
+            for session in self.sessions.values():
+                granted = [q for f, q in session.subscriptions if topic_matches(f, topic)]
+                if not granted:
+                    continue
+                if min(qos, max(granted)):
+                    session.pending.append((topic, payload))
+                    self._fill(session)
+                elif session.handler:
+                    session.handler.deliver(topic, payload)
+
+    def _fill(self, session):
+        """Send pending QoS 1 messages while the in-flight window has room (lock held)."""
+        while session.handler and session.pending and len(session.inflight) < self.inflight_max:
+            topic, payload = session.pending.popleft()
+            session.next_id = session.next_id % 65535 + 1
+            session.inflight[session.next_id] = (topic, payload)
+            session.handler.deliver(topic, payload, session.next_id)
+
+    def connect(self, handler, client_id, clean):
+        with self.lock:
+            session = self.sessions.get(client_id)
+            if clean or session is None or session.clean:
+                session = self.sessions[client_id] = Session(client_id, clean)
+            session.handler = handler
+        return session
+
+    def resume(self, session):
+        """After CONNACK: resend unacknowledged messages (DUP), then continue the queue."""
+        with self.lock:
+            for pid, (topic, payload) in session.inflight.items():
+                session.handler.deliver(topic, payload, pid, dup=True)
+                self.redelivered += 1
+            self._fill(session)
+
+    def ack(self, session, pid):
+        with self.lock:
+            if session.inflight.pop(pid, None) is not None:
+                self.acked += 1
+            self._fill(session)
+
+    def disconnect(self, session, handler):
+        with self.lock:
+            if session and session.handler is handler:
+                session.handler = None
+                if session.clean:
+                    self.sessions.pop(session.client_id, None)
+
+class BrokerHandler(socketserver.StreamRequestHandler):
+    state = None
+
+    def send(self, data):
+        with self.write_lock:
+            self.wfile.write(data)
+
+    def handle(self):
+        self.write_lock = threading.Lock()
+        session = None
+        try:
+            while True:
+                header, body = read_packet(self.rfile)
+                if header is None:
+                    break
+                kind = header >> 4
+                if kind == 1: # CONNECT
+                    pos = 2 + struct.unpack("!H", body[:2])[0] + 1 # Protocol name, level
+                    clean = bool(body[pos] & 0x02)
+                    n = struct.unpack("!H", body[pos + 3:pos + 5])[0] # After flags and keepalive
+                    client_id = body[pos + 5:pos + 5 + n].decode()
+                    session = self.state.connect(self, client_id, clean)
+                    self.send(b"\x20\x02\x00\x00")
+                    self.state.resume(session)
+                elif kind == 8: # SUBSCRIBE
+                    pid, pos, granted = body[:2], 2, bytearray()
+                    while pos < len(body):
+                        n = struct.unpack("!H", body[pos:pos + 2])[0]
+                        topic = body[pos + 2:pos + 2 + n].decode()
+                        qos = body[pos + 2 + n]
+                        pos += 3 + n
+                        if topic.startswith("$share/"):
+                            topic = topic.split("/", 2)[2] # One subscriber here, so sharing is a no-op
+                        with self.state.lock:
+                            if (topic, qos) not in session.subscriptions:
+                                session.subscriptions.append((topic, qos))
+                        granted.append(qos)
+                    self.send(b"\x90" + encode_length(2 + len(granted)) + pid + bytes(granted))
+                elif kind == 3: # PUBLISH
+                    qos = (header >> 1) & 3
+                    n = struct.unpack("!H", body[:2])[0]
+                    topic = body[2:2 + n].decode()
+                    pos = 2 + n
+                    if qos:
+                        self.send(b"\x40\x02" + body[pos:pos + 2])
+                        pos += 2
+                    with self.state.lock:
+                        self.state.published += 1
+                    self.state.route(topic, body[pos:], qos)
+                elif kind == 4: # PUBACK from a subscriber
+                    self.state.ack(session, struct.unpack("!H", body[:2])[0])
+                elif kind == 12: # PINGREQ
+                    self.send(b"\xd0\x00")
+                elif kind == 14: # DISCONNECT
+                    break
+        except (OSError, IndexError):
+            pass
+        finally:
+            self.state.disconnect(session, self)
+
+    def deliver(self, topic, payload, pid=None, dup=False):
+        body = mqtt_string(topic)
+        header = 0x30
+        if pid is not None:
+            body += struct.pack("!H", pid)
+            header |= 0x02 | (0x08 if dup else 0)
+        try:
+            self.send(bytes([header]) + encode_length(len(body) + len(payload)) + body + payload)
+        except OSError:
+            pass
+
+class ThreadingBroker(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def start_broker():
+    BrokerHandler.state = BrokerState()
+    server = ThreadingBroker(("127.0.0.1", 0), BrokerHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, BrokerHandler.state
+
+# --- Devices: one persistent connection each, QoS 1 publishes ---
+class Device:
+    def __init__(self, host, port, client_id):
+        self.sock = socket.create_connection((host, port))
+        self.file = self.sock.makefile("rb")
+        body = mqtt_string("MQTT") + b"\x04\x02\x00\x3c" + mqtt_string(client_id)
+        self.sock.sendall(b"\x10" + encode_length(len(body)) + body)
+        read_packet(self.file) # CONNACK
+        self.pid = 0
+
+    def publish(self, topic, payload):
+        self.pid += 1
+        body = mqtt_string(topic) + struct.pack("!H", self.pid) + payload
+        self.sock.sendall(b"\x32" + encode_length(len(body)) + body)
+        read_packet(self.file) # PUBACK
+
+    def close(self):
+        try:
+            self.sock.sendall(b"\xe0\x00")
+        finally:
+            self.sock.close()
+
+def check(label, ok, detail=""):
+    print(f"{'✅' if ok else '❌'} {label} {detail}")
+    return ok
+
+def wait_for(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify the MQTT ingest bridge against a local broker")
+    parser.add_argument("--devices", type=int, default=200, help="Simulated device connections")
+    parser.add_argument("--messages", type=int, default=5, help="Readings per device")
+    parser.add_argument("--broker", metavar="HOST:PORT", help="Use a running broker instead of the built-in one")
+    args = parser.parse_args()
+
+    if bridge_module.mqtt is None:
+        print("❌ paho-mqtt is not installed (uv sync --extra mqtt).")
+        sys.exit(1)
+
+    state = None
+    if args.broker:
+        host, _, port = args.broker.rpartition(":")
+        host, port = host or "localhost", int(port)
+    else:
+        server, state = start_broker()
+        host, port = server.server_address
+
+    sensors = {f"key_{i:012x}": {"id": i + 1, "name": f"MQTT {i + 1}"} for i in range(args.devices)}
+    lookups = []
+    batches = []
+    failures = {"left": 0} # Publish calls still to fail (simulated Redis outage)
+
+    def resolve(token):
+        lookups.append(token)
+        return sensors.get(token)
+
+    def publish(updates):
+        if failures["left"]:
+            failures["left"] -= 1
+            raise ConnectionError("Redis unavailable (simulated)")
+        batches.append(updates)
+
+    client_id = f"verify-{os.getpid()}"
+
+    def start_bridge():
+        bridge = bridge_module.MqttBridge(host, port, resolve=resolve, publish=publish,
+                                          client_id=client_id, shared_group="verify")
+        bridge.start()
+        if not wait_for(lambda: state is None or state.subscribers, 10):
+            print("❌ Bridge did not subscribe.")
+            sys.exit(1)
+        time.sleep(0.5 if state is None else 0)
+        return bridge
+
+    bridge = start_bridge()
+    ok = True
+
+    # 1. Many persistent device connections publishing concurrently
+    devices = [Device(host, port, f"device-{i}") for i in range(args.devices)]
+    tokens = list(sensors)
+
+    def run(i):
+        for n in range(args.messages):
+            devices[i].publish(f"sensors/{tokens[i]}", json.dumps({"temperature": 20 + n, "humidity": 50}).encode())
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(args.devices)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    expected = args.devices * args.messages
+    delivered = lambda: sum(len(b) for b in batches)
+    wait_for(lambda: delivered() >= expected, 15)
+    elapsed = time.perf_counter() - start
+    ok &= check("all readings published", delivered() == expected,
+                f"({delivered()}/{expected} from {args.devices} connections in {elapsed:.2f}s)")
+    ok &= check("micro-batching", len(batches) < expected / 5,
+                f"({len(batches)} publish calls, {len(lookups)} token lookups for {expected} messages)")
+    ok &= check("reading shape", all({"sensor_id", "sensor_name", "temperature", "humidity", "timestamp"} <= set(u) for b in batches for u in b))
+
+    # 2. Buffered uploads, bad tokens and bad payloads
+    before = delivered()
+    devices[0].publish(f"sensors/{tokens[0]}", json.dumps({"readings": [
+        {"timestamp": int(time.time()) - 120, "temperature": 19.5, "humidity": 40},
+        {"timestamp": int(time.time()) - 60, "temperature": 19.7, "humidity": 41}
+    ]}).encode())
+    devices[0].publish("sensors/key_ffffffffffff", b'{"temperature": 1}')
+    devices[0].publish(f"sensors/{tokens[0]}", b"not json")
+    wait_for(lambda: bridge.stats["messages"] >= expected + 3, 5)
+    ok &= check("batch payload + rejections", delivered() - before == 2 and bridge.stats["messages"] == expected + 3,
+                f"({delivered() - before} readings from 3 messages)")
+    handled = expected + 3
+
+    # 3. A poison message (timestamp overflows datetime) is rejected alone, not the whole batch.
+    # Left unacknowledged it would hold an in-flight slot until the window (INFLIGHT_MAX) fills.
+    before = delivered()
+    devices[0].publish(f"sensors/{tokens[0]}", b'{"timestamp": 1e20, "temperature": 1}')
+    for n in range(2 * INFLIGHT_MAX):
+        devices[0].publish(f"sensors/{tokens[0]}", json.dumps({"temperature": n}).encode())
+    handled += 1 + 2 * INFLIGHT_MAX
+    wait_for(lambda: bridge.stats["messages"] >= handled, 5)
+    ok &= check("poison message", delivered() - before == 2 * INFLIGHT_MAX and bridge.stats["messages"] == handled,
+                f"({delivered() - before}/{2 * INFLIGHT_MAX} readings after it)")
+
+    # 4. A failing publish is retried with backoff, then acknowledged
+    before = delivered()
+    failures["left"] = 2
+    for n in range(5):
+        devices[1].publish(f"sensors/{tokens[1]}", json.dumps({"temperature": n}).encode())
+    handled += 5
+    wait_for(lambda: bridge.stats["messages"] >= handled, 10)
+    ok &= check("publish retried", delivered() - before == 5 and bridge.stats["retries"] >= 2,
+                f"({delivered() - before}/5 readings after {bridge.stats['retries']} retries)")
+
+    # 5. QoS 1 acks only after publishing
+    if state is not None:
+        wait_for(lambda: state.acked >= bridge.stats["messages"], 5)
+        ok &= check("acknowledged after publish", state.acked == bridge.stats["messages"],
+                    f"({state.acked} PUBACKs for {bridge.stats['messages']} messages)")
+
+    # 6. Bridge stops while Redis is down: the restarted bridge (same client id,
+    # persistent session) gets the unacknowledged messages again
+    before = delivered()
+    failures["left"] = 10 ** 9
+    retries = bridge.stats["retries"]
+    pending = 2 * INFLIGHT_MAX
+    for n in range(pending):
+        devices[2].publish(f"sensors/{tokens[2]}", json.dumps({"temperature": n}).encode())
+    wait_for(lambda: bridge.stats["retries"] > retries + 1, 5)
+    bridge.stop()
+    failures["left"] = 0
+    bridge = start_bridge()
+    wait_for(lambda: delivered() - before >= pending, 10)
+    redelivered = f", {state.redelivered} resent with DUP" if state is not None else ""
+    ok &= check("redelivered after restart", delivered() - before == pending and (state is None or state.redelivered > 0),
+                f"({delivered() - before}/{pending} readings{redelivered})")
+
+    for device in devices:
+        device.close()
+    bridge.stop()
+    print("✅ MQTT bridge verified." if ok else "❌ MQTT bridge checks failed.")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# Add parent dir to path to allow imports if run directly
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services.weather as weather
+
+# Checks services/weather.py against a local stub of the OpenWeather API
+# (no key, no network): concurrency, coordinate dedup, TTL cache, skipping
+# already published observations and 429 backoff.
+
+class StubState:
+    def __init__(self, latency):
+        self.latency = latency
+        self.requests = []
+        self.rate_limit = False
+        self.dt = 1700000000 # Observation time served by every location
+        self.lock = threading.Lock()
+
+class StubHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        with self.state.lock:
+            self.state.requests.append((query["lat"][0], query["lon"][0]))
+        time.sleep(self.state.latency)
+
+        if self.state.rate_limit:
+            self.send_response(429)
+            self.send_header("Retry-After", "60")
+            self.end_headers()
+            return
+
+        body = json.dumps({"dt": self.state.dt, "main": {"temp": 293.15, "humidity": 55}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_stub(latency):
+    StubHandler.state = StubState(latency)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, StubHandler.state
+
+def check(label, ok, detail=""):
+    print(f"{'✅' if ok else '❌'} {label} {detail}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify the OpenWeather fetcher against a local stub server")
+    parser.add_argument("--sensors", type=int, default=10, help="Distinct locations polled")
+    parser.add_argument("--latency", type=float, default=0.5, help="Stub response time in seconds")
+    args = parser.parse_args()
+
+    server, state = start_stub(args.latency)
+    weather.OPENWEATHER_URL = f"http://127.0.0.1:{server.server_address[1]}/data/2.5/weather"
+    weather.clear_cache()
+    ok = True
+
+    # 1. Distinct locations are fetched concurrently
+    sensors = [(i + 1, f"Weather {i + 1}", -0.18 - i, -78.47) for i in range(args.sensors)]
+    start = time.perf_counter()
+    updates, results = weather.fetch_weather(sensors, api_key="stub")
+    elapsed = time.perf_counter() - start
+    serial = args.sensors * args.latency
+    ok &= check("concurrent fetch", len(updates) == args.sensors and elapsed < serial / 2,
+                f"({len(updates)} sensors in {elapsed:.2f}s, serial would take {serial:.2f}s)")
+    ok &= check("values converted", abs(updates[0]["temperature"] - 20.0) < 1e-6 and updates[0]["humidity"] == 55)
+
+    # 2. Sensors sharing rounded coordinates -> one request
+    state.requests.clear()
+    shared = [(100, "A", 40.4168, -3.7038), (101, "B", 40.4171, -3.7041), (102, "C", 40.42, -3.70)]
+    updates, _ = weather.fetch_weather(shared, api_key="stub")
+    ok &= check("coordinate dedup", len(updates) == 3 and len(state.requests) == 1,
+                f"(3 sensors, {len(state.requests)} request)")
+
+    # 3. Fresh results come from the cache
+    state.requests.clear()
+    updates, _ = weather.fetch_weather(sensors + shared, api_key="stub")
+    ok &= check("TTL cache", len(updates) == len(sensors) + 3 and not state.requests,
+                f"({len(state.requests)} requests on the second poll)")
+
+    # 4. Observations already published are not returned again until OpenWeather refreshes them
+    weather.mark_published(updates)
+    updates, results = weather.fetch_weather(sensors + shared, api_key="stub")
+    unchanged = sum(r.get("status") == "unchanged" for r in results)
+    ok &= check("published observation skipped", not updates and unchanged == len(sensors) + 3,
+                f"({len(updates)} updates, {unchanged} unchanged)")
+    weather.clear_cache() # TTL expired, but the station has not refreshed yet
+    updates, _ = weather.fetch_weather(sensors, api_key="stub")
+    ok &= check("same observation after cache expiry skipped", not updates)
+    weather.clear_cache()
+    state.dt += 600
+    updates, _ = weather.fetch_weather(sensors, api_key="stub")
+    ok &= check("new observation published", len(updates) == len(sensors))
+
+    # 5. A 429 stops every further request until the backoff ends
+    weather.clear_cache()
+    state.requests.clear()
+    state.rate_limit = True
+    _, results = weather.fetch_weather(sensors, api_key="stub", max_workers=1)
+    first_round = len(state.requests)
+    _, results = weather.fetch_weather(sensors, api_key="stub")
+    ok &= check("429 backoff", first_round == 1 and len(state.requests) == 1 and all("error" in r for r in results),
+                f"({first_round} request before pausing, {len(state.requests) - first_round} after)")
+
+    server.shutdown()
+    print("✅ Weather fetcher verified." if ok else "❌ Weather fetcher checks failed.")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,19 @@
 # wsgi.py
 from manage import app
+from models.db import init_db
 from services.sensor_worker import start_sensor_worker
-from models.db import _db as db_client
+from services.binary_ingest import start_binary_listener
+from services.mqtt_bridge import start_mqtt_bridge
 
-# Verify that the DB is ready before starting the worker
-if db_client is not None:
-    # Start the worker HERE, because Gunicorn does not execute the main in manage.py
-    print("🚀 Starting Sensor Worker for Production...")
-    start_sensor_worker()
-else:
-    print("⚠️ WARNING: Database not connected at Gunicorn startup.")
+init_db()
+
+# Start the worker HERE, because Gunicorn does not execute the main in manage.py.
+# Every Gunicorn worker process calls this; the Redis leader election makes
+# exactly one of them persist and poll (the others stand by for failover).
+print("🚀 Starting Sensor Worker for Production...")
+start_sensor_worker()
+start_binary_listener() # Every worker binds the UDP port (SO_REUSEPORT) if BINARY_INGEST_PORT is set
+start_mqtt_bridge() # Every worker joins one shared subscription if MQTT_HOST is set
 
 # Expose the 'app' variable for Gunicorn to use
-application = app
\ No newline at end of file
+application = app